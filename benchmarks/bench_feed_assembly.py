@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full podgen serialization vs. cached <item> fragment assembly.
+
+Builds synthetic catalog rows (no audio files needed) and times:
+- podgen:      a whole Podcast with every Episode, then rss_str()
+- cold:        fragment assembly with an empty item cache
+- incremental: one new recording added to an already warm item cache
+
+Usage:
+    python benchmarks/bench_feed_assembly.py [--sizes 1000 10000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# feed.py reads its configuration at import time
+_tmp = tempfile.mkdtemp(prefix='radio-bench-')
+os.environ.setdefault('RECORDINGS_DIR', os.path.join(_tmp, 'recordings'))
+os.environ.setdefault('CACHE_DIR', os.path.join(_tmp, 'cache'))
+os.environ.setdefault('PROGRAM1', '07:40-08:00|ALL|program1|Program Name #1')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import feed
+
+BASE_URL = 'http://localhost:8013/radio/'
+PROGRAM_NAME = 'Program Name #1'
+PROGRAM_ID = 'program1'
+
+
+def synthetic_episodes(count, start=0):
+    """Catalog rows (name, size, mtime, duration), newest first."""
+    epoch = time.mktime((2020, 1, 1, 7, 40, 0, 0, 0, -1))
+    rows = []
+    for i in range(start, start + count):
+        mtime = epoch + i * 86400
+        name = time.strftime('%Y%m%d-0740-', time.localtime(mtime)) + f"{i:08x}.m4a"
+        rows.append((name, 20_000_000 + i, mtime, 1200.0))
+    rows.reverse()
+    return rows
+
+
+def podgen_path(episodes):
+    """The pre-fragment path: serialize every episode through podgen."""
+    p = feed._build_channel(PROGRAM_NAME, PROGRAM_ID, BASE_URL)
+    for row in episodes:
+        p.episodes.append(feed._build_episode(*row, PROGRAM_NAME, BASE_URL))
+    return p.rss_str()
+
+
+def fragment_path():
+    return feed._generate_podcast_feed_internal(PROGRAM_NAME, PROGRAM_ID, ['0740'])
+
+
+def best_of(repeat, func, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(count, repeat):
+    episodes = synthetic_episodes(count)
+    new_episode = synthetic_episodes(1, start=count)
+    current = {'rows': episodes}
+    feed._catalog.episodes = lambda program_id=None, limit=None, offset=0: current['rows']
+    feed._catalog.summary = lambda program_id=None: (
+        len(current['rows']), max(mtime for _, _, mtime, _ in current['rows']))
+    feed._item_cache = feed.LRUCache(maxsize=count * 2)
+
+    podgen_sec = best_of(repeat, lambda: podgen_path(episodes))
+
+    def cold_setup():
+        current['rows'] = episodes
+        feed._item_cache.clear()
+    cold_sec = best_of(repeat, fragment_path, cold_setup)
+
+    def incremental_setup():
+        current['rows'] = episodes
+        fragment_path()
+        for key in [k for k in feed._item_cache if k[0] == new_episode[0][0]]:
+            del feed._item_cache[key]
+        current['rows'] = new_episode + episodes
+    incremental_sec = best_of(repeat, fragment_path, incremental_setup)
+
+    return podgen_sec, cold_sec, incremental_sec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    feed.get_base_url = lambda: BASE_URL
+    # Silence per-feed log lines while timing
+    feed.print = lambda *a, **k: None
+
+    print(f"{'episodes':>10} {'podgen':>10} {'cold':>10} {'incremental':>12} {'speedup':>8}")
+    for count in args.sizes:
+        podgen_sec, cold_sec, incremental_sec = run(count, args.repeat)
+        print(f"{count:>10} {podgen_sec * 1000:>8.1f}ms {cold_sec * 1000:>8.1f}ms "
+              f"{incremental_sec * 1000:>10.1f}ms {podgen_sec / incremental_sec:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: feed service startup, from process start to a fast first feed.
+
+Starts src/feed.py against a synthetic archive and measures:
+- import:     importing feed.py (python -c "import feed", minus interpreter startup)
+- live:       process start until GET / answers (liveness)
+- ready:      process start until GET /ready answers 200 (readiness)
+- first_feed: latency of the first feed requests once ready (all + one program)
+
+Each WARMUP setting is run on a first deploy (empty catalog database) and on
+a restart (catalog kept in the cache volume).
+
+Usage:
+    python benchmarks/bench_startup.py [--episodes 5000] [--repeat 3] [--output startup.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+FEED_PY = os.path.join(SRC_DIR, 'feed.py')
+PROGRAMS = {
+    'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1',
+    'PROGRAM2': '20:00-20:20|ALL|program2|Program Name #2',
+}
+
+
+def make_archive(root, episodes):
+    recordings = os.path.join(root, 'recordings')
+    os.makedirs(recordings)
+    for i in range(episodes):
+        day = time.strftime('%Y%m%d', time.localtime(time.time() - (i // 2) * 86400))
+        start = '0740' if i % 2 == 0 else '2000'
+        with open(os.path.join(recordings, f"{day}-{start}-{i:08x}.m4a"), 'wb') as f:
+            f.write(b'\0' * 1024)
+    return recordings
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(port, path):
+    """Return the response status, or None if the server isn't listening yet."""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response.status
+    except OSError:
+        return None
+
+
+def import_time(repeat):
+    """Median seconds to import feed.py beyond bare interpreter startup."""
+    def median_run(code):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, env=dict(os.environ, **PROGRAMS),
+                           stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+    return median_run('import feed') - median_run('pass')
+
+
+def start(recordings, cache_dir, warmup):
+    """Start the service and time liveness, readiness and the first feeds."""
+    port = free_port()
+    env = dict(os.environ, **PROGRAMS,
+               SERVER_PORT=str(port), RECORDINGS_DIR=recordings, CACHE_DIR=cache_dir,
+               WARMUP='true' if warmup else 'false')
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, FEED_PY], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        result = {}
+        deadline = started + 120
+        while get(port, '/') != 200:
+            if time.perf_counter() > deadline or proc.poll() is not None:
+                raise RuntimeError("feed service did not start")
+            time.sleep(0.005)
+        result['live_ms'] = (time.perf_counter() - started) * 1000
+        while get(port, '/ready') != 200:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("feed service did not become ready")
+            time.sleep(0.005)
+        result['ready_ms'] = (time.perf_counter() - started) * 1000
+        for name, path in (('first_feed_ms', '/radio/feed.rss'), ('first_program_feed_ms', '/radio/program1/feed.rss')):
+            begin = time.perf_counter()
+            if get(port, path) != 200:
+                raise RuntimeError(f"{path} failed")
+            result[name] = (time.perf_counter() - begin) * 1000
+        return result
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--episodes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='radio-startup-')
+    try:
+        recordings = make_archive(root, args.episodes)
+        results = {'episodes': args.episodes, 'import_ms': import_time(args.repeat * 3) * 1000, 'runs': []}
+        print(f"import feed.py: {results['import_ms']:.1f}ms ({args.episodes} episodes in archive)")
+        print(f"{'warmup':>7} {'catalog':>8} {'live':>10} {'ready':>10} {'first feed':>12} {'program feed':>13}")
+
+        for warmup in (False, True):
+            for scenario in ('empty', 'kept'):
+                runs = []
+                for i in range(args.repeat):
+                    cache_dir = os.path.join(root, f"cache-{warmup}-{scenario}-{i}")
+                    if scenario == 'kept':
+                        # Fill the catalog with one run first, as a previous deployment would
+                        start(recordings, cache_dir, warmup=True)
+                    runs.append(start(recordings, cache_dir, warmup))
+                row = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                row.update(warmup=warmup, catalog=scenario)
+                results['runs'].append(row)
+                print(f"{str(warmup).lower():>7} {scenario:>8} {row['live_ms']:>8.0f}ms {row['ready_ms']:>8.0f}ms "
+                      f"{row['first_feed_ms']:>10.1f}ms {row['first_program_feed_ms']:>11.1f}ms")
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
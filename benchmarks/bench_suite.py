@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: feed generation and file serving on synthetic archives.
+
+For each archive size, writes that many small, correctly named .m4a files
+spread over several PROGRAMn entries and times:
+- cold:         first all-programs feed of a fresh process (scan + probe + generate)
+- rescan:       catalog sync with nothing changed (every cache miss with WATCH_MODE=off)
+- regenerate:   all-programs feed after an invalidation (catalog and <item> cache warm)
+- warm:         all-programs feed served from the feed cache
+- filter:       rebuilding the per-program catalog snapshot
+- program_feed: one program's feed after an invalidation, averaged over programs
+- serve_file:   full GETs of random recordings through the WSGI app
+
+Results are printed as a table and can be written as JSON. With --baseline,
+the run fails (exit 1) if any result is worse than the baseline by more than
+--tolerance, so hot path regressions are caught before deployment.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 1000 10000 100000] [--programs 6]
+                                     [--output results.json] [--baseline results.json]
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from wsgiref.util import setup_testing_defaults
+
+
+def program_slots(count):
+    """Program ids and start times, 90 minutes apart from 06:00."""
+    slots = []
+    for i in range(count):
+        minute = 6 * 60 + i * 90
+        slots.append((f"program{i + 1}", f"{minute // 60 % 24:02d}{minute % 60:02d}"))
+    return slots
+
+
+def configure_programs(count):
+    """Set PROGRAMn variables for the synthetic programs and reload them."""
+    for name in [name for name in os.environ if name.startswith('PROGRAM')]:
+        del os.environ[name]
+    for i, (program_id, start) in enumerate(program_slots(count), 1):
+        os.environ[f'PROGRAM{i}'] = f"{start[:2]}:{start[2:]}-{start[:2]}:{start[2:]}|ALL|{program_id}|Program #{i}"
+    feed.PROGRAMS = feed.parse_programs('')
+
+
+# feed.py reads its configuration at import time
+_tmp = tempfile.mkdtemp(prefix='radio-bench-')
+os.environ.setdefault('RECORDINGS_DIR', os.path.join(_tmp, 'recordings'))
+os.environ.setdefault('CACHE_DIR', os.path.join(_tmp, 'cache'))
+os.environ.setdefault('PROGRAM1', '06:00-07:00|ALL|program1|Program #1')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import feed
+
+BASE_URL = 'http://localhost:8013/radio/'
+
+# Results where a higher value is better; every other result is a duration
+HIGHER_IS_BETTER = {'serve_rps', 'serve_mib_s'}
+
+
+def make_archive(root, count, programs, file_bytes, layout):
+    """Write count recordings, one per program per day going back from 2025-12-31."""
+    recordings = os.path.join(root, 'recordings')
+    os.makedirs(recordings)
+    slots = program_slots(programs)
+    body = b'\0' * file_bytes
+    last_day = datetime.date(2025, 12, 31)
+    names = []
+    for i in range(count):
+        program_id, start = slots[i % programs]
+        day = last_day - datetime.timedelta(days=i // programs)
+        name = f"{day:%Y%m%d}-{start}-{i:08x}.m4a"
+        directory = recordings
+        if layout == 'sharded':
+            directory = os.path.join(recordings, f"{day:%Y}", f"{day:%m}")
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(body)
+        names.append(name)
+    return recordings, names
+
+
+def clear_feed_caches(items=False):
+    """Drop generated feeds, as an invalidation does."""
+    feed._feed_cache.clear()
+    feed._rendered_cache.clear()
+    if items:
+        feed._item_cache.clear()
+
+
+def best_of(repeat, func, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def all_feed(limit):
+    return feed.generate_podcast_feed_xml(limit=limit)
+
+
+def program_feed(program_id, limit):
+    info = feed.PROGRAMS[program_id]
+    return feed.generate_podcast_feed_xml(info['name'], program_id, info['schedule'], limit=limit)
+
+
+def serve(names, requests):
+    """Fetch random recordings through the WSGI app; returns (seconds, bytes)."""
+    rng = random.Random(0)
+    sent = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = f"/radio/{rng.choice(names)}"
+        environ['wsgi.errors'] = io.StringIO()
+        status = []
+        body = feed.app(environ, lambda s, h, e=None: status.append(s))
+        try:
+            for chunk in body:
+                sent += len(chunk)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        if not status[0].startswith('200'):
+            raise RuntimeError(f"serve_file returned {status[0]}")
+    return time.perf_counter() - start, sent
+
+
+def run(count, args):
+    root = tempfile.mkdtemp(prefix=f'radio-bench-{count}-', dir=_tmp)
+    try:
+        start = time.perf_counter()
+        recordings, names = make_archive(root, count, args.programs, args.file_bytes, args.layout)
+        result = {'episodes': count, 'create_s': time.perf_counter() - start}
+
+        # A fresh process: empty catalog database and caches, no watcher
+        feed.RECORDINGS_DIR = feed.Path(recordings)
+        feed._catalog = feed.EpisodeCatalog(os.path.join(root, 'catalog.db'), recordings)
+        feed._item_cache = feed.SizedLRUCache(maxsize=max(feed.ITEM_CACHE_BYTES, count * 8192))
+        feed._watcher_running = False
+        clear_feed_caches(items=True)
+        start = time.perf_counter()
+        all_feed(args.limit)
+        result['cold_ms'] = (time.perf_counter() - start) * 1000
+
+        result['rescan_ms'] = best_of(args.repeat, feed._catalog.sync) * 1000
+
+        # With the watcher running, a miss regenerates without rescanning
+        feed._watcher_running = True
+        result['regenerate_ms'] = best_of(args.repeat, lambda: all_feed(args.limit), clear_feed_caches) * 1000
+        result['regenerate_cold_items_ms'] = best_of(
+            args.repeat, lambda: all_feed(args.limit), lambda: clear_feed_caches(items=True)) * 1000
+
+        all_feed(args.limit)
+        calls = 1000
+        start = time.perf_counter()
+        for _ in range(calls):
+            all_feed(args.limit)
+        result['warm_us'] = (time.perf_counter() - start) / calls * 1e6
+
+        def rebuild_snapshot():
+            feed._catalog._snapshot = None
+            for program_id in feed.PROGRAMS:
+                feed._catalog.episodes(program_id, limit=args.limit or None)
+        result['filter_ms'] = best_of(args.repeat, rebuild_snapshot) * 1000
+
+        program_ids = list(feed.PROGRAMS)
+        result['program_feed_ms'] = sum(
+            best_of(args.repeat, lambda: program_feed(program_id, args.limit), clear_feed_caches)
+            for program_id in program_ids) / len(program_ids) * 1000
+
+        seconds, sent = serve(names, args.serve_requests)
+        result['serve_rps'] = args.serve_requests / seconds
+        result['serve_mib_s'] = sent / seconds / 1024 / 1024
+        return result
+    finally:
+        feed._watcher_running = False
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of results worse than the baseline by more than tolerance."""
+    previous = {row['episodes']: row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        base = previous.get(row['episodes'])
+        if base is None:
+            continue
+        for key, value in row.items():
+            if key in ('episodes', 'create_s') or not base.get(key):
+                continue
+            ratio = base[key] / value if key in HIGHER_IS_BETTER else value / base[key]
+            if ratio > tolerance:
+                regressions.append(f"{row['episodes']} episodes: {key} {base[key]:.3g} -> {value:.3g} ({ratio:.2f}x worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--programs', type=int, default=6, help='PROGRAMn entries to spread recordings over')
+    parser.add_argument('--limit', type=int, default=feed.FEED_LIMIT, help='feed page size (0 = whole archive)')
+    parser.add_argument('--layout', choices=['flat', 'sharded'], default='flat')
+    parser.add_argument('--file-bytes', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--serve-requests', type=int, default=500)
+    parser.add_argument('--output', help='write results as JSON to this file (- for stdout)')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown factor vs. baseline')
+    args = parser.parse_args()
+
+    feed.get_base_url = lambda: BASE_URL
+    # Silence per-feed log lines while timing
+    feed.print = lambda *a, **k: None
+    configure_programs(args.programs)
+    table = sys.stderr if args.output == '-' else sys.stdout
+
+    columns = ['episodes', 'cold_ms', 'rescan_ms', 'regenerate_ms', 'regenerate_cold_items_ms',
+               'warm_us', 'filter_ms', 'program_feed_ms', 'serve_rps', 'serve_mib_s']
+    print(' '.join(f"{column:>14}" for column in columns), file=table)
+    results = []
+    for count in args.sizes:
+        row = run(count, args)
+        results.append(row)
+        print(' '.join(f"{row[column]:>14.1f}" if isinstance(row[column], float) else f"{row[column]:>14}"
+                       for column in columns), file=table)
+
+    report = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'programs': args.programs,
+            'limit': args.limit,
+            'layout': args.layout,
+            'file_bytes': args.file_bytes,
+            'repeat': args.repeat,
+            'serve_requests': args.serve_requests,
+        },
+        'results': results,
+    }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
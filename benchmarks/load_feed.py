@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Load test: feed latency while slow clients download large audio files.
+
+For each server mode, starts src/feed.py against a synthetic archive, keeps
+several throttled downloads of a large .m4a running and polls feed.rss at
+the same time, then reports feed latency percentiles.
+
+Usage:
+    python benchmarks/load_feed.py [--servers wsgiref threaded gunicorn]
+                                   [--downloads 8] [--duration 10] [--file-mb 100]
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+FEED_PY = os.path.join(os.path.dirname(__file__), '..', 'src', 'feed.py')
+BIG_FILE = '20250101-0740-bigfile0.m4a'
+
+
+def make_archive(root, file_mb, episodes=200):
+    recordings = os.path.join(root, 'recordings')
+    os.makedirs(recordings)
+    for i in range(episodes):
+        day = time.strftime('%Y%m%d', time.localtime(time.time() - i * 86400))
+        with open(os.path.join(recordings, f"{day}-0740-{i:08x}.m4a"), 'wb') as f:
+            f.write(b'\0' * 1024)
+    with open(os.path.join(recordings, BIG_FILE), 'wb') as f:
+        f.truncate(file_mb * 1024 * 1024)
+    return recordings
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, root, recordings, port):
+    env = dict(os.environ,
+               SERVER=mode, SERVER_PORT=str(port),
+               RECORDINGS_DIR=recordings, CACHE_DIR=os.path.join(root, f'cache-{mode}'),
+               PROGRAM1='07:40-08:00|ALL|program1|Program Name #1')
+    proc = subprocess.Popen([sys.executable, FEED_PY], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/radio/feed.rss')
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def slow_download(port, stop):
+    """Read the large file at roughly 1 MB/s until stopped."""
+    try:
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        sock.sendall(f"GET /radio/{BIG_FILE} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        while not stop.is_set():
+            if not sock.recv(16384):
+                break
+            time.sleep(0.016)
+        sock.close()
+    except OSError:
+        pass
+
+
+def poll_feed(port, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', '/radio/program1/feed.rss')
+            conn.getresponse().read()
+            conn.close()
+        except OSError:
+            continue
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.05)
+
+
+def run(mode, root, recordings, downloads, duration):
+    port = free_port()
+    proc = start_server(mode, root, recordings, port)
+    stop = threading.Event()
+    latencies = []
+    try:
+        threads = [threading.Thread(target=slow_download, args=(port, stop)) for _ in range(downloads)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+        pollers = [threading.Thread(target=poll_feed, args=(port, stop, latencies)) for _ in range(4)]
+        for t in pollers:
+            t.start()
+        time.sleep(duration)
+        stop.set()
+        for t in threads + pollers:
+            t.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', nargs='+', default=['wsgiref', 'threaded', 'gunicorn'])
+    parser.add_argument('--downloads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--file-mb', type=int, default=100)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='radio-load-')
+    recordings = make_archive(root, args.file_mb)
+
+    print(f"{args.downloads} concurrent downloads of {args.file_mb} MB, {args.duration:.0f}s per server")
+    print(f"{'server':>10} {'polls':>6} {'p50':>10} {'p99':>10} {'max':>10}")
+    for mode in args.servers:
+        latencies = run(mode, root, recordings, args.downloads, args.duration)
+        if not latencies:
+            print(f"{mode:>10} {0:>6} {'(no feed response)':>32}")
+            continue
+        print(f"{mode:>10} {len(latencies):>6} "
+              f"{statistics.median(latencies) * 1000:>8.1f}ms "
+              f"{percentile(latencies, 99) * 1000:>8.1f}ms "
+              f"{max(latencies) * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
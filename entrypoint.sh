@@ -8,6 +8,13 @@ cd /app
 if [ $# -eq 0 ]; then
     echo "🤖 Running in auto-schedule mode..."
     python3 record.py
+elif [ "$1" = "daemon" ]; then
+    echo "🛰️  Running as a daemon (in-process scheduler)..."
+    # exec: the recorder receives docker stop's SIGTERM directly
+    exec python3 record.py --daemon
+elif [ "$1" = "prune" ]; then
+    echo "🧹 Applying retention policies..."
+    python3 record.py --prune "${@:2}"
 else
     echo "📝 Running in manual mode: $1 minutes"
     python3 record.py "$1"
@@ -5,16 +5,12 @@
 
 set -e
 
-LOCK_FILE="/tmp/radio-record.lock"
 # Look for .env in the parent directory of this script
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 ENV_FILE="${SCRIPT_DIR}/../.env"
 
-# Check if lock file exists (recording in progress)
-if [ -f "$LOCK_FILE" ]; then
-    echo "ℹ️  Recording in progress (lock file exists), skipping"
-    exit 0
-fi
+# No global lock check: a program starting while another is recorded must
+# still start. record.py keeps per-program locks in recordings/.locks/
 
 # Load environment variables
 if [ ! -f "$ENV_FILE" ]; then
@@ -20,6 +20,7 @@ fi
 # Create subdirectories for persistent data
 mkdir -p "${INSTALL_DIR}/recordings"
 mkdir -p "${INSTALL_DIR}/logo"
+mkdir -p "${INSTALL_DIR}/cache"
 mkdir -p "${SYSTEMD_USER_DIR}"
 
 # 2. Configuration setup
@@ -42,10 +43,6 @@ docker compose build
 # Pass UID/GID at runtime for interpolation
 USER_ID=$(id -u) GROUP_ID=$(id -g) docker compose up -d --force-recreate feed
 
-# Force invalidate feed cache by touching mutation file
-echo "♻️ Invalidating feed cache..."
-touch "${INSTALL_DIR}/recordings/.last_recording"
-
 # 4. Enable linger so services run without login
 echo "👤 Enabling linger for user ${USER}..."
 loginctl enable-linger "${USER}" || true
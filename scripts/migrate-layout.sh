@@ -0,0 +1,64 @@
+#!/bin/bash
+
+# Move recordings between the flat and the sharded (YYYY/MM/) layout.
+# Usage: migrate-layout.sh [recordings_dir] [sharded|flat]
+# Safe to run while the feed service is up; feed URLs do not change.
+
+TARGET_DIR="${1:-.}"
+LAYOUT="${2:-sharded}"
+
+if [ ! -d "$TARGET_DIR" ]; then
+    echo "Error: $TARGET_DIR is not a directory."
+    exit 1
+fi
+
+if [ "$LAYOUT" != "sharded" ] && [ "$LAYOUT" != "flat" ]; then
+    echo "Error: layout must be 'sharded' or 'flat'."
+    exit 1
+fi
+
+# Get absolute path for display
+ABS_PATH=$(cd "$TARGET_DIR" && pwd)
+echo "Migrating $ABS_PATH to $LAYOUT layout"
+
+moved=0
+
+if [ "$LAYOUT" = "sharded" ]; then
+    for file in "$TARGET_DIR"/*.m4a; do
+        [ -f "$file" ] || continue
+
+        filename=$(basename "$file")
+        date_part="${filename:0:8}"
+
+        # Only YYYYMMDD-prefixed recordings are sharded
+        if [[ "$date_part" =~ ^[0-9]{8}$ ]]; then
+            shard="$TARGET_DIR/${date_part:0:4}/${date_part:4:2}"
+            mkdir -p "$shard"
+            # -n: never overwrite an existing recording
+            if mv -n "$file" "$shard/" && [ ! -e "$file" ]; then
+                moved=$((moved + 1))
+                # Metadata sidecar (name.json) stays next to its recording
+                [ -f "${file%.m4a}.json" ] && mv -n "${file%.m4a}.json" "$shard/"
+            else
+                echo "⚠️ Skipped $filename (already exists in $shard)"
+            fi
+        fi
+    done
+else
+    for file in "$TARGET_DIR"/[0-9][0-9][0-9][0-9]/[0-9][0-9]/*.m4a; do
+        [ -f "$file" ] || continue
+
+        filename=$(basename "$file")
+        if mv -n "$file" "$TARGET_DIR/" && [ ! -e "$file" ]; then
+            moved=$((moved + 1))
+            [ -f "${file%.m4a}.json" ] && mv -n "${file%.m4a}.json" "$TARGET_DIR/"
+        else
+            echo "⚠️ Skipped $filename (already exists in $ABS_PATH)"
+        fi
+    done
+    # Remove shard directories left empty
+    find "$TARGET_DIR" -mindepth 1 -maxdepth 2 -type d -regex '.*/[0-9]+' -empty -delete 2>/dev/null
+    find "$TARGET_DIR" -mindepth 1 -maxdepth 1 -type d -regex '.*/[0-9]+' -empty -delete 2>/dev/null
+fi
+
+echo "✅ Moved $moved recordings"
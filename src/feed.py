@@ -2,11 +2,46 @@
 
 import os
 import re
+import csv
+import email.utils
+import gzip
+import hashlib
+import json
+import math
 import time
+import ctypes
+import ctypes.util
+import stat
+import struct
+import sqlite3
+import sys
+import datetime
+import threading
+import warnings
 from pathlib import Path
-from bottle import Bottle, static_file, response, request, abort
-from podgen import Podcast, Episode, Media, Category, Person
-from cachetools import TTLCache
+from urllib.parse import urlencode
+from xml.sax.saxutils import escape, quoteattr
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from wsgiref.simple_server import WSGIServer
+from bottle import Bottle, static_file, response, request, abort, parse_date, HTTPError, HTTPResponse
+from bottle import ServerAdapter, WSGIRefServer
+from cachetools import TTLCache, LRUCache
+
+# Shared with record.py
+import program_match
+from program_match import TOLERANCE_MIN
+# podgen (which pulls in requests), lxml and tinytag are imported on first use,
+# so the server starts listening before they are loaded
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # ======================================================================
 # Configuration
@@ -19,9 +54,35 @@ SECRETS = [s.strip() for s in _SECRET_ENV.split(',') if s.strip()]
 PROGRAMS_CONFIG = os.getenv('PROGRAMS', '')
 ROUTE_PREFIX = os.getenv('ROUTE_PREFIX', '/radio')
 CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))  # Default 1 hour
-CACHE_INVALIDATION_FILE = RECORDINGS_DIR / '.last_recording'
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # Memory for generated feeds (episode items + templates + encoded responses)
 LOGO_DIR = Path('/app/logo')
+# Writable directory for service state (the recordings volume is mounted read-only)
+CACHE_DIR = Path(os.getenv('CACHE_DIR', '/app/cache'))
+CATALOG_DB = Path(os.getenv('CATALOG_DB', str(CACHE_DIR / 'catalog.db')))
 FORCE_HTTPS = os.getenv('FORCE_HTTPS', 'false').lower() == 'true'
+# Filesystem watcher: auto (inotify, else polling), inotify, poll or off
+WATCH_MODE = os.getenv('WATCH_MODE', 'auto').lower()
+WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL', '10'))  # Polling interval in seconds
+PREWARM_DELAY = float(os.getenv('PREWARM_DELAY', '2'))  # Seconds for a burst of file events to settle
+WARMUP = os.getenv('WARMUP', 'true').lower() == 'true'  # Build catalog and subscription feeds before reporting ready
+# Generated feed store: memory (per process) or shared (SQLite in CACHE_DIR, for all workers and restarts)
+FEED_CACHE = os.getenv('FEED_CACHE', 'memory').lower()
+FEED_CACHE_DB = Path(os.getenv('FEED_CACHE_DB', str(CACHE_DIR / 'feeds.db')))
+# HTTP server: threaded (built-in thread pool), gunicorn (pre-forked workers, keep-alive) or wsgiref
+SERVER = os.getenv('SERVER', 'threaded').lower()
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '16'))  # Concurrent requests per process
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '1'))  # gunicorn worker processes
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', '128'))  # Connections queued while all threads are busy
+SERVER_MAX_CONNECTIONS = int(os.getenv('SERVER_MAX_CONNECTIONS', '200'))  # gunicorn open connections per worker
+KEEPALIVE = int(os.getenv('KEEPALIVE', '5'))  # gunicorn idle keep-alive seconds
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '9'))  # 0-11, paid once per generated feed
+FEED_LIMIT = int(os.getenv('FEED_LIMIT', '100'))  # Episodes per feed page (0 = no paging)
+FEED_MAX_LIMIT = int(os.getenv('FEED_MAX_LIMIT', '1000'))  # Upper bound for ?limit=
+RECORDING_IDLE_SECONDS = int(os.getenv('RECORDING_IDLE_SECONDS', '120'))  # Unmodified this long = finished, cached as immutable
+VARIANTS_DIR = Path(os.getenv('VARIANTS_DIR', str(CACHE_DIR / 'variants')))
+VARIANT_MAX_BYTES = int(os.getenv('VARIANT_MAX_BYTES', str(1024 * 1024 * 1024)))  # Disk space for ?variant= files, least recently used evicted
+VARIANT_LOW_BITRATE = os.getenv('VARIANT_LOW_BITRATE', '48k')  # AAC bitrate of ?variant=low (mono)
+VARIANT_JOBS = int(os.getenv('VARIANT_JOBS', '2'))  # Concurrent ffmpeg transcodes per process
 
 app = Bottle()
 
@@ -37,6 +98,8 @@ def parse_programs(config_str):
     Example:
         PROGRAM1=07:40-08:00|MON-FRI|program1|Program Name #1|https://example.com/stream1.m3u8
         PROGRAM2=08:00-08:20|SAT,SUN|program2|Program Name #2|https://example.com/stream2.m3u8
+    
+    An optional PROGRAMn_LIMIT sets the program's feed page size (default FEED_LIMIT).
     """
     programs = {}
     weekdays = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN', 'ALL', 'EVERY']
@@ -53,7 +116,7 @@ def parse_programs(config_str):
             continue
             
         program_schedule = parts[0]
-        # program_days = parts[1] # Not strictly needed for feed filtering yet
+        program_days = parts[1]
         program_id = parts[2]
         program_name = parts[3]
             
@@ -66,8 +129,13 @@ def parse_programs(config_str):
             if start:
                 programs[program_id] = {
                     'name': program_name,
-                    'schedule': [start]
+                    'schedule': [start],
+                    'days': program_days,
+                    'limit': FEED_LIMIT
                 }
+                limit = os.getenv(f'PROGRAM{i}_LIMIT', '').strip()
+                if limit.isdigit():
+                    programs[program_id]['limit'] = int(limit)
     
     if programs:
         print(f"📋 Loaded {len(programs)} programs from environment variables")
@@ -110,55 +178,62 @@ def extract_time_from_filename(filename):
         return match.group(1)
     return None
 
-def matches_schedule(file_time, schedule, tolerance_min=5):
+def build_program_table(programs, tolerance_min=TOLERANCE_MIN):
     """
-    Check if file time matches any schedule time within tolerance.
+    Map every minute of the week to the program recorded at that time.
     
-    Args:
-        file_time: HHMM string from filename
-        schedule: List of HHMM strings
-        tolerance_min: Minutes of tolerance (default 5)
+    Each minute goes to the program with the nearest start among those
+    scheduled that day (see program_match.build_program_table(), which
+    record.py's retention uses too), so a recording is resolved with a
+    single list lookup. Programs without 'days' count as every day.
     
     Returns:
-        True if file_time matches any schedule time within tolerance
+        List of program ids indexed by program_match.week_minute()
+        (None where no program matches)
+    """
+    starts = [(program_id, start, info.get('days')) for program_id, info in programs.items()
+              for start in info['schedule']]
+    return program_match.build_program_table(starts, tolerance_min)
+
+# (programs dict, week minute table), rebuilt when a different programs dict is used
+_program_table = (None, None)
+
+def filename_minute(filename):
     """
-    if not file_time or not schedule:
-        return False
+    Minute of day from a YYYYMMDD-HHMM-* or YYYYMMDD HHMM * filename, or None.
     
-    try:
-        file_hour = int(file_time[:2])
-        file_min = int(file_time[2:])
-        file_total_min = file_hour * 60 + file_min
-        
-        for sched_time in schedule:
-            sched_hour = int(sched_time[:2])
-            sched_min = int(sched_time[2:])
-            sched_total_min = sched_hour * 60 + sched_min
-            
-            diff = abs(file_total_min - sched_total_min)
-            if diff <= tolerance_min:
-                return True
-        
-        return False
-    except (ValueError, IndexError):
-        return False
+    Same format as extract_time_from_filename(), without the regex.
+    """
+    if len(filename) < 13 or filename[8] not in '- ':
+        return None
+    date, hhmm = filename[:8], filename[9:13]
+    if not (date.isdecimal() and hhmm.isdecimal()):
+        return None
+    return int(hhmm[:2]) * 60 + int(hhmm[2:])
 
-def filter_files_by_program(files, schedule, program_id="unknown"):
-    """Filter files by program schedule."""
-    if schedule is None:
-        return files
+def match_program(filename, programs=None):
+    """
+    Return the id of the program whose scheduled start is nearest the filename
+    time, among the programs scheduled on the filename's weekday.
+    
+    Returns None if the filename has no date and time or no program matches.
+    """
+    global _program_table
+    if programs is None:
+        programs = PROGRAMS
     
-    filtered = []
-    print(f"🔍 Filtering {len(files)} files for program '{program_id}' with schedule {schedule}")
-    for f in files:
-        file_time = extract_time_from_filename(f.name)
-        if file_time and matches_schedule(file_time, schedule):
-            filtered.append(f)
-        # else:
-        #    print(f"   - Skipping {f.name} (time {file_time} doesn't match)")
+    minute = filename_minute(filename)
+    if minute is None or minute >= 1440:
+        return None
+    minute = program_match.week_minute(filename[:8], minute)
+    if minute is None:
+        return None
     
-    print(f"✅ Found {len(filtered)} matching files for '{program_id}'")
-    return filtered
+    cached_programs, table = _program_table
+    if cached_programs is not programs:
+        table = build_program_table(programs)
+        _program_table = (programs, table)
+    return table[minute]
 
 # ======================================================================
 # Utility Functions
@@ -190,43 +265,570 @@ def get_base_url():
     return base_url
 
 # ======================================================================
-# Feed Generation and Caching
+# Episode Catalog
 # ======================================================================
 
-# Cache for podcast feeds: key=(program_id, schedule_tuple, base_url), value=rss_string
-_feed_cache = TTLCache(maxsize=100, ttl=CACHE_TTL)
-_last_invalidation_time = 0
+def read_sidecar(path):
+    """Metadata record.py writes next to a recording (name.json), or None."""
+    try:
+        with open(path.with_suffix('.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-def get_last_recording_time():
-    """Get timestamp of last recording from invalidation file."""
+def probe_duration(path, size=None):
+    """
+    Read audio duration in seconds, or None if unreadable.
+    
+    The duration is taken from the recording's sidecar when it describes
+    this file (same size); other files are probed with tinytag.
+    """
+    sidecar = read_sidecar(path)
+    if isinstance(sidecar, dict) and sidecar.get('duration') and sidecar.get('size') == size:
+        return float(sidecar['duration'])
     try:
-        if CACHE_INVALIDATION_FILE.exists():
-            return CACHE_INVALIDATION_FILE.stat().st_mtime
-    except Exception as e:
-        print(f"WARNING: Failed to read cache invalidation file: {e}")
-    return 0
-
-def should_invalidate_cache():
-    """Check if cache should be invalidated based on new recordings."""
-    global _last_invalidation_time
-    
-    current_mtime = get_last_recording_time()
-    # Initialize timestamp on first run without clearing cache
-    if _last_invalidation_time == 0:
-        _last_invalidation_time = current_mtime
-        return False
+        from tinytag import TinyTag
+        return TinyTag.get(str(path)).duration
+    except Exception:
+        return None
+
+def shard_dir(filename):
+    """
+    Directory of a recording in the sharded layout.
+    
+    Example: 20251222-0740-5f3a2b1c.m4a -> 2025/12
+    
+    Returns:
+        Relative 'YYYY/MM' path, or None if the filename has no date
+    """
+    if len(filename) < 8 or not filename[:8].isdecimal():
+        return None
+    return f"{filename[:4]}/{filename[4:6]}"
+
+def locate_recording(directory, filename):
+    """
+    Find a recording in the flat or the sharded (YYYY/MM/) layout.
+    
+    Returns:
+        Path relative to directory ('name' or 'YYYY/MM/name'), or None if missing
+    """
+    directory = Path(directory)
+    if (directory / filename).is_file():
+        return filename
+    shard = shard_dir(filename)
+    if shard and (directory / shard / filename).is_file():
+        return f"{shard}/{filename}"
+    return None
+
+def _scan_dirs(directory, digits):
+    """List subdirectories named with exactly the given number of digits."""
+    try:
+        with os.scandir(directory) as it:
+            return [
+                entry for entry in it
+                if len(entry.name) == digits and entry.name.isdecimal() and entry.is_dir()
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+def list_shards(directory):
+    """
+    List the YYYY/MM shard directories of the sharded layout, oldest first.
+    
+    Returns:
+        List of (relative 'YYYY/MM', directory mtime_ns) tuples
+    """
+    shards = []
+    for year in _scan_dirs(directory, 4):
+        for month in _scan_dirs(year.path, 2):
+            try:
+                shards.append((f"{year.name}/{month.name}", month.stat().st_mtime_ns))
+            except FileNotFoundError:
+                continue
+    return sorted(shards)
+
+def scan_recordings(directory):
+    """
+    List .m4a recordings in a single pass over a directory.
+    
+    Returns:
+        Dict of filename to stat result (from the scandir entry)
+    """
+    recordings = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                # Same selection as glob('*.m4a'): hidden files are skipped
+                if not entry.name.endswith('.m4a') or entry.name.startswith('.'):
+                    continue
+                try:
+                    recordings[entry.name] = entry.stat()
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return recordings
+
+class EpisodeCatalog:
+    """
+    Persistent index of recorded episodes backed by SQLite.
+    
+    Stores name, size, mtime, duration, matched program and directory for
+    every .m4a in the recordings directory (flat or in YYYY/MM/ shards), so
+    feeds are built without touching the audio files. sync() only probes
+    files whose size or mtime changed, and only lists shards whose
+    directory mtime changed.
+    
+    Reads are served from an in-memory snapshot holding every episode
+    bucketed by program, loaded with one query after each change and
+    shared by all feeds.
+    """
+    
+    def __init__(self, db_path, recordings_dir):
+        self.db_path = Path(db_path)
+        self.recordings_dir = Path(recordings_dir)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._snapshot = None
+        # Database version the snapshot was read at; other processes' commits change it
+        self._snapshot_version = None
+        # (snapshot, per-program totals) computed from that snapshot
+        self._totals = None
+    
+    def _connect(self):
+        """Open the database on first use, falling back to memory if unwritable."""
+        if self._conn is not None:
+            return self._conn
         
-    if current_mtime > _last_invalidation_time:
-        _last_invalidation_time = current_mtime
-        return True
-    return False
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+        except (sqlite3.Error, OSError) as e:
+            print(f"WARNING: Catalog database {self.db_path} unavailable ({e}), using in-memory catalog")
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
+        
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS episodes ('
+            'name TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, '
+            "duration REAL, program_id TEXT, dir TEXT NOT NULL DEFAULT '')"
+        )
+        # Catalogs created before the sharded layout have no dir column
+        if 'dir' not in [row[1] for row in conn.execute('PRAGMA table_info(episodes)')]:
+            conn.execute("ALTER TABLE episodes ADD COLUMN dir TEXT NOT NULL DEFAULT ''")
+        conn.execute('CREATE INDEX IF NOT EXISTS episodes_program ON episodes (program_id, name)')
+        # Shard directory mtimes as of their last listing
+        conn.execute('CREATE TABLE IF NOT EXISTS dirs (dir TEXT PRIMARY KEY, mtime_ns INTEGER)')
+        self._conn = conn
+        return conn
+    
+    def sync(self):
+        """
+        Bring the catalog up to date with the recordings directory.
+        
+        Returns:
+            Tuple of (probed, removed) file counts
+        """
+        with self._lock:
+            conn = self._connect()
+            known = {
+                name: (size, mtime, program_id, directory)
+                for name, size, mtime, program_id, directory
+                in conn.execute('SELECT name, size, mtime, program_id, dir FROM episodes')
+            }
+            dir_mtimes = dict(conn.execute('SELECT dir, mtime_ns FROM dirs'))
+            
+            # Filename -> (stat, directory); a flat file wins over a shard copy
+            seen = {name: (st, '') for name, st in scan_recordings(self.recordings_dir).items()}
+            shards = list_shards(self.recordings_dir)
+            skipped = set()
+            listed = []
+            for i, (shard, mtime_ns) in enumerate(shards):
+                # Files growing in place don't touch the directory mtime, so the
+                # two newest shards (where recordings are written) are always listed
+                if dir_mtimes.get(shard) == mtime_ns and i < len(shards) - 2:
+                    skipped.add(shard)
+                    continue
+                for name, st in scan_recordings(self.recordings_dir / shard).items():
+                    seen.setdefault(name, (st, shard))
+                listed.append((shard, mtime_ns))
+            
+            probed = []
+            reassigned = []
+            for name, (st, directory) in seen.items():
+                program_id = match_program(name)
+                row = known.get(name)
+                if row is None or row[0] != st.st_size or row[1] != st.st_mtime:
+                    probed.append((name, st.st_size, st.st_mtime,
+                                   probe_duration(self.recordings_dir / directory / name, st.st_size),
+                                   program_id, directory))
+                elif row[2] != program_id or row[3] != directory:
+                    # Program configuration changed or the file moved between layouts
+                    reassigned.append((program_id, directory, name))
+            
+            removed = [
+                (name,) for name, row in known.items()
+                if name not in seen and row[3] not in skipped
+            ]
+            
+            # Directories modified just now may change again within the same
+            # mtime tick, so they are listed again next time
+            settled = time.time_ns() - 2 * 10**9
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO episodes (name, size, mtime, duration, program_id, dir) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', probed)
+                conn.executemany('UPDATE episodes SET program_id = ?, dir = ? WHERE name = ?', reassigned)
+                conn.executemany('DELETE FROM episodes WHERE name = ?', removed)
+                conn.executemany('INSERT OR REPLACE INTO dirs VALUES (?, ?)', [
+                    (shard, mtime_ns if mtime_ns < settled else None) for shard, mtime_ns in listed
+                ])
+                conn.executemany('DELETE FROM dirs WHERE dir = ?', [
+                    (shard,) for shard in dir_mtimes.keys() - {shard for shard, _ in shards}
+                ])
+            
+            if probed or reassigned or removed:
+                self._snapshot = None
+            if probed or removed:
+                print(f"🗂️ Catalog synced: {len(probed)} probed, {len(removed)} removed, "
+                      f"{len(seen)} listed, {len(skipped)} unchanged shards skipped")
+            return len(probed), len(removed)
 
-def _generate_podcast_feed_internal(program_name=None, program_id=None, schedule=None):
-    """Internal function to generate RSS feed from .m4a files in recordings directory."""
-    p = Podcast()
+    def update(self, names):
+        """
+        Refresh only the given recordings (e.g. from filesystem events).
+
+        Returns:
+            Tuple of (probed, removed) file counts
+        """
+        with self._lock:
+            conn = self._connect()
+            probed = []
+            moved = []
+            removed = []
+            for name in names:
+                path = locate_recording(self.recordings_dir, name)
+                try:
+                    st = (self.recordings_dir / path).stat()
+                except (TypeError, FileNotFoundError):
+                    removed.append((name,))
+                    continue
+                directory = path[:-len(name)].rstrip('/')
+
+                row = conn.execute(
+                    'SELECT size, mtime, dir FROM episodes WHERE name = ?', (name,)).fetchone()
+                if row is None or row[:2] != (st.st_size, st.st_mtime):
+                    probed.append((name, st.st_size, st.st_mtime, probe_duration(self.recordings_dir / path, st.st_size),
+                                   match_program(name), directory))
+                elif row[2] != directory:
+                    moved.append((directory, name))
+
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO episodes (name, size, mtime, duration, program_id, dir) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', probed)
+                conn.executemany('UPDATE episodes SET dir = ? WHERE name = ?', moved)
+                conn.executemany('DELETE FROM episodes WHERE name = ?', removed)
+
+            if moved:
+                self._snapshot = None
+            if probed or removed:
+                self._snapshot = None
+                print(f"🗂️ Catalog updated: {len(probed)} probed, {len(removed)} removed")
+            return len(probed), len(removed)
+
+    def episodes(self, program_id=None, limit=None, offset=0):
+        """
+        List catalogued episodes, newest first.
+        
+        Args:
+            program_id: Only return episodes matched to this program (None for all)
+            limit: Maximum number of episodes to return (None for all)
+            offset: Number of newest episodes to skip
+        
+        Returns:
+            List of (name, size, mtime, duration) tuples
+        """
+        rows, _ = self._bucket(program_id)
+        return rows[offset:] if limit is None else rows[offset:offset + limit]
     
-    # Get dynamic base URL from request
-    web_base_url = get_base_url()
+    def summary(self, program_id=None):
+        """
+        Count catalogued episodes and find the newest modification time.
+        
+        Returns:
+            Tuple of (episode count, newest mtime or None)
+        """
+        rows, newest_mtime = self._bucket(program_id)
+        return len(rows), newest_mtime
+    
+    def totals(self):
+        """
+        Count episodes and their bytes per program, once per catalog snapshot.
+        
+        Returns:
+            Dict of program_id to (episode count, total bytes); key None covers all episodes
+        """
+        with self._lock:
+            snapshot = self._current_snapshot()
+            if self._totals is not None and self._totals[0] is snapshot:
+                return self._totals[1]
+        totals = {
+            program_id: (len(rows), sum(row[1] for row in rows))
+            for program_id, (rows, _) in snapshot.items()
+        }
+        with self._lock:
+            self._totals = (snapshot, totals)
+        return totals
+    
+    def _bucket(self, program_id):
+        """Return (rows newest first, newest mtime) for a program, or all episodes for None."""
+        with self._lock:
+            snapshot = self._current_snapshot()
+        # Snapshots are replaced, never modified, so they can be read unlocked
+        return snapshot.get(program_id, ([], None)) if program_id is not None else snapshot[None]
+    
+    def _current_snapshot(self):
+        """
+        Return the snapshot, reloading it after changes (call with the lock held).
+        
+        Other feed workers sharing the database may have synced changes this
+        process then sees as already catalogued, so their commits count too.
+        """
+        version = self._connect().execute('PRAGMA data_version').fetchone()[0]
+        if self._snapshot is None or version != self._snapshot_version:
+            self._snapshot = self._load_snapshot()
+            self._snapshot_version = version
+        return self._snapshot
+    
+    def _load_snapshot(self):
+        """
+        Read every episode in one query and bucket it by program.
+        
+        Returns:
+            Dict of program_id to (rows, newest mtime); key None holds all episodes
+        """
+        all_rows = []
+        buckets = {}
+        newest = {}
+        for name, size, mtime, duration, program_id in self._connect().execute(
+                'SELECT name, size, mtime, duration, program_id FROM episodes ORDER BY name DESC'):
+            row = (name, size, mtime, duration)
+            all_rows.append(row)
+            if program_id is not None:
+                buckets.setdefault(program_id, []).append(row)
+                newest[program_id] = max(newest.get(program_id, mtime), mtime)
+        
+        snapshot = {program_id: (rows, newest[program_id]) for program_id, rows in buckets.items()}
+        snapshot[None] = (all_rows, max((row[2] for row in all_rows), default=None))
+        return snapshot
+
+_catalog = EpisodeCatalog(CATALOG_DB, RECORDINGS_DIR)
+
+# ======================================================================
+# Feed Generation and Caching
+# ======================================================================
+
+class SizedCacheMixin:
+    """
+    Byte accounting for cachetools caches whose maxsize is a size in bytes.
+    
+    Least recently used entries are evicted until a new entry fits, and the
+    evictions are counted. An entry larger than the whole cache is not stored
+    (and counted as rejected) instead of raising ValueError.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, getsizeof=cache_value_size, **kwargs)
+        self.evictions = 0
+        self.rejected = 0
+    
+    def __setitem__(self, key, value):
+        if self.getsizeof(value) > self.maxsize:
+            self.rejected += 1
+            self.pop(key, None)
+            return
+        super().__setitem__(key, value)
+    
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+    
+    def usage(self):
+        """Current resident size, limit, entry and eviction counts."""
+        return {
+            'bytes': self.currsize,
+            'max_bytes': self.maxsize,
+            'entries': len(self),
+            'evictions': self.evictions,
+            'rejected': self.rejected,
+        }
+
+class SizedTTLCache(SizedCacheMixin, TTLCache):
+    """TTLCache bounded by bytes instead of entries."""
+
+class SizedLRUCache(SizedCacheMixin, LRUCache):
+    """LRUCache bounded by bytes instead of entries."""
+
+def cache_value_size(value):
+    """Approximate memory held by a feed template or encoded feed entry."""
+    if not isinstance(value, dict):
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(
+        sys.getsizeof(v) for v in value.values() if isinstance(v, (str, bytes)))
+
+# Cache for podcast feed templates: key=(program_id, schedule_tuple, page, limit, link_query),
+# value=template dict (see generate_podcast_feed_xml). Templates use FEED_BASE_PLACEHOLDER
+# instead of the request's base URL, so every host and scheme shares one generated feed.
+# CACHE_MAX_BYTES is split: a quarter for serialized episode items (see _item_cache), a
+# quarter for templates, and the rest for encoded responses, since each template is
+# typically encoded for one or two base URLs at about 1.2x its size with the compressed variants.
+ITEM_CACHE_BYTES = CACHE_MAX_BYTES // 4
+TEMPLATE_CACHE_BYTES = CACHE_MAX_BYTES // 4
+_feed_cache = SizedTTLCache(maxsize=max(1, TEMPLATE_CACHE_BYTES), ttl=CACHE_TTL)
+# Encoded responses: key=(template digest, base_url), value=entry dict (see build_feed_entry)
+_rendered_cache = SizedLRUCache(maxsize=max(1, CACHE_MAX_BYTES - ITEM_CACHE_BYTES - TEMPLATE_CACHE_BYTES))
+class SharedFeedCache:
+    """
+    Feed templates stored in SQLite, shared by every feed worker and kept across restarts.
+    
+    Each template is stored with a fingerprint of what it was generated from
+    (catalog contents, program configuration, logo and feed.py itself) and is
+    only returned for a matching fingerprint. A worker whose catalog has
+    moved on, or a process started after recordings changed, never gets a
+    stale feed; it generates and stores the new one instead.
+    """
+    
+    # Entries unused for this long are dropped (e.g. pages requested with odd ?limit= values)
+    MAX_AGE = 7 * 86400
+    
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disabled = False
+    
+    def _connect(self):
+        """Open the database on first use; None if it can't be used."""
+        if self._conn is not None or self._disabled:
+            return self._conn
+        
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Workers write rarely and briefly, so waiting out a lock is enough
+            conn = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS feeds ('
+                'key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, rss_xml TEXT NOT NULL, '
+                'digest TEXT NOT NULL, last_modified REAL, created REAL NOT NULL)'
+            )
+        except (sqlite3.Error, OSError) as e:
+            print(f"WARNING: Shared feed cache {self.db_path} unavailable ({e}), feeds are cached per process")
+            self._disabled = True
+            return None
+        self._conn = conn
+        return conn
+    
+    def get(self, key, fingerprint):
+        """Return the stored template for a feed cache key, or None if missing or stale."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    'SELECT rss_xml, digest, last_modified FROM feeds WHERE key = ? AND fingerprint = ?',
+                    (repr(key), fingerprint)).fetchone()
+            except sqlite3.Error as e:
+                print(f"WARNING: Shared feed cache read failed: {e}")
+                return None
+        if row is None:
+            return None
+        return {'rss_xml': row[0], 'digest': row[1], 'last_modified': row[2]}
+    
+    def put(self, key, fingerprint, template):
+        """Store a generated template for every worker."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            now = time.time()
+            try:
+                with conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?, ?, ?)',
+                        (repr(key), fingerprint, template['rss_xml'], template['digest'],
+                         template['last_modified'], now))
+                    conn.execute('DELETE FROM feeds WHERE created < ?', (now - self.MAX_AGE,))
+            except sqlite3.Error as e:
+                print(f"WARNING: Shared feed cache write failed: {e}")
+
+_shared_cache = SharedFeedCache(FEED_CACHE_DB) if FEED_CACHE == 'shared' else None
+
+# Changes whenever feed.py changes, so feeds stored by an older version are not reused
+_CODE_VERSION = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+
+def feed_fingerprint(program_id, program_name):
+    """Identify everything a feed template is generated from, for the shared cache."""
+    count, size = _catalog.totals().get(program_id, (0, 0))
+    newest = _catalog.summary(program_id)[1]
+    live = [marker['name'] for marker in live_recordings(program_id)]
+    state = (_CODE_VERSION, sorted((k, repr(v)) for k, v in PROGRAMS.items()),
+             os.getenv('PROGRAM_NAME'), program_name, find_logo(program_id), count, size, newest, live)
+    return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+
+# Guards the feed, item and logo caches shared by server and watcher threads
+_cache_lock = threading.RLock()
+# Bumped on every invalidation so a feed generated from stale data is not stored
+_cache_generation = 0
+
+# Per-program logo filename, looked up once and dropped on LOGO_DIR events
+_logo_cache = {}
+
+def find_logo(program_id):
+    """Return the logo filename for a program: alias.png, alias.jpg, alias.jpeg or default.png."""
+    with _cache_lock:
+        if program_id in _logo_cache:
+            return _logo_cache[program_id]
+    
+    logo_file = 'default.png'
+    if program_id:
+        for ext in ['.png', '.jpg', '.jpeg']:
+            if (LOGO_DIR / f"{program_id}{ext}").exists():
+                logo_file = f"{program_id}{ext}"
+                break
+    
+    with _cache_lock:
+        _logo_cache[program_id] = logo_file
+    return logo_file
+
+def invalidate_feeds(program_id=None, include_all=True):
+    """
+    Drop cached feeds affected by a change.
+    
+    Args:
+        program_id: Program whose feed changed (None if no program matched)
+        include_all: Also drop the all-programs feed
+    """
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        stale = [
+            key for key in list(_feed_cache.keys())
+            if (program_id is not None and key[0] == program_id) or (include_all and key[0] is None)
+        ]
+        for key in stale:
+            _feed_cache.pop(key, None)
+    count_feed_request('invalidated', len(stale))
+    if stale:
+        print(f"♻️ Cache invalidated for '{program_id or 'all'}' ({len(stale)} feeds)")
+
+def _build_channel(program_name, program_id, web_base_url):
+    """Create the podcast channel (without episodes) for a feed."""
+    from podgen import Podcast, Person
+    p = Podcast()
     
     # Use program-specific name or default
     if program_name:
@@ -240,116 +842,1350 @@ def _generate_podcast_feed_internal(program_name=None, program_id=None, schedule
     p.feed_url = base_url + 'feed.rss'
     
     # Per-program logo support: Search for alias.png, alias.jpg, or alias.jpeg
-    logo_file = 'default.png'
-    if program_id:
-        for ext in ['.png', '.jpg', '.jpeg']:
-            if (LOGO_DIR / f"{program_id}{ext}").exists():
-                logo_file = f"{program_id}{ext}"
-                break
-    
-    p.image = web_base_url + f'logo/{logo_file}'
+    p.image = web_base_url + f'logo/{find_logo(program_id)}'
         
     p.description = 'Personal Radio Archive'
     p.language = 'ko'
     p.authors = [Person('Radio Recorder')]
     p.explicit = False
     
-    # Find all .m4a files
-    all_files = sorted(RECORDINGS_DIR.glob('*.m4a'), reverse=True)
+    return p
 
+def _build_episode(name, size, mtime, duration, display_name, web_base_url):
+    """Create a podcast episode for a catalogued recording."""
+    from podgen import Episode, Media
+    date = time.localtime(mtime)
+    
+    e = Episode()
+    # Use requested format: Program Name YYYY-MM-DD
+    e.title = f"{display_name} {time.strftime('%Y-%m-%d', date)}"
+    e.media = Media(web_base_url + name, size)
+    # Use filename as GUID for consistency
+    e.id = name
+    e.publication_date = time.strftime('%a, %d %b %Y %H:%M:%S +0900', date)
     
-    # Filter by program schedule if provided
+    # iTunes specific duration (probed once when the file was catalogued)
+    if duration:
+        e.media.duration = datetime.timedelta(seconds=duration)
+    
+    return e
+
+# Stand-in for the request's base URL in feed templates (.invalid never resolves)
+FEED_BASE_PLACEHOLDER = 'http://feed-base-url.invalid/'
+
+def substitute_base_url(rss_xml, web_base_url):
+    """Put the request's base URL into a feed template, escaped for XML text and attributes."""
+    return rss_xml.replace(FEED_BASE_PLACEHOLDER, escape(web_base_url, {'"': '&quot;', "'": '&apos;'}))
+
+# Namespaces podgen declares on the <rss> root element, looked up on first use
+_rss_nsmap = None
+_NS_DECLARATION_RE = re.compile(r' xmlns:\w+="[^"]*"')
+
+def render_episode_item(episode):
+    """
+    Serialize an episode to an RSS <item> fragment.
+    
+    The fragment is indented and stripped of namespace declarations so that
+    it can be spliced into a channel exactly as podgen would have written it.
+    """
+    global _rss_nsmap
+    from lxml import etree
+    if _rss_nsmap is None:
+        from podgen import Podcast
+        _rss_nsmap = Podcast()._nsmap
+    channel = etree.Element('channel', nsmap=_rss_nsmap)
+    item = episode.rss_entry()
+    channel.append(item)
+    xml = etree.tostring(item, pretty_print=True, encoding='unicode')
+    
+    # Namespaces are declared once on the <rss> root
+    open_tag, rest = xml.split('>', 1)
+    open_tag = _NS_DECLARATION_RE.sub('', open_tag)
+    return '    ' + (open_tag + '>' + rest).rstrip('\n').replace('\n', '\n    ') + '\n'
+
+# Cache for serialized <item> fragments: key=(name, mtime, size, duration, display_name, base_url)
+# (base_url is FEED_BASE_PLACEHOLDER when building feed templates)
+_item_cache = SizedLRUCache(maxsize=max(1, ITEM_CACHE_BYTES))
+
+def get_episode_item(name, size, mtime, duration, display_name, web_base_url):
+    """Return the <item> fragment for a recording, serializing it only once."""
+    key = (name, mtime, size, duration, display_name, web_base_url)
+    with _cache_lock:
+        item = _item_cache.get(key)
+    if item is None:
+        episode = _build_episode(name, size, mtime, duration, display_name, web_base_url)
+        item = render_episode_item(episode)
+        with _cache_lock:
+            _item_cache[key] = item
+    return item
+
+# RFC 5005 feed history namespace, declared where it is used
+_FH_NAMESPACE = 'http://purl.org/syndication/history/1.0'
+
+def page_url(feed_url, page, link_query=()):
+    """URL of a feed page; page None is the subscription feed itself."""
+    params = ([('page', page)] if page is not None else []) + list(link_query)
+    return feed_url + ('?' + urlencode(params) if params else '')
+
+def render_archive_links(feed_url, page, archives, link_query=()):
+    """
+    Build RFC 5005 archive links for a feed page.
+    
+    The subscription feed (page None) points to the newest archive page with
+    prev-archive; archive pages link to older and newer archive pages,
+    link back to the subscription feed and are marked with <fh:archive/>.
+    
+    Args:
+        page: Archive page, 1 being the oldest (None = subscription feed)
+        archives: Number of archive pages
+    """
+    links = []
+    if page is None:
+        if archives:
+            links.append(('prev-archive', page_url(feed_url, archives, link_query)))
+    else:
+        links.append(('current', page_url(feed_url, None, link_query)))
+        if page > 1:
+            links.append(('prev-archive', page_url(feed_url, page - 1, link_query)))
+        if page < archives:
+            links.append(('next-archive', page_url(feed_url, page + 1, link_query)))
+    
+    lines = [
+        f'    <atom:link href={quoteattr(href)} rel="{rel}" type="application/rss+xml"/>\n'
+        for rel, href in links
+    ]
+    if page is not None:
+        lines.append(f'    <fh:archive xmlns:fh="{_FH_NAMESPACE}"/>\n')
+    return ''.join(lines)
+
+def _generate_podcast_feed_internal(program_name=None, program_id=None, schedule=None,
+                                    page=None, limit=0, link_query=()):
+    """
+    Internal function to generate an RSS feed template from the episode catalog.
+    
+    The channel header is serialized on its own and joined with cached
+    per-episode <item> fragments, so a new recording costs one fragment.
+    URLs are written with FEED_BASE_PLACEHOLDER, see substitute_base_url().
+    
+    Args:
+        page: Archive page, counted from the oldest episodes (None = subscription feed)
+        limit: Episodes per page (0 puts every episode in the subscription feed)
+        link_query: Extra (name, value) query parameters for archive links
+    
+    Returns:
+        Tuple of (rss_xml template, newest episode mtime or None)
+    """
+    # The request's base URL is substituted at response time
+    web_base_url = FEED_BASE_PLACEHOLDER
+    p = _build_channel(program_name, program_id, web_base_url)
+    feed_url = p.feed_url
+    
+    # Episodes come from the catalog; the caller syncs it before generating
     # Note: Use 'is not None' because an empty list is a valid (but empty) schedule
-    if schedule is not None:
-        files = filter_files_by_program(all_files, schedule, program_id)
+    catalog_id = program_id if schedule is not None else None
+    total, newest_mtime = _catalog.summary(catalog_id)
+    # Archive pages are the complete pages counted from the oldest episode, so
+    # an archive page never changes once it exists; the subscription feed holds
+    # the newest episodes, including those not yet on a complete page
+    archives = total // limit if limit else 0
+    if page is not None and not 1 <= page <= archives:
+        abort(404, f"Feed page {page} not found")
+    
+    if page is not None:
+        episodes = _catalog.episodes(catalog_id, limit=limit, offset=total - page * limit)
+        newest_mtime = max(mtime for _, _, mtime, _ in episodes)
+    elif limit:
+        episodes = _catalog.episodes(catalog_id, limit=limit)
     else:
-        files = all_files
+        episodes = _catalog.episodes(catalog_id)
     
-    if not files:
+    # Recordings in progress head the subscription feed until they are finished
+    live = live_recordings(catalog_id) if page is None else []
+    if live:
+        started = max(datetime.datetime.fromisoformat(marker['started']).timestamp() for marker in live)
+        newest_mtime = max(newest_mtime or 0, started)
+    
+    if not episodes:
         print(f"WARNING: No .m4a files found")
+    else:
+        shown = f"archive page {page}/{archives}" if page is not None else "subscription feed"
+        print(f"✅ Found {total} catalogued episodes for '{program_id or 'all'}' "
+              f"({shown}, {len(episodes)} episodes)")
+        # Channel dates follow the newest episode of the page (as podgen would
+        # derive pubDate), so regenerating unchanged content yields an
+        # identical body and ETag, and archive pages keep theirs for good
+        newest = time.strftime('%a, %d %b %Y %H:%M:%S +0900', time.localtime(newest_mtime))
+        p.publication_date = newest
+        p.last_updated = newest
+    
+    if page is not None:
+        p.feed_url = page_url(feed_url, page, link_query)
     
-    for f in files:
+    display_name = program_name if program_name else "Recording"
+    items = [render_archive_links(feed_url, page, archives, link_query)]
+    for marker in live:
         try:
-            size = f.stat().st_size
-            mtime = f.stat().st_mtime
-            date = time.localtime(mtime)
-            
-            e = Episode()
-            # Use requested format: Program Name YYYY-MM-DD
-            display_name = program_name if program_name else "Recording"
-            e.title = f"{display_name} {time.strftime('%Y-%m-%d', date)}"
-            e.media = Media(web_base_url + f.name, size)
-            # Use filename as GUID for consistency
-            e.id = f.name
-            e.publication_date = time.strftime('%a, %d %b %Y %H:%M:%S +0900', date)
-            
-            # iTunes specific duration
-            try:
-                e.media.populate_duration_from(str(f))
-            except Exception as duration_error:
-                # print(f"WARNING: Could not get duration for {f.name}: {duration_error}")
-                pass
-            
-            p.episodes.append(e)
+            items.append(render_live_item(marker, display_name, web_base_url))
         except Exception as e:
-            print(f"WARNING: Failed to process file {f.name}: {e}")
+            print(f"WARNING: Failed to add live recording {marker['name']}: {e}")
+    for name, size, mtime, duration in episodes:
+        try:
+            items.append(get_episode_item(name, size, mtime, duration, display_name, web_base_url))
+        except Exception as e:
+            print(f"WARNING: Failed to process file {name}: {e}")
             continue
     
-    return p
+    channel_xml = p.rss_str()
+    # Items go on their own lines just before the indented closing </channel>
+    split_at = channel_xml.rindex('\n', 0, channel_xml.rindex('</channel>')) + 1
+    return channel_xml[:split_at] + ''.join(items) + channel_xml[split_at:], newest_mtime
 
-def generate_podcast_feed_xml(program_name=None, program_id=None, schedule=None):
-    """Generate RSS feed XML with caching support."""
-    # Check if cache should be invalidated
-    if should_invalidate_cache():
-        print("♻️ Cache invalidated due to new recording")
-        _feed_cache.clear()
+def generate_podcast_feed_xml(program_name=None, program_id=None, schedule=None,
+                              page=None, limit=0, link_query=()):
+    """
+    Generate RSS feed XML with caching support.
     
+    Freshness is maintained by the filesystem watcher invalidating entries,
+    so a cache hit needs no filesystem access.
+    
+    Returns:
+        Cache entry dict for the request's base URL, see build_feed_entry()
+    """
     # Get dynamic base URL for this request
     web_base_url = get_base_url()
     
-    # Create cache key including the base URL to prevent HTTP/HTTPS cache poisoning
+    # The template is shared by every base URL; HTTP and HTTPS can't poison each
+    # other because the scheme and host are substituted per response
     schedule_tuple = tuple(schedule) if schedule else None
-    cache_key = (program_id, schedule_tuple, web_base_url)
+    cache_key = (program_id, schedule_tuple, page, limit, tuple(link_query))
     
     # Check cache
-    if cache_key in _feed_cache:
+    with _cache_lock:
+        template = _feed_cache.get(cache_key)
+        generation = _cache_generation
+        # Remember the feed so it is pre-warmed after new recordings
+        _warm_keys[cache_key] = True
+    if template is not None:
         # print(f"🚀 Cache HIT for {cache_key}")
-        return _feed_cache[cache_key]
+        count_feed_request('hit')
+        return render_feed(template, web_base_url)
+    
+    # Cache miss - pick up new, changed or removed recordings, then generate feed
+    count_feed_request('miss')
+    print(f"📦 Cache MISS - Generating new feed (ID: {program_id or 'all'}, page {page or 'current'}) "
+          f"[hit={_feed_stats['hit']} miss={_feed_stats['miss']} 304={_feed_stats['not_modified']}]")
+    refresh_catalog()
+    template = load_feed_template(cache_key, program_name, program_id, schedule, page, limit, link_query)
+    
+    # Store template in cache unless a change arrived while generating
+    with _cache_lock:
+        if generation == _cache_generation:
+            _feed_cache[cache_key] = template
+    
+    return render_feed(template, web_base_url)
+
+def load_feed_template(cache_key, program_name, program_id, schedule, page, limit, link_query):
+    """
+    Generate a feed template, or take it from the shared cache (FEED_CACHE=shared)
+    if another worker or an earlier run already generated it from the same data.
     
-    # Cache miss - generate feed
-    print(f"📦 Cache MISS - Generating new feed for: {web_base_url} (ID: {program_id or 'all'})")
-    podcast = _generate_podcast_feed_internal(program_name, program_id, schedule)
-    rss_xml = podcast.rss_str()
+    Returns:
+        Template dict, see build_feed_template()
+    """
+    fingerprint = None
+    if _shared_cache is not None:
+        fingerprint = feed_fingerprint(program_id, program_name)
+        template = _shared_cache.get(cache_key, fingerprint)
+        if template is not None:
+            count_feed_request('shared_hit')
+            return template
     
-    # Store string in cache
-    _feed_cache[cache_key] = rss_xml
+    started = time.perf_counter()
+    rss_xml, last_modified = _generate_podcast_feed_internal(
+        program_name, program_id, schedule, page, limit, link_query)
+    template = build_feed_template(rss_xml, last_modified)
+    observe_generation(program_id, time.perf_counter() - started)
     
-    return rss_xml
+    if _shared_cache is not None:
+        _shared_cache.put(cache_key, fingerprint, template)
+    return template
+
+def build_feed_template(rss_xml, last_modified):
+    """Wrap a generated feed template for the feed cache."""
+    return {
+        'rss_xml': rss_xml,
+        'digest': hashlib.sha1(rss_xml.encode('utf-8')).hexdigest(),
+        'last_modified': last_modified,
+    }
+
+def render_feed(template, web_base_url):
+    """
+    Substitute the base URL into a feed template and encode it.
+    
+    The result is kept per (template, base URL), so each host and scheme
+    pays for substitution and compression once per generated feed.
+    
+    Returns:
+        Cache entry dict, see build_feed_entry()
+    """
+    key = (template['digest'], web_base_url)
+    with _cache_lock:
+        entry = _rendered_cache.get(key)
+    if entry is None:
+        entry = build_feed_entry(substitute_base_url(template['rss_xml'], web_base_url), template['last_modified'])
+        with _cache_lock:
+            _rendered_cache[key] = entry
+    return entry
+
+def build_feed_entry(rss_xml, last_modified):
+    """
+    Encode a generated feed and precompress it once for every request that follows.
+    
+    Returns:
+        Dict with 'rss_xml' (UTF-8 bytes), 'rss_gzip', 'rss_br' (None without
+        the brotli module), 'etag' and 'last_modified'
+    """
+    body = rss_xml.encode('utf-8')
+    return {
+        'rss_xml': body,
+        # mtime=0 keeps the gzip bytes identical for identical feeds
+        'rss_gzip': gzip.compress(body, compresslevel=9, mtime=0),
+        'rss_br': brotli.compress(body, quality=BROTLI_QUALITY) if brotli else None,
+        # Strong validator: identical bytes always produce the same tag
+        'etag': '"' + hashlib.sha1(body).hexdigest() + '"',
+        'last_modified': last_modified,
+    }
+
+# Feed request outcomes (served from cache, generated, answered with 304),
+# plus cached feeds dropped by invalidation, regenerated by the pre-warmer and
+# taken from the shared cache instead of being generated
+_feed_stats = {'hit': 0, 'miss': 0, 'not_modified': 0, 'invalidated': 0, 'prewarmed': 0, 'shared_hit': 0}
+_stats_lock = threading.Lock()
+
+def count_feed_request(outcome, count=1):
+    """Increment a feed counter."""
+    with _stats_lock:
+        _feed_stats[outcome] += count
+
+def cache_memory_usage():
+    """Resident size and eviction counts of the feed caches."""
+    with _cache_lock:
+        return {
+            'items': _item_cache.usage(),
+            'templates': _feed_cache.usage(),
+            'rendered': _rendered_cache.usage(),
+        }
+
+def is_not_modified(etags, last_modified):
+    """
+    Evaluate conditional request headers against a feed's validators.
+    
+    Args:
+        etags: Entity tags of every encoding of the feed
+        last_modified: Newest episode mtime, or None
+    
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2).
+    """
+    if_none_match = request.get_header('If-None-Match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison is used for If-None-Match
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return any(etag in tags for etag in etags)
+    
+    if_modified_since = request.get_header('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_date(if_modified_since.split(';')[0].strip())
+        return since is not None and int(last_modified) <= since
+    
+    return False
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the feed encoding for an Accept-Encoding header.
+    
+    Returns:
+        'br', 'gzip' or 'identity'; the highest q-value wins and ties prefer
+        the smaller encoding
+    """
+    qvalues = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    
+    default_q = qvalues.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli else ['gzip']
+    scored = [(qvalues.get(coding, default_q), -rank, coding) for rank, coding in enumerate(candidates)]
+    # Unlisted identity is acceptable but loses to any listed compression
+    scored.append((qvalues.get('identity', 0.001), -len(candidates), 'identity'))
+    q, _, coding = max(scored)
+    return coding if q > 0 else 'identity'
+
+def encoding_etag(etag, encoding):
+    """Entity tag of one encoding of a feed (each representation needs its own tag)."""
+    return etag if encoding == 'identity' else f'{etag[:-1]}-{encoding}"'
+
+def send_feed(entry):
+    """Set feed response headers and return the (precompressed) body, or an empty 304."""
+    encodings = ['identity', 'gzip'] + (['br'] if entry['rss_br'] is not None else [])
+    encoding = choose_encoding(request.get_header('Accept-Encoding'))
+    if encoding not in encodings:
+        encoding = 'identity'
+    
+    # Responses differ by Accept-Encoding, shared caches must key on it
+    response.set_header('Vary', 'Accept-Encoding')
+    response.set_header('ETag', encoding_etag(entry['etag'], encoding))
+    if entry['last_modified'] is not None:
+        response.set_header('Last-Modified', email.utils.formatdate(entry['last_modified'], usegmt=True))
+    
+    if is_not_modified([encoding_etag(entry['etag'], e) for e in encodings], entry['last_modified']):
+        count_feed_request('not_modified')
+        response.status = 304
+        return b''
+    
+    response.content_type = 'application/rss+xml; charset=utf-8'
+    if encoding == 'identity':
+        return entry['rss_xml']
+    response.set_header('Content-Encoding', encoding)
+    return entry['rss_gzip'] if encoding == 'gzip' else entry['rss_br']
+
+# ======================================================================
+# Filesystem Watcher
+# ======================================================================
+
+# Recordings reported by the watcher since the last catalog refresh
+_pending_changes = set()
+# Full rescan needed: at startup, after event overflow, or without a watcher
+_needs_full_sync = True
+_watcher_running = False
+
+def refresh_catalog():
+    """Apply pending filesystem changes to the catalog before generating a feed."""
+    global _needs_full_sync
+    with _cache_lock:
+        names = set(_pending_changes)
+        _pending_changes.clear()
+        full = _needs_full_sync or not _watcher_running
+        _needs_full_sync = False
+    
+    if full:
+        _catalog.sync()
+        scan_live_markers()
+    elif names:
+        _catalog.update(names)
+
+def handle_fs_event(directory, name):
+    """
+    Push a single filesystem change into the cache layer.
+    
+    Args:
+        directory: Directory the change happened in (RECORDINGS_DIR or LOGO_DIR)
+        name: Changed entry name, or None if events were lost and everything must be rescanned
+    """
+    global _needs_full_sync
+    if name is None:
+        with _cache_lock:
+            _needs_full_sync = True
+            _logo_cache.clear()
+            count_feed_request('invalidated', len(_feed_cache))
+            _feed_cache.clear()
+        print(f"♻️ Cache cleared, rescan scheduled for {directory}")
+        return
+    
+    if directory == LOGO_DIR:
+        program_id = Path(name).stem
+        with _cache_lock:
+            _logo_cache.pop(program_id, None)
+        if program_id in PROGRAMS:
+            refresh_feeds(program_id, include_all=False)
+        return
+    
+    live = LIVE_MARKER_RE.match(name)
+    if live and directory == RECORDINGS_DIR:
+        update_live_marker(name)
+        refresh_feeds(match_program(live.group(1)))
+        return
+    
+    if not name.endswith('.m4a'):
+        return
+    with _cache_lock:
+        _pending_changes.add(name)
+    refresh_feeds(match_program(name))
+
+# inotify(7) constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+def _watch_inotify(directories, callback, sharded=None):
+    """
+    Start an inotify watcher thread on Linux.
+    
+    Args:
+        sharded: One of the directories whose YYYY/ and YYYY/MM/ subdirectories
+                 are watched too, including ones created later
+    
+    Raises:
+        OSError: If inotify is unavailable or a directory can't be watched
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError("inotify is not supported on this platform")
+    
+    fd = libc.inotify_init1(IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    
+    mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    # Watch descriptor -> (directory, depth below the sharded directory or None)
+    watches = {}
+    
+    def add_watch(directory, depth=None):
+        """Watch a directory and its shard subdirectories; returns the directories added."""
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        watches[wd] = (directory, depth)
+        added = [directory]
+        if depth is not None and depth < 2:
+            for sub in _scan_dirs(directory, 4 if depth == 0 else 2):
+                added += add_watch(Path(sub.path), depth + 1)
+        return added
+    
+    def add_shard(directory, depth):
+        """Watch a new shard directory and report files that arrived before the watch."""
+        try:
+            added = add_watch(directory, depth)
+        except OSError as e:
+            print(f"WARNING: Can't watch {directory}: {e}")
+            return
+        for path in added:
+            for name in scan_recordings(path):
+                callback(path, name)
+    
+    try:
+        for directory in directories:
+            add_watch(directory, 0 if directory == sharded else None)
+    except OSError:
+        os.close(fd)
+        raise
+    
+    def run():
+        while True:
+            buf = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(buf):
+                wd, event_mask, _cookie, length = _INOTIFY_EVENT.unpack_from(buf, offset)
+                offset += _INOTIFY_EVENT.size
+                name = buf[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+                offset += length
+                
+                try:
+                    if event_mask & IN_Q_OVERFLOW:
+                        for directory in directories:
+                            callback(directory, None)
+                    elif wd in watches and name:
+                        directory, depth = watches[wd]
+                        if not event_mask & IN_ISDIR:
+                            callback(directory, name)
+                        elif (depth is not None and depth < 2 and event_mask & (IN_CREATE | IN_MOVED_TO)
+                              and len(name) == (4 if depth == 0 else 2) and name.isdecimal()):
+                            add_shard(directory / name, depth + 1)
+                except Exception as e:
+                    print(f"WARNING: Failed to handle change of {name}: {e}")
+    
+    threading.Thread(target=run, name='inotify-watcher', daemon=True).start()
+
+def _snapshot(directory):
+    """Map entry name to (size, mtime_ns) for a directory."""
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries[entry.name] = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return entries
+
+def _watch_polling(directories, callback, interval, sharded=None):
+    """
+    Start a thread that diffs directory listings every interval seconds.
+    
+    Shard directories below `sharded` are listed again only when their mtime
+    changed, except the two newest, where recordings grow in place.
+    """
+    def shard_dirs():
+        shards = list_shards(sharded) if sharded is not None else []
+        return [
+            (sharded / shard, mtime_ns, i >= len(shards) - 2)
+            for i, (shard, mtime_ns) in enumerate(shards)
+        ]
+    
+    snapshots = {directory: _snapshot(directory) for directory in directories}
+    mtimes = {}
+    for path, mtime_ns, _ in shard_dirs():
+        snapshots[path] = _snapshot(path)
+        mtimes[path] = mtime_ns
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            shards = shard_dirs()
+            stale = list(directories)
+            for path, mtime_ns, newest in shards:
+                if newest or mtimes.get(path) != mtime_ns:
+                    stale.append(path)
+                    mtimes[path] = mtime_ns
+            # Removed shards are diffed against an empty listing
+            removed = set(snapshots) - set(directories) - {path for path, _, _ in shards}
+            
+            for directory in stale + list(removed):
+                current = {} if directory in removed else _snapshot(directory)
+                previous = snapshots.get(directory, {})
+                changed = [
+                    name for name in current.keys() | previous.keys()
+                    if current.get(name) != previous.get(name)
+                ]
+                if directory in removed:
+                    del snapshots[directory]
+                    mtimes.pop(directory, None)
+                else:
+                    snapshots[directory] = current
+                for name in changed:
+                    try:
+                        callback(directory, name)
+                    except Exception as e:
+                        print(f"WARNING: Failed to handle change of {name}: {e}")
+    
+    threading.Thread(target=run, name='polling-watcher', daemon=True).start()
+
+def start_watcher():
+    """Watch RECORDINGS_DIR and LOGO_DIR according to WATCH_MODE, pre-warming changed feeds."""
+    global _watcher_running
+    if WATCH_MODE == 'off':
+        print("👀 Filesystem watcher disabled, catalog rescans on every cache miss")
+        return
+    
+    directories = [d for d in (RECORDINGS_DIR, LOGO_DIR) if d.is_dir()]
+    if WATCH_MODE in ('auto', 'inotify'):
+        try:
+            _watch_inotify(directories, handle_fs_event, sharded=RECORDINGS_DIR)
+            _watcher_running = True
+            print(f"👀 Watching {', '.join(map(str, directories))} with inotify")
+            start_prewarmer()
+            return
+        except (OSError, AttributeError) as e:
+            print(f"WARNING: inotify unavailable ({e}), falling back to polling")
+    
+    _watch_polling(directories, handle_fs_event, WATCH_INTERVAL, sharded=RECORDINGS_DIR)
+    _watcher_running = True
+    print(f"👀 Polling {', '.join(map(str, directories))} every {WATCH_INTERVAL}s")
+    start_prewarmer()
+
+# ======================================================================
+# Feed Pre-warming
+# ======================================================================
+
+# Feeds requested recently, regenerated in the background when their program changes
+_warm_keys = LRUCache(maxsize=256)
+# Programs changed since the last pre-warm pass (None stands for the all-programs feed)
+_prewarm_programs = set()
+_prewarm_event = threading.Event()
+_prewarm_running = False
+
+def refresh_feeds(program_id=None, include_all=True):
+    """
+    React to a change in a program's recordings or logo.
+    
+    With the pre-warm thread running, cached feeds stay in place and are
+    replaced once regenerated; otherwise they are dropped.
+    
+    Args:
+        program_id: Program whose feed changed (None if no program matched)
+        include_all: Also refresh the all-programs feed
+    """
+    global _cache_generation
+    if not _prewarm_running:
+        invalidate_feeds(program_id, include_all)
+        return
+    
+    with _cache_lock:
+        # Feeds generated from data older than this change must not be stored
+        _cache_generation += 1
+        if program_id is not None:
+            _prewarm_programs.add(program_id)
+        if include_all:
+            _prewarm_programs.add(None)
+    _prewarm_event.set()
+
+def prewarm_feeds(program_ids):
+    """
+    Regenerate the cached and recently requested feeds of the given programs
+    and swap them in.
+    
+    Cached feeds are included even after they dropped out of _warm_keys, so
+    none of them keeps serving the old episodes until CACHE_TTL.
+    
+    Each new template replaces the old one in a single cache assignment, and
+    is rendered for every base URL the old one was served to, so requests
+    keep getting the previous feed until the new one is complete.
+    
+    Returns:
+        Number of feeds regenerated
+    """
+    with _cache_lock:
+        keys = [key for key in dict.fromkeys([*_warm_keys.keys(), *_feed_cache.keys()])
+                if key[0] in program_ids]
+    if not keys:
+        return 0
+    
+    refresh_catalog()
+    for key in keys:
+        program_id, schedule_tuple, page, limit, link_query = key
+        program_name = PROGRAMS[program_id]['name'] if program_id is not None else None
+        try:
+            template = load_feed_template(
+                key, program_name, program_id, list(schedule_tuple) if schedule_tuple else None,
+                page, limit, link_query)
+        except HTTPError:
+            # Page no longer exists (e.g. recordings were deleted)
+            with _cache_lock:
+                _feed_cache.pop(key, None)
+                _warm_keys.pop(key, None)
+            continue
+        
+        with _cache_lock:
+            old = _feed_cache.get(key)
+            _feed_cache[key] = template
+            base_urls = [base_url for digest, base_url in list(_rendered_cache.keys())
+                         if old is not None and digest == old['digest']]
+        for base_url in base_urls:
+            render_feed(template, base_url)
+    
+    count_feed_request('prewarmed', len(keys))
+    print(f"🔥 Pre-warmed {len(keys)} feeds for {', '.join(sorted(p or 'all' for p in program_ids))}")
+    return len(keys)
+
+def _prewarm_loop():
+    """Regenerate changed feeds whenever the watcher reports a change."""
+    while True:
+        _prewarm_event.wait()
+        # A finished recording arrives as several events; handle them together
+        time.sleep(PREWARM_DELAY)
+        _prewarm_event.clear()
+        with _cache_lock:
+            program_ids = set(_prewarm_programs)
+            _prewarm_programs.clear()
+        try:
+            prewarm_feeds(program_ids)
+        except Exception as e:
+            print(f"WARNING: Feed pre-warming failed: {e}")
+            for program_id in program_ids:
+                invalidate_feeds(program_id, include_all=program_id is None)
+
+def start_prewarmer():
+    """Start the background feed pre-warm thread (needs the filesystem watcher)."""
+    global _prewarm_running
+    if not _watcher_running:
+        return
+    threading.Thread(target=_prewarm_loop, name='feed-prewarm', daemon=True).start()
+    _prewarm_running = True
+
+# ======================================================================
+# Startup
+# ======================================================================
+
+# Set once the service can answer feed requests from cache (see WARMUP)
+_ready = threading.Event()
+
+def subscription_keys():
+    """
+    Feed cache keys of every subscription feed (no ?page=), as requested by podcast apps.
+    
+    Returns:
+        List of keys in the form used by generate_podcast_feed_xml()
+    """
+    # With authentication every request carries one of the secrets
+    link_queries = [(('secret', secret),) for secret in SECRETS] or [()]
+    keys = []
+    for link_query in link_queries:
+        keys.append((None, None, None, FEED_LIMIT, link_query))
+        for program_id, info in PROGRAMS.items():
+            keys.append((program_id, tuple(info['schedule']), None, info['limit'], link_query))
+    return keys
+
+def warm_up():
+    """
+    Sync the catalog and generate every subscription feed, then report ready.
+    
+    This moves the work of the first requests after a restart (probing new
+    recordings, loading podgen, serializing episodes) ahead of readiness.
+    """
+    started = time.perf_counter()
+    keys = subscription_keys()
+    try:
+        with _cache_lock:
+            for key in keys:
+                _warm_keys[key] = True
+        prewarm_feeds({key[0] for key in keys})
+    except Exception as e:
+        print(f"WARNING: Warm-up failed: {e}")
+    finally:
+        _ready.set()
+    print(f"🚦 Ready after {time.perf_counter() - started:.2f}s warm-up ({len(keys)} feeds)")
+
+def start_warmup():
+    """Run warm_up() in the background, or report ready at once with WARMUP=false."""
+    if not WARMUP:
+        _ready.set()
+        return
+    threading.Thread(target=warm_up, name='feed-warmup', daemon=True).start()
+
+def start_background_tasks():
+    """Start the filesystem watcher and the warm-up of this server process."""
+    start_watcher()
+    start_warmup()
+
+# ======================================================================
+# Transcoded Variants
+# ======================================================================
+
+# ffmpeg output options per ?variant= name; without one the original is served
+VARIANTS = {
+    'low': {'acodec': 'aac', 'audio_bitrate': VARIANT_LOW_BITRATE, 'ac': 1},
+}
+# Seconds a request waits for a transcode before answering 503
+VARIANT_WAIT_SECONDS = 300
+
+# Transcodes in progress: variant file name -> Future shared by every request for it
+_variant_jobs = {}
+_variant_executor = None
+# Variant requests: (variant, outcome) -> count; outcome is hit, transcoded, failed or evicted
+_variant_stats = {}
+# Bytes in VARIANTS_DIR after the last eviction pass (None until one has run)
+_variant_usage = None
+
+def count_variant(variant, outcome, count=1):
+    """Record a variant cache outcome."""
+    with _stats_lock:
+        _variant_stats[(variant, outcome)] = _variant_stats.get((variant, outcome), 0) + count
+
+def variant_filename(filename, variant, st):
+    """Cache file name of a recording's variant; a changed original gets a new one."""
+    return f"{Path(filename).stem}.{variant}.{st.st_size:x}-{st.st_mtime_ns:x}.m4a"
+
+def transcode(source, target, variant):
+    """Run ffmpeg for one variant into a temporary file that is renamed into place when complete."""
+    import ffmpeg
+    partial = target.with_name(f".{target.name}.{os.getpid()}-{threading.get_ident()}.part")
+    try:
+        (
+            ffmpeg
+            .input(str(source))
+            .output(str(partial), vn=None, format='mp4', movflags='+faststart', **VARIANTS[variant])
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        os.replace(partial, target)
+    finally:
+        partial.unlink(missing_ok=True)
+
+def evict_variants(keep=None):
+    """Delete least recently used variants until VARIANT_MAX_BYTES is met."""
+    global _variant_usage
+    files = []
+    for path in VARIANTS_DIR.glob('*.m4a'):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_atime, st.st_size, path))
+    
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= VARIANT_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        count_variant(path.name.split('.')[-3], 'evicted')
+    _variant_usage = total
+
+def _build_variant(source, target, variant):
+    """Transcode a variant unless another worker process already has (or is doing so)."""
+    VARIANTS_DIR.mkdir(parents=True, exist_ok=True)
+    lock_path = VARIANTS_DIR / f".{target.name}.lock"
+    with open(lock_path, 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if target.exists():
+                return
+            started = time.perf_counter()
+            try:
+                transcode(source, target, variant)
+            except Exception as e:
+                count_variant(variant, 'failed')
+                stderr = getattr(e, 'stderr', None)
+                print(f"ERROR: Failed to transcode {source.name} ({variant}): "
+                      f"{stderr.decode('utf8', errors='ignore')[-500:] if stderr else e}")
+                raise
+            count_variant(variant, 'transcoded')
+            print(f"🎚️ Transcoded {source.name} ({variant}) in {time.perf_counter() - started:.1f}s")
+            evict_variants(keep=target)
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+def get_variant(source, filename, variant, st):
+    """
+    Return the path of a recording's variant, transcoding it on first use.
+    
+    Concurrent requests for the same variant wait for one shared job; worker
+    processes coordinate through a lock file. Access times order eviction.
+    
+    Args:
+        source: Path of the original recording
+        filename: Recording file name (flat, as in feed URLs)
+        variant: Key of VARIANTS
+        st: stat() result of the original
+    
+    Raises:
+        concurrent.futures.TimeoutError: The transcode took longer than VARIANT_WAIT_SECONDS
+        Exception: The transcode failed
+    """
+    global _variant_executor
+    target = VARIANTS_DIR / variant_filename(filename, variant, st)
+    try:
+        # Mark as recently used; mtime (Last-Modified) stays the creation time
+        os.utime(target, (time.time(), target.stat().st_mtime))
+        count_variant(variant, 'hit')
+        return target
+    except FileNotFoundError:
+        pass
+    
+    with _cache_lock:
+        job = _variant_jobs.get(target.name)
+        if job is None:
+            if _variant_executor is None:
+                _variant_executor = ThreadPoolExecutor(max_workers=max(1, VARIANT_JOBS), thread_name_prefix='transcode')
+            job = _variant_executor.submit(_build_variant, source, target, variant)
+            _variant_jobs[target.name] = job
+            job.add_done_callback(lambda _, name=target.name: _forget_variant_job(name))
+    job.result(timeout=VARIANT_WAIT_SECONDS)
+    return target
+
+def _forget_variant_job(name):
+    with _cache_lock:
+        _variant_jobs.pop(name, None)
+
+# ======================================================================
+# Live Recordings
+# ======================================================================
+
+# record.py announces a recording in progress with RECORDINGS_DIR/.live-<stem>.json
+# and lists its MPEG-TS segments in .<stem>.<attempt>.csv as each one is completed
+LIVE_MARKER_RE = re.compile(r'^\.live-(\d{8}-\d{4}-\w+)\.json$')
+LIVE_LIST_RE = re.compile(r'^\.(\d{8}-\d{4}-\w+)\.(\d{2})\.csv$')
+# Segment URLs drop the leading dot: live/<stem>.<attempt>-<index>.ts
+LIVE_SEGMENT_RE = re.compile(r'^(\d{8}-\d{4}-\w+)\.(\d{2})-\d{4}\.ts$')
+# A marker this many seconds past the expected end was left by a recorder that died
+LIVE_GRACE_SECONDS = 600
+HLS_MIMETYPE = 'application/vnd.apple.mpegurl'
+
+# Recordings in progress: marker file name -> marker dict, kept current by the watcher
+_live_markers = {}
+
+def read_live_marker(name):
+    """
+    Read a live marker from RECORDINGS_DIR.
+    
+    Returns:
+        Marker dict (name, program_id, dir, started, ends, segment_seconds)
+        with 'stem' and 'expires' added, or None if it is missing, unreadable
+        or expired
+    """
+    match = LIVE_MARKER_RE.match(name)
+    if match is None:
+        return None
+    try:
+        with open(RECORDINGS_DIR / name, encoding='utf-8') as f:
+            marker = json.load(f)
+        # Both times are used later; a marker with an unreadable one is ignored
+        datetime.datetime.fromisoformat(marker['started'])
+        marker['expires'] = datetime.datetime.fromisoformat(marker['ends']).timestamp() + LIVE_GRACE_SECONDS
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if marker['expires'] < time.time() or '..' in Path(marker.get('dir', '.')).parts:
+        return None
+    marker['stem'] = match.group(1)
+    return marker
+
+def scan_live_markers():
+    """Reload every live marker, along with a full catalog sync."""
+    markers = {}
+    try:
+        with os.scandir(RECORDINGS_DIR) as it:
+            for entry in it:
+                if entry.name.startswith('.live-'):
+                    marker = read_live_marker(entry.name)
+                    if marker is not None:
+                        markers[entry.name] = marker
+    except FileNotFoundError:
+        pass
+    with _cache_lock:
+        _live_markers.clear()
+        _live_markers.update(markers)
+
+def update_live_marker(name):
+    """Reload one live marker after a watcher event; a removed marker ends the live episode."""
+    marker = read_live_marker(name)
+    with _cache_lock:
+        if marker is None:
+            _live_markers.pop(name, None)
+        else:
+            _live_markers[name] = marker
+
+def live_recordings(program_id=None):
+    """Recordings in progress, newest first, for one program or (None) all of them."""
+    now = time.time()
+    with _cache_lock:
+        markers = list(_live_markers.values())
+    markers = [
+        marker for marker in markers
+        if marker['expires'] > now and (program_id is None or match_program(marker['stem']) == program_id)
+    ]
+    return sorted(markers, key=lambda marker: marker['started'], reverse=True)
+
+def live_segments(marker):
+    """
+    Completed segments of a live recording, from the lists record.py writes.
+    
+    A segment appears in its list only once ffmpeg has closed it, so the
+    one still being written is never served.
+    
+    Returns:
+        List of (attempt, segment URL name, duration in seconds) in recording order
+    """
+    directory = RECORDINGS_DIR / marker['dir']
+    lists = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                match = LIVE_LIST_RE.match(entry.name)
+                if match and match.group(1) == marker['stem']:
+                    lists.append((int(match.group(2)), entry.path))
+    except FileNotFoundError:
+        return []
+    
+    segments = []
+    for attempt, path in sorted(lists):
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+        except OSError:
+            continue
+        for row in rows:
+            try:
+                name, start, end = Path(row[0]).name.lstrip('.'), float(row[1]), float(row[2])
+            except (IndexError, ValueError):
+                continue
+            if LIVE_SEGMENT_RE.match(name):
+                segments.append((attempt, name, end - start))
+    return segments
+
+def render_live_playlist(marker):
+    """
+    HLS playlist of a live recording's completed segments.
+    
+    EVENT playlists only grow, so players can start from the beginning or
+    join at the live edge; a reconnect of the recorder restarts timestamps
+    and is marked as a discontinuity.
+    """
+    segments = live_segments(marker)
+    target = max([marker.get('segment_seconds') or 1] + [duration for _, _, duration in segments])
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        '#EXT-X-PLAYLIST-TYPE:EVENT',
+        f'#EXT-X-TARGETDURATION:{math.ceil(target)}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+    ]
+    previous = None
+    for attempt, name, duration in segments:
+        if previous is not None and attempt != previous:
+            lines.append('#EXT-X-DISCONTINUITY')
+        previous = attempt
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(name)
+    return '\n'.join(lines) + '\n'
+
+def render_live_item(marker, display_name, web_base_url):
+    """RSS <item> for a recording in progress, its enclosure being the live playlist."""
+    from podgen import Episode, Media
+    started = datetime.datetime.fromisoformat(marker['started'])
+    date = time.localtime(started.timestamp())
+    
+    e = Episode()
+    e.title = f"{display_name} {time.strftime('%Y-%m-%d', date)} (LIVE)"
+    # A stream has no size; podgen warns about that and about HLS not being an iTunes type
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        e.media = Media(web_base_url + f"live/{marker['stem']}.m3u8", 0, type=HLS_MIMETYPE)
+    # The finished recording is a new episode, it replaces this one
+    e.id = f"live-{marker['name']}"
+    e.publication_date = time.strftime('%a, %d %b %Y %H:%M:%S +0900', date)
+    return render_episode_item(e)
+
+def send_live(name):
+    """Serve a live playlist (<stem>.m3u8) or one of its completed segments (<stem>.NN-NNNN.ts)."""
+    segment = LIVE_SEGMENT_RE.match(name)
+    if segment:
+        stem = segment.group(1)
+    else:
+        stem = name[:-len('.m3u8')] if name.endswith('.m3u8') else ''
+    marker = read_live_marker(f".live-{stem}.json")
+    if marker is None:
+        # Finished recordings are in the feed under their own name
+        abort(404, "Live recording not found")
+    
+    if segment is None:
+        body = render_live_playlist(marker).encode('utf-8')
+        return HTTPResponse(body, headers={
+            'Content-Type': HLS_MIMETYPE,
+            'Content-Length': str(len(body)),
+            'Cache-Control': 'no-cache',
+        })
+    
+    if name not in {segment_name for _, segment_name, _ in live_segments(marker)}:
+        abort(404, "Segment not found")
+    # Completed segments never change; Range requests are answered with 206
+    return static_file(f".{name}", root=str(RECORDINGS_DIR / marker['dir']), mimetype='video/mp2t',
+                       headers={'Cache-Control': RECORDING_CACHE_CONTROL})
+
+# ======================================================================
+# Metrics
+# ======================================================================
+
+# Upper bounds (seconds) of the feed generation latency histogram buckets
+GENERATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-program generation latency: program label -> [count per bucket..., +Inf count, sum]
+_generation_histograms = {}
+# serve_file outcomes: (kind, status) -> [requests, bytes sent]
+_file_stats = {}
+
+def observe_generation(program_id, seconds):
+    """Record how long generating a feed took."""
+    label = program_id or 'all'
+    with _stats_lock:
+        histogram = _generation_histograms.get(label)
+        if histogram is None:
+            histogram = _generation_histograms[label] = [0] * (len(GENERATION_BUCKETS) + 2)
+        for i, bound in enumerate(GENERATION_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+def count_file_request(kind, status, sent):
+    """Record a serve_file response and the bytes it sends."""
+    with _stats_lock:
+        stats = _file_stats.setdefault((kind, status), [0, 0])
+        stats[0] += 1
+        stats[1] += sent
+
+def _metric_labels(labels):
+    """Format a Prometheus label set, e.g. {program="morning"}."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def render_metrics():
+    """
+    Export counters in the Prometheus text exposition format.
+    
+    Only counters and snapshots that already exist are read (archive totals
+    are computed once per catalog change), so scraping is cheap under load.
+    
+    Returns:
+        Metrics text
+    """
+    lines = []
+    
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_metric_labels(labels)} {value}")
+    
+    with _stats_lock:
+        feed_stats = dict(_feed_stats)
+        histograms = {label: list(histogram) for label, histogram in _generation_histograms.items()}
+        file_stats = {key: list(stats) for key, stats in _file_stats.items()}
+        variant_stats = dict(_variant_stats)
+    memory = cache_memory_usage()
+    totals = _catalog.totals()
+    
+    metric('radio_feed_requests_total', 'counter', 'Feed requests by cache outcome.', [
+        ('', {'result': result}, feed_stats[result]) for result in ('hit', 'miss', 'not_modified')
+    ])
+    metric('radio_feed_cache_invalidations_total', 'counter', 'Cached feeds dropped after recording or logo changes.', [
+        ('', {}, feed_stats['invalidated'])
+    ])
+    metric('radio_feed_shared_hits_total', 'counter', 'Feeds taken from the shared cache instead of generated.', [
+        ('', {}, feed_stats['shared_hit'])
+    ])
+    metric('radio_feed_prewarmed_total', 'counter', 'Feeds regenerated in the background after changes.', [
+        ('', {}, feed_stats['prewarmed'])
+    ])
+    metric('radio_feed_cache_bytes', 'gauge', 'Resident size of the feed caches.', [
+        ('', {'cache': cache}, usage['bytes']) for cache, usage in memory.items()
+    ])
+    metric('radio_feed_cache_max_bytes', 'gauge', 'Size limit of the feed caches.', [
+        ('', {'cache': cache}, usage['max_bytes']) for cache, usage in memory.items()
+    ])
+    metric('radio_feed_cache_entries', 'gauge', 'Entries in the feed caches.', [
+        ('', {'cache': cache}, usage['entries']) for cache, usage in memory.items()
+    ])
+    metric('radio_feed_cache_evictions_total', 'counter', 'Entries evicted to stay within the size limit.', [
+        ('', {'cache': cache}, usage['evictions']) for cache, usage in memory.items()
+    ])
+    
+    samples = []
+    for label, histogram in sorted(histograms.items()):
+        for bound, count in zip(GENERATION_BUCKETS, histogram):
+            samples.append(('_bucket', {'program': label, 'le': f"{bound:g}"}, count))
+        samples.append(('_bucket', {'program': label, 'le': '+Inf'}, histogram[-2]))
+        samples.append(('_sum', {'program': label}, histogram[-1]))
+        samples.append(('_count', {'program': label}, histogram[-2]))
+    metric('radio_feed_generation_seconds', 'histogram', 'Time to generate a feed on a cache miss or pre-warm.', samples)
+    
+    programs = sorted(totals, key=lambda program_id: (program_id is None, program_id or ''))
+    metric('radio_archive_episodes', 'gauge', 'Catalogued recordings per program (all = every recording).', [
+        ('', {'program': program_id or 'all'}, totals[program_id][0]) for program_id in programs
+    ])
+    metric('radio_archive_bytes', 'gauge', 'Total size of catalogued recordings per program (all = every recording).', [
+        ('', {'program': program_id or 'all'}, totals[program_id][1]) for program_id in programs
+    ])
+    
+    metric('radio_file_requests_total', 'counter', 'Recording and logo requests by response status.', [
+        ('', {'kind': kind, 'status': status}, stats[0]) for (kind, status), stats in sorted(file_stats.items())
+    ])
+    sent = {}
+    for (kind, _), stats in file_stats.items():
+        sent[kind] = sent.get(kind, 0) + stats[1]
+    metric('radio_file_sent_bytes_total', 'counter', 'Recording and logo bytes served.', [
+        ('', {'kind': kind}, value) for kind, value in sorted(sent.items())
+    ])
+    metric('radio_variant_requests_total', 'counter', 'Transcoded variant cache outcomes (hit, transcoded, failed, evicted).', [
+        ('', {'variant': variant, 'outcome': outcome}, count) for (variant, outcome), count in sorted(variant_stats.items())
+    ])
+    if _variant_usage is not None:
+        metric('radio_variant_cache_bytes', 'gauge', 'Disk used by transcoded variants after the last eviction pass.', [
+            ('', {}, _variant_usage)
+        ])
+    return '\n'.join(lines) + '\n'
 
 # ======================================================================
 # Routes
 # ======================================================================
 
+def feed_paging(default_limit):
+    """
+    Read ?page= and ?limit= from the request.
+    
+    Args:
+        default_limit: Page size when ?limit= is not given (0 = no paging)
+    
+    Returns:
+        Tuple of (page, limit, link_query), where page is None for the
+        subscription feed and link_query holds the query parameters archive
+        links must carry over (limit and secret)
+    """
+    try:
+        page = int(request.query['page']) if 'page' in request.query else None
+        limit = int(request.query.get('limit', default_limit))
+    except ValueError:
+        abort(400, "page and limit must be integers")
+    
+    if page is not None and page < 1:
+        abort(400, "page must be 1 or greater")
+    if 'limit' in request.query and not 1 <= limit <= FEED_MAX_LIMIT:
+        abort(400, f"limit must be between 1 and {FEED_MAX_LIMIT}")
+    
+    link_query = []
+    if 'limit' in request.query:
+        link_query.append(('limit', limit))
+    if request.query.get('secret'):
+        link_query.append(('secret', request.query.get('secret')))
+    return page, limit, tuple(link_query)
+
 @app.route('/')
 def index():
-    """Health check endpoint."""
+    """Health check endpoint (liveness: answers as soon as the server is listening)."""
     return {
         'status': 'ok',
+        'ready': _ready.is_set(),
         'service': 'Radio Feed Service',
         'recordings_dir': str(RECORDINGS_DIR),
-        'programs': list(PROGRAMS.keys()) if PROGRAMS else []
+        'programs': list(PROGRAMS.keys()) if PROGRAMS else [],
+        'feed_cache': dict(_feed_stats),
+        'cache_memory': cache_memory_usage()
     }
 
+@app.route('/ready')
+def ready():
+    """Readiness endpoint: 503 until the warm-up has finished."""
+    if not _ready.is_set():
+        response.status = 503
+        return {'status': 'warming up'}
+    return {'status': 'ready'}
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics endpoint."""
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return render_metrics()
+
 @app.route(f'{ROUTE_PREFIX}/feed.rss')
 def feed_all():
     """Generate and serve RSS feed for all programs."""
     require_auth()
+    page, limit, link_query = feed_paging(FEED_LIMIT)
     
     try:
-        rss_content = generate_podcast_feed_xml()
-        
-        response.content_type = 'application/rss+xml; charset=utf-8'
-        return rss_content
+        return send_feed(generate_podcast_feed_xml(page=page, limit=limit, link_query=link_query))
+    except HTTPError:
+        raise
     except Exception as e:
         print(f"ERROR: Failed to generate feed: {e}")
         abort(500, f"Failed to generate feed: {e}")
@@ -362,23 +2198,93 @@ def feed_program(program_id):
     if program_id not in PROGRAMS:
         abort(404, f"Program '{program_id}' not found")
     
+    program = PROGRAMS[program_id]
+    page, limit, link_query = feed_paging(program['limit'])
+    
     try:
-        program = PROGRAMS[program_id]
-        rss_content = generate_podcast_feed_xml(
+        entry = generate_podcast_feed_xml(
             program_name=program['name'],
             program_id=program_id,
-            schedule=program['schedule']
+            schedule=program['schedule'],
+            page=page,
+            limit=limit,
+            link_query=link_query
         )
-        
-        response.content_type = 'application/rss+xml; charset=utf-8'
-        return rss_content
+        return send_feed(entry)
+    except HTTPError:
+        raise
     except Exception as e:
         print(f"ERROR: Failed to generate feed for {program_id}: {e}")
         abort(500, f"Failed to generate feed: {e}")
 
+# Finished recordings are cached by clients and proxies for a year without revalidation
+RECORDING_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Logos can be replaced, so clients revalidate them (cheaply, with ETag) after an hour
+LOGO_CACHE_CONTROL = 'public, max-age=3600'
+# Logos up to this size are kept in memory after the first request
+LOGO_MEMORY_LIMIT = 1024 * 1024
+
+# Logo bodies: path -> (etag, body), checked against one stat() per request
+_logo_files = {}
+
+def file_etag(st):
+    """Strong ETag from a file's size and modification time."""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def send_logo(logo_path, st):
+    """Serve a logo with ETag/304 support, from memory once it has been read."""
+    etag = file_etag(st)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': email.utils.formatdate(st.st_mtime, usegmt=True),
+        'Cache-Control': LOGO_CACHE_CONTROL,
+    }
+    if is_not_modified([etag], st.st_mtime):
+        return HTTPResponse(status=304, headers=headers)
+    
+    with _cache_lock:
+        cached = _logo_files.get(logo_path)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        try:
+            body = logo_path.read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            abort(404, "Logo not found")
+        if len(body) <= LOGO_MEMORY_LIMIT:
+            with _cache_lock:
+                _logo_files[logo_path] = (etag, body)
+    
+    mime_types = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+    headers['Content-Type'] = mime_types.get(logo_path.suffix.lower(), 'image/png')
+    headers['Content-Length'] = str(len(body))
+    return HTTPResponse(body, headers=headers)
+
 @app.route(f'{ROUTE_PREFIX}/<filename:path>')
 def serve_file(filename):
-    """Serve audio files and other static assets."""
+    """Serve audio files and other static assets, counting requests and bytes sent."""
+    if filename.startswith('logo/'):
+        kind = 'logo'
+    elif filename.startswith('live/'):
+        kind = 'live'
+    else:
+        kind = 'variant' if request.query.get('variant') else 'recording'
+    try:
+        result = _serve_file(filename)
+    except HTTPError as e:
+        count_file_request(kind, e.status_code, 0)
+        raise
+    
+    if isinstance(result, HTTPResponse):
+        # Content-Length is the range length for 206; HEAD and 304 send no body
+        sent = 0
+        if result.status_code in (200, 206) and request.method != 'HEAD':
+            sent = int(result.get_header('Content-Length') or 0)
+        count_file_request(kind, result.status_code, sent)
+    return result
+
+def _serve_file(filename):
+    """Resolve a recording or logo path and send it with static_file()."""
     # Security: prevent directory traversal
     if '..' in filename or filename.startswith('/'):
         abort(403, "Access denied")
@@ -390,14 +2296,16 @@ def serve_file(filename):
             abort(403, "Access denied")
         
         logo_path = LOGO_DIR / logo_filename
-        if not logo_path.exists():
+        try:
+            st = logo_path.stat()
+        except (FileNotFoundError, NotADirectoryError):
             # If default.png doesn't exist, return 404
             abort(404, "Logo not found")
-            
-        suffix = logo_path.suffix.lower()
-        mime_types = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
-        mimetype = mime_types.get(suffix, 'image/png')
-        return static_file(logo_filename, root=str(LOGO_DIR), mimetype=mimetype)
+        return send_logo(logo_path, st)
+
+    # Recordings in progress: /radio/live/<stem>.m3u8 and its segments
+    if filename.startswith('live/'):
+        return send_live(filename[len('live/'):])
 
     # Handle program-specific paths (e.g., /radio/program1/file.m4a)
     # Extract actual filename if it's a program path
@@ -408,7 +2316,17 @@ def serve_file(filename):
     
     file_path = RECORDINGS_DIR / filename
     
-    if not file_path.exists():
+    try:
+        st = file_path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        # Feed URLs are flat; the recording may live in a YYYY/MM/ shard
+        located = locate_recording(RECORDINGS_DIR, filename) if '/' not in filename else None
+        if located is None:
+            abort(404, "File not found")
+        filename = located
+        file_path = RECORDINGS_DIR / filename
+        st = file_path.stat()
+    if not stat.S_ISREG(st.st_mode):
         abort(404, "File not found")
     
     # Determine MIME type (m4a is the primary audio format)
@@ -419,7 +2337,92 @@ def serve_file(filename):
     suffix = file_path.suffix.lower()
     mimetype = mime_types.get(suffix, 'application/octet-stream')
     
-    return static_file(filename, root=str(RECORDINGS_DIR), mimetype=mimetype)
+    # A finished recording never changes: let apps and proxies keep it for good.
+    # One still being written must be revalidated, its ETag changes as it grows.
+    etag = file_etag(st)
+    finished = time.time() - st.st_mtime >= RECORDING_IDLE_SECONDS
+    headers = {'Cache-Control': RECORDING_CACHE_CONTROL if finished else 'no-cache'}
+    
+    # ?variant=low: transcoded copy of a finished recording (one still being
+    # written is served as it is, a transcode of it would be cut short)
+    variant = request.query.get('variant')
+    if variant and variant not in VARIANTS:
+        abort(400, f"Unknown variant: {variant} (available: {', '.join(VARIANTS)})")
+    if variant and finished:
+        # Derived from the original, so it is known before transcoding
+        etag = f'{etag[:-1]}-{variant}"'
+        if is_not_modified([etag], st.st_mtime):
+            return HTTPResponse(status=304, headers=dict(headers, ETag=etag))
+        try:
+            variant_path = get_variant(file_path, Path(filename).name, variant, st)
+        except FuturesTimeoutError:
+            return HTTPResponse(f"Transcoding {variant} variant, retry later", status=503,
+                                headers={'Retry-After': '30', 'Cache-Control': 'no-store'})
+        except Exception as e:
+            abort(500, f"Failed to transcode variant: {e}")
+        return static_file(variant_path.name, root=str(VARIANTS_DIR), mimetype=mimetype, etag=etag, headers=headers)
+    
+    if is_not_modified([etag], st.st_mtime):
+        headers['ETag'] = etag
+        headers['Last-Modified'] = email.utils.formatdate(st.st_mtime, usegmt=True)
+        return HTTPResponse(status=304, headers=headers)
+    
+    return static_file(filename, root=str(RECORDINGS_DIR), mimetype=mimetype, etag=etag, headers=headers)
+
+# ======================================================================
+# Server
+# ======================================================================
+
+class ThreadPoolServer(ServerAdapter):
+    """
+    wsgiref server that handles connections on a bounded thread pool.
+    
+    At most SERVER_THREADS requests run at once; further connections wait in
+    the listen backlog, so one slow download no longer blocks feed polls.
+    """
+    
+    def run(self, handler):
+        pool = ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix='http')
+        slots = threading.BoundedSemaphore(SERVER_THREADS)
+        
+        class PooledWSGIServer(WSGIServer):
+            request_queue_size = SERVER_BACKLOG
+            
+            def process_request(self, request, client_address):
+                # Stop accepting while every thread is busy
+                slots.acquire()
+                pool.submit(self._process_request, request, client_address)
+            
+            def _process_request(self, request, client_address):
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+                    slots.release()
+        
+        WSGIRefServer(self.host, self.port, quiet=self.quiet, server_class=PooledWSGIServer, **self.options).run(handler)
+
+def run_server(host='0.0.0.0', port=8080):
+    """Run the HTTP server selected by SERVER."""
+    if SERVER == 'gunicorn':
+        print(f"Server: gunicorn ({SERVER_WORKERS} workers x {SERVER_THREADS} threads, keep-alive {KEEPALIVE}s)")
+        app.run(
+            server='gunicorn', host=host, port=port,
+            workers=SERVER_WORKERS, worker_class='gthread', threads=SERVER_THREADS,
+            worker_connections=SERVER_MAX_CONNECTIONS, backlog=SERVER_BACKLOG, keepalive=KEEPALIVE,
+            # Threads don't survive fork, so each worker starts its own watcher and warm-up
+            post_fork=lambda server, worker: start_background_tasks(),
+        )
+    elif SERVER == 'wsgiref':
+        print("Server: wsgiref (single-threaded)")
+        start_background_tasks()
+        app.run(host=host, port=port, debug=False, reloader=False)
+    else:
+        print(f"Server: thread pool ({SERVER_THREADS} threads, backlog {SERVER_BACKLOG})")
+        start_background_tasks()
+        app.run(server=ThreadPoolServer, host=host, port=port, debug=False, reloader=False)
 
 # ======================================================================
 # Main
@@ -431,6 +2434,9 @@ if __name__ == '__main__':
     print(f"Authentication: {'Enabled (' + str(len(SECRETS)) + ' secrets)' if SECRETS else 'Disabled (no SECRET)'}")
     print(f"Route prefix: {ROUTE_PREFIX}")
     print(f"Cache TTL: {CACHE_TTL} seconds")
+    print(f"Cache memory limit: {CACHE_MAX_BYTES / 1024 / 1024:.1f} MiB")
+    print(f"Episode catalog: {CATALOG_DB}")
+    print(f"Feed cache: {'shared (' + str(FEED_CACHE_DB) + ')' if _shared_cache else 'per process'}")
     print(f"Base URL: Dynamic (from request headers)")
     print(f"Programs configured: {len(PROGRAMS)}")
     for prog_id, prog_info in PROGRAMS.items():
@@ -439,5 +2445,5 @@ if __name__ == '__main__':
     # Create recordings directory if it doesn't exist
     RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Run server
-    app.run(host='0.0.0.0', port=8080, debug=False, reloader=False)
+    # Run server (each server process also watches the filesystem for changes)
+    run_server(port=int(os.getenv('SERVER_PORT', '8080')))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Match recordings to programs by weekday and start time.
+
+Shared by record.py (schedule, retention) and feed.py (feeds), so a
+recording is counted as the same program's episode everywhere.
+"""
+
+import datetime
+import functools
+
+# A recording belongs to a program if it started within this many minutes of the program
+TOLERANCE_MIN = 5
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# 요일 매핑
+WEEKDAYS = {
+    'MON': 0, 'TUE': 1, 'WED': 2, 'THU': 3, 'FRI': 4, 'SAT': 5, 'SUN': 6
+}
+
+def is_scheduled_on(days_str: str, today: int) -> bool:
+    """
+    Check if a weekday (0 = MON) is within the scheduled days.
+    Supports: ALL, MON-FRI, SAT,SUN, MON,WED,FRI (empty = every day)
+    """
+    if not days_str or days_str.upper() in ['ALL', 'EVERY', '*']:
+        return True
+    
+    days_str = days_str.upper().strip()
+    
+    # 1. Handle List (MON,WED,FRI)
+    if ',' in days_str:
+        days = [d.strip() for d in days_str.split(',')]
+        for d in days:
+            if d in WEEKDAYS and WEEKDAYS[d] == today:
+                return True
+        return False
+        
+    # 2. Handle Range (MON-FRI)
+    if '-' in days_str:
+        try:
+            start_day, end_day = [d.strip() for d in days_str.split('-', 1)]
+            if start_day in WEEKDAYS and end_day in WEEKDAYS:
+                start_idx = WEEKDAYS[start_day]
+                end_idx = WEEKDAYS[end_day]
+                
+                # Handle wraps (e.g., SAT-MON)
+                if start_idx <= end_idx:
+                    return start_idx <= today <= end_idx
+                else:
+                    return today >= start_idx or today <= end_idx
+        except ValueError:
+            pass
+            
+    # 3. Handle Single Day (MON)
+    return days_str in WEEKDAYS and WEEKDAYS[days_str] == today
+
+def start_minute(hhmm):
+    """Minute of day of an HHMM (or HH:MM) time, or None if it isn't one."""
+    hhmm = hhmm.replace(':', '')
+    if len(hhmm) != 4 or not hhmm.isdecimal():
+        return None
+    minute = int(hhmm[:2]) * 60 + int(hhmm[2:])
+    return minute if minute < MINUTES_PER_DAY else None
+
+@functools.lru_cache(maxsize=4096)
+def date_weekday(yyyymmdd):
+    """Weekday (0 = MON) of a YYYYMMDD date, or None if it isn't one."""
+    try:
+        return datetime.date(int(yyyymmdd[:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:8])).weekday()
+    except ValueError:
+        return None
+
+def week_minute(yyyymmdd, minute):
+    """Minute of the week (0 = MON 00:00) of a recording, or None for an invalid date."""
+    weekday = date_weekday(yyyymmdd)
+    return None if weekday is None else weekday * MINUTES_PER_DAY + minute
+
+def build_program_table(starts, tolerance_min=TOLERANCE_MIN):
+    """
+    Map every minute of the week to the program recorded at that time.
+
+    Each minute goes to the program whose start is nearest, counting across
+    midnight, as long as it is within tolerance_min. Only programs scheduled
+    on that day compete for it, so a MON-FRI and a SAT,SUN program at 07:40
+    each keep their own recordings, as do overlapping programs (e.g. 07:40
+    and 07:43). On a tie the program configured first wins.
+
+    Args:
+        starts: (program_id, 'HHMM', days) triples in configuration order,
+            days as in PROGRAMn (e.g. MON-FRI, SAT,SUN, ALL)
+        tolerance_min: Largest distance in minutes between recording and start
+
+    Returns:
+        List of MINUTES_PER_WEEK program ids indexed by week_minute()
+        (None where no program matches)
+    """
+    table = [None] * MINUTES_PER_WEEK
+    distance = [tolerance_min + 1] * MINUTES_PER_WEEK
+    for program_id, hhmm, days in starts:
+        start = start_minute(hhmm)
+        if start is None:
+            continue
+        for weekday in range(7):
+            if not is_scheduled_on(days, weekday):
+                continue
+            week_start = weekday * MINUTES_PER_DAY + start
+            for offset in range(-tolerance_min, tolerance_min + 1):
+                minute = (week_start + offset) % MINUTES_PER_WEEK
+                # Strictly nearer only: the first configured program keeps ties
+                if abs(offset) < distance[minute]:
+                    table[minute] = program_id
+                    distance[minute] = abs(offset)
+    return table
@@ -2,75 +2,73 @@
 
 import os
 import sys
+import json
 import time
+import queue
+import fcntl
+import signal
+import socket
+import threading
 from pathlib import Path
 
 # 외부 라이브러리
 import ffmpeg
 
+# 녹음 요일/시간 → 프로그램 매칭 (feed.py와 공용)
+import program_match
+from program_match import WEEKDAYS, is_scheduled_on
+
 # ======================================================================
 # --- Global Constants ---
 # ======================================================================
 
 import datetime
 
-# 요일 매핑
-WEEKDAYS = {
-    'MON': 0, 'TUE': 1, 'WED': 2, 'THU': 3, 'FRI': 4, 'SAT': 5, 'SUN': 6
-}
-
 def is_today_scheduled(days_str: str) -> bool:
     """
     Check if today is within the scheduled days.
     Supports: ALL, MON-FRI, SAT,SUN, MON,WED,FRI
     """
-    if not days_str or days_str.upper() in ['ALL', 'EVERY', '*']:
-        return True
-    
-    today = datetime.datetime.now().weekday()
-    days_str = days_str.upper().strip()
-    
-    # 1. Handle List (MON,WED,FRI)
-    if ',' in days_str:
-        days = [d.strip() for d in days_str.split(',')]
-        for d in days:
-            if d in WEEKDAYS and WEEKDAYS[d] == today:
-                return True
-        return False
-        
-    # 2. Handle Range (MON-FRI)
-    if '-' in days_str:
-        try:
-            start_day, end_day = [d.strip() for d in days_str.split('-', 1)]
-            if start_day in WEEKDAYS and end_day in WEEKDAYS:
-                start_idx = WEEKDAYS[start_day]
-                end_idx = WEEKDAYS[end_day]
-                
-                # Handle wraps (e.g., SAT-MON)
-                if start_idx <= end_idx:
-                    return start_idx <= today <= end_idx
-                else:
-                    return today >= start_idx or today <= end_idx
-        except ValueError:
-            pass
-            
-    # 3. Handle Single Day (MON)
-    return days_str in WEEKDAYS and WEEKDAYS[days_str] == today
+    return is_scheduled_on(days_str, datetime.datetime.now().weekday())
 
 # 저장 디렉토리
 RECORDINGS_DIR = Path("/app/recordings")
-# Lock 파일 (중복 실행 방지)
-LOCK_FILE = Path("/tmp/radio-record.lock")
+# 저장 레이아웃: flat (RECORDINGS_DIR 바로 아래) 또는 sharded (RECORDINGS_DIR/YYYY/MM/)
+RECORDINGS_LAYOUT = os.getenv('RECORDINGS_LAYOUT', 'flat').lower()
+# 프로그램별 Lock 디렉토리 (녹음 볼륨 안에 두어 docker compose run 컨테이너끼리 공유)
+LOCK_DIR = RECORDINGS_DIR / '.locks'
+# 동시에 진행할 수 있는 최대 녹음 수
+MAX_CONCURRENT_RECORDINGS = int(os.getenv('MAX_CONCURRENT_RECORDINGS', '4'))
+# 녹음 세그먼트 길이 (초): 스트림이 끊겨도 이미 받은 세그먼트는 보존,
+# 녹음 중인 에피소드(live)는 세그먼트 하나가 완성되면 바로 들을 수 있음
+SEGMENT_SECONDS = int(os.getenv('SEGMENT_SECONDS', '10'))
+# 녹음 중임을 feed 서비스에 알리는 파일 (RECORDINGS_DIR/.live-<이름>.json)
+LIVE_MARKER_PREFIX = '.live-'
+# 스트림이 끊기면 재연결 전 대기 시간 (초, 실패할 때마다 두 배로 최대 RECONNECT_MAX_DELAY까지)
+RECONNECT_DELAY = 2
+RECONNECT_MAX_DELAY = 30
+# 입력이 이 시간(초) 동안 멈추면 ffmpeg이 연결이 끊긴 것으로 보고 종료
+STREAM_TIMEOUT = 15
+# 같은 스트림 URL을 동시에 녹음하면 upstream 연결 하나를 나눠 씀 (같은 프로세스 안에서)
+STREAM_SHARING = os.getenv('STREAM_SHARING', 'true').lower() == 'true'
+# 전체 녹음 용량 한도 (예: 50G, 500M, 비어 있으면 제한 없음)
+RECORDINGS_QUOTA = os.getenv('RECORDINGS_QUOTA', '')
+# 이 시간(초) 안에 수정된 파일은 녹음 중일 수 있으므로 삭제하지 않음
+RETENTION_MIN_AGE = 600
 
 # ======================================================================
 # 1. 설정 및 유효성 검사
 # ======================================================================
 
-def parse_programs_config():
+def parse_programs_config(today_only: bool = True):
     """
     Parse PROGRAMS from environment variables.
     Format: PROGRAM1=start-end|days|alias|name|url
     
+    Args:
+        today_only: Skip programs not scheduled for today (False for the daemon,
+                    which checks the days of every start itself)
+    
     Example:
         PROGRAM1=07:40-08:00|MON-FRI|program1|Program Name #1|https://example.com/stream1.m3u8
         PROGRAM2=08:00-08:20|SAT,SUN|program2|Program Name #2|https://example.com/stream2.m3u8
@@ -100,7 +98,7 @@ def parse_programs_config():
         program_url = parts[4] if len(parts) > 4 else ""
             
         # Skip if not scheduled for today
-        if not is_today_scheduled(program_days):
+        if today_only and not is_today_scheduled(program_days):
             continue
             
         # Use global STREAM_URL if program-specific URL is missing
@@ -142,12 +140,12 @@ def parse_programs_config():
         }
     
     if programs:
-        print(f"📋 Loaded {len(programs)} programs for today from environment variables")
+        print(f"📋 Loaded {len(programs)} programs{' for today' if today_only else ''} from environment variables")
         for prog_id, prog_info in programs.items():
             schedules = [f"{s['start']}-{s['end']}" for s in prog_info['schedule']]
             print(f"   - {prog_id}: {prog_info['name']} @ {', '.join(schedules)} ({prog_info['days']})")
     else:
-        print(f"⚠️ No programs scheduled for today")
+        print(f"⚠️ No programs scheduled{' for today' if today_only else ''}")
     
     return programs
 
@@ -174,13 +172,22 @@ def calculate_duration_from_time(start_time: str, end_time: str) -> int:
     except (ValueError, IndexError) as e:
         raise ValueError(f"Failed to parse time range {start_time}-{end_time}: {e}")
 
-def parse_and_validate_args():
+def parse_and_validate_args(now: datetime.datetime = None):
     """
     Parse and validate command line arguments.
     
     Usage:
     - With argument: python record.py 30  (manual execution, duration in minutes)
     - Without argument: python record.py  (auto-calculate from PROGRAMS env var)
+    
+    Args:
+        now: Current time (default: now)
+    
+    Returns:
+        List of (duration_sec, start_time, stream_url, program_id) tuples, one per
+        program that started within the last 5 minutes and is still on air, with
+        its remaining duration (closest start first, see in_progress()). Manual
+        execution returns a single entry with no start time and no program.
     """
     # Check if duration is provided as command line argument
     if len(sys.argv) > 1:
@@ -196,8 +203,8 @@ def parse_and_validate_args():
             if not manual_url:
                 sys.stderr.write("ERROR: STREAM_URL environment variable must be set for manual execution.\\n")
                 sys.exit(1)
-            # Return duration, None for start_time, and manual_url
-            return (duration_min * 60, None, manual_url)
+            # Duration, None for start_time, manual_url and no program
+            return [(duration_min * 60, None, manual_url, None)]
         except ValueError:
             sys.stderr.write("ERROR: Duration must be an integer (minutes).\\n")
             sys.stderr.write(f"Usage: {sys.argv[0]} [duration_minutes]\\n")
@@ -206,77 +213,152 @@ def parse_and_validate_args():
     
     # Auto-calculate duration from PROGRAMS environment variable (systemd timer mode)
     print("🤖 Auto-execution mode: checking for scheduled programs...")
-    programs = parse_programs_config()
+    # Every day's programs: in_progress() checks the days, including yesterday's for shows past midnight
+    programs = parse_programs_config(today_only=False)
     
     if not programs:
         print(f"❌ ERROR: No PROGRAMS configured in environment variables")
         print(f"   Please set PROGRAM1, PROGRAM2, etc. in .env file")
         sys.exit(1)
     
-    # Get current time in HHMM format
-    current_time = time.strftime('%H%M', time.localtime())
-    current_hour = int(current_time[:2])
-    current_min = int(current_time[2:])
-    current_total_min = current_hour * 60 + current_min
-    
-    # Find matching program schedule
-    best_match = None
-    min_diff = float('inf')
-    
-    for program_id, program_info in programs.items():
-        for schedule in program_info['schedule']:
-            start_time = schedule['start']
-            end_time = schedule['end']
-            
-            try:
-                start_hour = int(start_time[:2])
-                start_min = int(start_time[2:])
-                start_total_min = start_hour * 60 + start_min
-                
-                # Check if current time is within 0-5 minutes after start time
-                diff = current_total_min - start_total_min
-                
-                if 0 <= diff <= 5 and diff < min_diff:
-                    min_diff = diff
-                    best_match = {
-                        'program_id': program_id,
-                        'program_name': program_info['name'],
-                        'start': start_time,
-                        'end': end_time,
-                        'url': program_info['url']
-                    }
-            except (ValueError, IndexError):
-                continue
-    
-    if best_match:
-        duration_sec = calculate_duration_from_time(best_match['start'], best_match['end'])
-        print(f"🎯 Matched program: {best_match['program_name']}")
-        print(f"⏰ Time range: {best_match['start']}-{best_match['end']}")
-        print(f"⏱️  Auto-calculated duration: {duration_sec // 60} minutes")
-        # Return duration, start time, and url
-        return (duration_sec, best_match['start'], best_match['url'])
+    # Programs on air that started within the window (overlapping programs are recorded together),
+    # each for the rest of its show: one that has already ended is not recorded again
+    now = now or datetime.datetime.now()
+    result = in_progress(programs, now)
+    for duration_sec, start_time, url, program_id in result:
+        end_time = programs[program_id]['schedule'][0]['end']
+        print(f"🎯 Matched program: {programs[program_id]['name']}")
+        print(f"⏰ Time range: {start_time}-{end_time}")
+        print(f"⏱️  Remaining duration: {duration_sec // 60} minutes ({duration_sec} seconds)")
+    if result:
+        return result
     
+    current_time = f"{now:%H%M}"
     # No matching program found - this is normal, just exit quietly
     print(f"ℹ️  No matching program for current time {current_time} (within 5-minute window)")
-    print(f"   This is normal - timer runs every minute, lock file prevents conflicts")
+    print(f"   This is normal - timer runs every minute, program locks prevent duplicates")
     sys.exit(0)
 
 # ======================================================================
-# 2. 녹음 실행
+# 2. 프로그램별 Lock
 # ======================================================================
 
-def execute_recording(sec: int, stream_url: str, start_time: str = None) -> Path:
+# 이 프로세스가 잡고 있는 Lock: 경로 -> flock()된 파일 디스크립터
+_held_locks = {}
+_held_locks_lock = threading.Lock()
+
+def lock_path(program_id: str) -> Path:
+    """Lock file of a program (manual recordings share one lock)."""
+    return LOCK_DIR / f"{program_id or 'manual'}.lock"
+
+def is_lock_held(path: Path) -> bool:
+    """
+    Check whether a recorder holds a lock.
+    
+    Locks are flock()ed for as long as the recording runs and the kernel
+    drops them when the process dies, so a lock file left behind by a
+    killed recorder (or container) is never mistaken for a live one.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def active_locks() -> list:
+    """Locks of recordings in progress (files left by dead recorders are ignored)."""
+    return [path for path in LOCK_DIR.glob('*.lock') if is_lock_held(path)]
+
+def acquire_lock(program_id: str, duration_sec: int):
+    """
+    Take a program's lock for the length of its recording.
+    
+    The lock is an flock() on the lock file, kept until release_lock().
+    A leftover file of a dead recorder is simply locked again. If the file
+    was replaced between open() and flock() (released and removed by its
+    holder meanwhile), the new file is locked instead, so two recorders
+    can never both hold a program's lock.
+    
+    Returns:
+        Lock path, or None if the program is already being recorded
+    """
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    path = lock_path(program_id)
+    
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and current.st_ino == os.fstat(fd).st_ino:
+            break
+        os.close(fd)
+    
+    # Who holds the lock, for people looking at .locks/
+    info = {
+        'program_id': program_id,
+        'pid': os.getpid(),
+        'host': socket.gethostname(),
+        'started': time.time(),
+        'expected_end': time.time() + duration_sec,
+    }
+    os.ftruncate(fd, 0)
+    os.write(fd, json.dumps(info).encode('utf-8'))
+    with _held_locks_lock:
+        _held_locks[path] = fd
+    return path
+
+def release_lock(path: Path):
+    """Release a lock taken by acquire_lock() and remove its file."""
+    with _held_locks_lock:
+        fd = _held_locks.pop(path, None)
+    if fd is None:
+        return
+    # Removed while still locked: a recorder waiting on this file notices and retries
+    path.unlink(missing_ok=True)
+    os.close(fd)
+    print(f"🔓 Lock released: {path.name}")
+
+# ======================================================================
+# 3. 녹음 실행
+# ======================================================================
+
+def recording_directory(date_str: str) -> Path:
+    """
+    Return the directory a recording of the given date (YYYYMMDD) is saved in.
+    
+    With RECORDINGS_LAYOUT=sharded recordings go to YYYY/MM/ subdirectories,
+    so no single directory grows without bound. Feed URLs stay flat.
+    """
+    if RECORDINGS_LAYOUT == 'sharded':
+        return RECORDINGS_DIR / date_str[:4] / date_str[4:6]
+    return RECORDINGS_DIR
+
+def execute_recording(sec: int, stream_url: str, start_time: str = None, program_id: str = None) -> Path:
     """
     FFmpeg을 사용하여 녹음을 실행하고, 생성된 파일 경로를 반환합니다.
     
+    스트림은 숨김 임시 파일(.<name>.part)에 녹음되고, finalize_recording()을
+    거쳐 완성된 파일만 최종 이름으로 나타납니다.
+    
     Args:
         sec: 녹음 시간 (초)
         stream_url: 라디오 스트림 URL
         start_time: 프로그램 시작 시간 (HHMM format), None이면 현재 시간 사용
+        program_id: 녹음하는 프로그램 별칭 (메타데이터용, 수동 녹음은 None)
     """
-    # 디렉토리 생성
-    RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
-    
     # Use program start time if provided, otherwise use current time
     if start_time:
         # Convert HHMM to HH:MM for time formatting
@@ -288,81 +370,1013 @@ def execute_recording(sec: int, stream_url: str, start_time: str = None) -> Path
         DATE_TIME = time.strftime('%Y%m%d-%H%M', time.localtime())
     
     SUFFIX = hex(int(time.time() * 1000000))[2:10] 
-    output_file = RECORDINGS_DIR / f"{DATE_TIME}-{SUFFIX}.m4a"
+    
+    # 디렉토리 생성
+    output_dir = recording_directory(DATE_TIME[:8])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / f"{DATE_TIME}-{SUFFIX}.m4a"
+    raw_file = output_dir / f".{output_file.name}.part"
+    # Segments: .<stem>.<attempt>-<index>.ts, listed in .<stem>.<attempt>.csv as they complete
+    segment_prefix = output_dir / f".{output_file.stem}"
+    segments = []
+    marker = None
 
     print(f"\\n--- Recording Started ---")
     print(f"File: {output_file.resolve()}")
     print(f"Duration: {sec // 60} minutes ({sec} seconds)")
 
     try:
-        # FFmpeg-python을 사용하여 명령 구성 및 실행
-        (
-            ffmpeg
-            .input(stream_url, t=str(sec)) 
-            .output(
-                str(output_file),
-                vn=None,           
-                acodec='copy'      
-            )
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
-        )
+        # 세그먼트로 녹음 (끊기면 재연결), 종료 시간에 무손실로 이어 붙임
+        started = datetime.datetime.now().astimezone()
+        marker = write_live_marker(output_file, program_id, started, sec)
+        segments, gaps = record_segments(stream_url, sec, segment_prefix)
+        ended = datetime.datetime.now().astimezone()
+        if not segments:
+            sys.stderr.write("ERROR: No audio was captured from the stream.\\n")
+            sys.exit(1)
         
+        concat_segments(segments, raw_file)
+        finalize_recording(raw_file, output_file, program_id, started, ended,
+                           extra={'segments': len(segments), 'gaps': gaps})
+        for segment in segments + list(output_dir.glob(f"{segment_prefix.name}.*.csv")):
+            segment.unlink(missing_ok=True)
         print(f"✅ SUCCESS: Recording saved to {output_file}")
-        
-        # Write cache invalidation file to trigger feed cache refresh
-        try:
-            invalidation_file = RECORDINGS_DIR / '.last_recording'
-            invalidation_file.touch()
-            print(f"📝 Cache invalidation file updated: {invalidation_file}")
-        except Exception as cache_error:
-            print(f"⚠️ WARNING: Failed to update cache invalidation file: {cache_error}")
-        
+        # The feed service notices the new file itself (directory watcher)
         return output_file
         
     except ffmpeg.Error as e:
-        sys.stderr.write(f"ERROR: FFMPEG command failed (Exit Code: {e.returncode}).\\n")
+        sys.stderr.write("ERROR: FFMPEG command failed.\\n")
         sys.stderr.write(f"FFmpeg Stderr: {e.stderr.decode('utf8', errors='ignore')}\\n")
-        if output_file.exists():
-             output_file.unlink() # 실패한 파일 삭제
+        if raw_file.exists():
+             raw_file.unlink() # 실패한 파일 삭제
+        if segments:
+            # Captured audio is kept for manual recovery
+            sys.stderr.write(f"Segments kept: {segment_prefix}.*.ts\\n")
         sys.exit(1)
     except FileNotFoundError:
         sys.stderr.write("FATAL ERROR: 'ffmpeg' command not found. Ensure it is installed and in PATH.\\n")
         sys.exit(1)
+    finally:
+        if marker is not None:
+            marker.unlink(missing_ok=True)
+
+def live_marker_path(output_file: Path) -> Path:
+    """녹음 중 표시 파일 경로 (shard와 관계없이 RECORDINGS_DIR 바로 아래)"""
+    return RECORDINGS_DIR / f"{LIVE_MARKER_PREFIX}{output_file.stem}.json"
+
+def write_live_marker(output_file: Path, program_id: str, started, sec: int):
+    """
+    Announce a recording in progress, so the feed can list it as a live episode.
+    
+    The feed serves its completed segments as an HLS playlist until the
+    marker is removed at the end of the recording.
+    
+    Returns:
+        Path of the marker, or None if it could not be written
+    """
+    path = live_marker_path(output_file)
+    marker = {
+        'name': output_file.name,
+        'program_id': program_id,
+        'dir': str(output_file.parent.relative_to(RECORDINGS_DIR)),
+        'started': started.isoformat(timespec='seconds'),
+        'ends': (started + datetime.timedelta(seconds=sec)).isoformat(timespec='seconds'),
+        'segment_seconds': SEGMENT_SECONDS,
+    }
+    tmp = path.with_name(f"{path.name}.tmp")
+    try:
+        tmp.write_text(json.dumps(marker))
+        os.replace(tmp, path)
+        return path
+    except OSError as e:
+        print(f"⚠️ WARNING: Failed to write live marker {path}: {e}")
+        tmp.unlink(missing_ok=True)
+        return None
+
+# 종료 요청 (SIGTERM/SIGINT): 녹음을 멈추고 지금까지 녹음한 부분을 저장
+_stop = threading.Event()
+# 녹음 중인 ffmpeg 프로세스 (종료 요청 시 멈춤)
+_captures = set()
+_captures_lock = threading.Lock()
+
+def start_capture(command, **kwargs):
+    """Start a capture's ffmpeg, registered so stop_captures() can end it."""
+    with _captures_lock:
+        process = command.run_async(**kwargs)
+        _captures.add(process)
+        if _stop.is_set():
+            # Stop was requested while it was starting
+            process.terminate()
+    return process
+
+def end_capture(process):
+    with _captures_lock:
+        _captures.discard(process)
+
+def stop_captures():
+    """
+    End every capture now: ffmpeg exits cleanly on SIGTERM, so the segments
+    written so far stay complete and the recordings are saved as they are.
+    """
+    with _captures_lock:
+        for process in _captures:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+
+def request_stop(signum, frame):
+    """Signal handler: stop scheduling and finish the recordings in progress early."""
+    print(f"🛑 Received signal {signum}, stopping recordings")
+    _stop.set()
+    stop_captures()
+
+def handle_stop_signals():
+    """
+    Stop on SIGTERM/SIGINT by saving the recordings in progress, releasing
+    their locks and live markers, instead of being killed mid-recording.
+    """
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+def capture_segments(stream_url: str, seconds: int, pattern: str, segment_list: str):
+    """
+    Capture the stream into time-bounded MPEG-TS segments with one ffmpeg run.
+    
+    MPEG-TS stays readable up to the last packet, so a run cut short by a
+    dropped stream loses nothing it already wrote.
+    
+    With STREAM_SHARING the stream is read from a StreamRelay shared with
+    every other recording of the same URL; when the relay ends, so does
+    this run, and record_segments() reconnects as for a dropped stream.
+    
+    Args:
+        stream_url: 라디오 스트림 URL
+        seconds: 최대 녹음 시간 (초)
+        pattern: 세그먼트 파일 경로 패턴 (%04d = 세그먼트 번호)
+        segment_list: 완성된 세그먼트 목록 (CSV: 파일명,시작,끝) 경로
+    """
+    if STREAM_SHARING:
+        source = ffmpeg.input('pipe:', format='mpegts', t=str(seconds))
+    else:
+        source = ffmpeg.input(stream_url, t=str(seconds), rw_timeout=str(STREAM_TIMEOUT * 1000000))
+    command = (
+        source
+        .output(
+            pattern,
+            vn=None,
+            acodec='copy',
+            format='segment',
+            segment_time=SEGMENT_SECONDS,
+            segment_format='mpegts',
+            segment_list=segment_list,
+            segment_list_type='csv'
+        )
+        .overwrite_output()
+    )
+    if not STREAM_SHARING:
+        process = start_capture(command, pipe_stdout=True, pipe_stderr=True)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            end_capture(process)
+        if process.returncode:
+            raise ffmpeg.Error('ffmpeg', stdout, stderr)
+        return
+    
+    process = start_capture(command, pipe_stdin=True, pipe_stderr=True)
+    try:
+        try:
+            relay = join_relay(stream_url, process.stdin)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        try:
+            # stdin is written by the relay; ffmpeg exits at t seconds or when the relay closes it
+            stderr = process.stderr.read()
+            process.wait()
+        finally:
+            relay.leave(process.stdin)
+    finally:
+        end_capture(process)
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', b'', stderr)
+
+class StreamRelay:
+    """
+    One upstream connection to a stream, copied to every recording of it.
+    
+    ffmpeg pulls the stream once and remuxes it (stream copy) to MPEG-TS on
+    stdout; a reader thread hands each chunk to the stdin of the subscribed
+    recordings' ffmpeg processes, each through its own queue and writer
+    thread so a slow recording can't hold up the others. The relay stops
+    when its last subscriber leaves; when the upstream ends, every
+    subscriber's input ends with it.
+    """
+    
+    # MPEG-TS packet size: a late subscriber starts at a packet boundary
+    PACKET_SIZE = 188
+    CHUNK_SIZE = PACKET_SIZE * 348
+    # Chunks buffered for a subscriber (about 16 MiB) before it is dropped
+    QUEUE_CHUNKS = 256
+    
+    def __init__(self, url: str):
+        self.url = url
+        self.subscribers = {}   # stdin pipe -> queue of chunks (None = end of stream)
+        self.position = 0       # bytes read from upstream
+        self.closed = False
+        self.stopping = False
+        self.error = ''
+        self.process = None
+        self.lock = threading.Lock()
+    
+    def open_upstream(self):
+        return (
+            ffmpeg
+            .input(self.url, rw_timeout=str(STREAM_TIMEOUT * 1000000))
+            .output('pipe:', vn=None, acodec='copy', format='mpegts')
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+    
+    def start(self):
+        self.process = self.open_upstream()
+        threading.Thread(target=self._read, name='relay-reader', daemon=True).start()
+        threading.Thread(target=self._read_errors, name='relay-stderr', daemon=True).start()
+    
+    def join(self, pipe):
+        """Start copying the stream to pipe (called with _relays_lock held)."""
+        chunks = queue.Queue(maxsize=self.QUEUE_CHUNKS)
+        with self.lock:
+            self.subscribers[pipe] = chunks
+            # Skip to the next packet boundary of the chunk that comes next
+            skip = -self.position % self.PACKET_SIZE
+            count = len(self.subscribers)
+        threading.Thread(target=self._write, args=(pipe, chunks, skip), name='relay-writer', daemon=True).start()
+        return count
+    
+    def leave(self, pipe):
+        """Stop copying to pipe; the last subscriber to leave stops the upstream."""
+        with _relays_lock:
+            with self.lock:
+                chunks = self.subscribers.pop(pipe, None)
+                last = not self.subscribers and not self.closed
+                if last:
+                    self.closed = self.stopping = True
+                    if _relays.get(self.url) is self:
+                        del _relays[self.url]
+        if chunks is not None:
+            self._end(chunks)
+        if last:
+            self.process.terminate()
+    
+    def _read(self):
+        while True:
+            chunk = self.process.stdout.read1(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            with self.lock:
+                self.position += len(chunk)
+                dropped = []
+                for pipe, chunks in self.subscribers.items():
+                    try:
+                        chunks.put_nowait(chunk)
+                    except queue.Full:
+                        dropped.append(pipe)
+                for pipe in dropped:
+                    print(f"⚠️ WARNING: Recording of {self.url} fell behind the shared stream, disconnecting it")
+                    self._end(self.subscribers.pop(pipe))
+        self.process.wait()
+        
+        with _relays_lock:
+            with self.lock:
+                self.closed = True
+                if _relays.get(self.url) is self:
+                    del _relays[self.url]
+                remaining = list(self.subscribers.values())
+                self.subscribers.clear()
+        for chunks in remaining:
+            self._end(chunks)
+        if not self.stopping:
+            print(f"⚠️ WARNING: Shared stream {self.url} ended ({self.error or 'no error'})")
+    
+    def _read_errors(self):
+        for line in self.process.stderr:
+            line = line.decode('utf8', errors='ignore').strip()
+            if line:
+                self.error = line
+    
+    def _end(self, chunks):
+        """Tell a subscriber's writer that the stream ended."""
+        while True:
+            try:
+                chunks.put_nowait(None)
+                return
+            except queue.Full:
+                # The subscriber is being dropped: its backlog is discarded
+                try:
+                    chunks.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    def _write(self, pipe, chunks, skip):
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if skip:
+                    chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                    if not chunk:
+                        continue
+                pipe.write(chunk)
+                pipe.flush()
+        except (BrokenPipeError, ValueError, OSError):
+            # The recording's ffmpeg exited (t reached) or the pipe was closed
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+# Running relays: stream URL -> StreamRelay
+_relays = {}
+_relays_lock = threading.Lock()
+
+def join_relay(stream_url: str, pipe) -> StreamRelay:
+    """Copy the stream to pipe, through the running relay of the URL or a new one."""
+    with _relays_lock:
+        relay = _relays.get(stream_url)
+        if relay is None:
+            relay = StreamRelay(stream_url)
+            relay.start()
+            _relays[stream_url] = relay
+        count = relay.join(pipe)
+    if count > 1:
+        print(f"🔗 Sharing the stream connection with {count - 1} other recording(s): {stream_url}")
+    return relay
+
+def captured_seconds(segment_list: Path) -> float:
+    """Media seconds a capture wrote, from the end times in its segment list (0 if none)."""
+    try:
+        lines = segment_list.read_text(encoding='utf-8').splitlines()
+    except OSError:
+        return 0.0
+    end = 0.0
+    for line in lines:
+        try:
+            end = max(end, float(line.rsplit(',', 1)[1]))
+        except (IndexError, ValueError):
+            continue
+    return end
+
+def record_segments(stream_url: str, sec: int, prefix: Path):
+    """
+    Record until sec seconds have passed, reconnecting with backoff whenever the stream fails.
+    
+    A capture that ends without error after writing the requested media time
+    completes the recording even if less wall-clock time has passed: a live
+    stream starts with a backlog (HLS live_start_index, Icecast's burst on
+    connect), which ffmpeg reads faster than real time.
+    
+    On a stop request (see request_stop()) the recording ends early with
+    what was captured so far.
+    
+    Args:
+        stream_url: 라디오 스트림 URL
+        sec: 녹음 시간 (초), 재연결에 걸린 시간 포함
+        prefix: 세그먼트 파일 경로 접두어
+    
+    Returns:
+        (segments, gaps): segment paths in order, and the missing parts as dicts
+        with 'start'/'end' (ISO time), 'seconds' and 'offset' (position in the
+        stitched recording, seconds)
+    """
+    deadline = time.monotonic() + sec
+    delay = RECONNECT_DELAY
+    segments = []
+    gaps = []
+    captured = 0.0
+    gap_start = None    # time.monotonic() when audio stopped
+    attempt = 0
+    
+    def add_gap(start, end):
+        now = datetime.datetime.now().astimezone()
+        wall = lambda mono: now - datetime.timedelta(seconds=time.monotonic() - mono)
+        gaps.append({
+            'start': wall(start).isoformat(timespec='seconds'),
+            'end': wall(end).isoformat(timespec='seconds'),
+            'seconds': round(end - start, 1),
+            'offset': round(captured, 1),
+        })
+    
+    while not _stop.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining < 1:
+            break
+        attempt += 1
+        requested = int(remaining + 0.999)
+        segment_list = Path(f"{prefix}.{attempt:02d}.csv")
+        began = time.monotonic()
+        error = None
+        try:
+            capture_segments(stream_url, requested, f"{prefix}.{attempt:02d}-%04d.ts", str(segment_list))
+        except ffmpeg.Error as e:
+            error = e
+        stopped = time.monotonic()
+        elapsed = stopped - began
+        media = captured_seconds(segment_list)
+        
+        new = [p for p in sorted(prefix.parent.glob(f"{prefix.name}.{attempt:02d}-*.ts")) if p.stat().st_size > 0]
+        if new:
+            if gap_start is not None:
+                add_gap(gap_start, began)
+                gap_start = None
+            segments += new
+            captured += media or elapsed
+            if elapsed >= 60:
+                delay = RECONNECT_DELAY
+        
+        # ffmpeg stopped at t: the recording is complete, however long that took
+        if error is None and media >= requested - 1:
+            break
+        remaining = deadline - stopped
+        if remaining < 1 or _stop.is_set():
+            break
+        
+        # The stream failed or ended early: note where audio stopped, wait and reconnect
+        if gap_start is None:
+            gap_start = stopped if new else began
+        reason = error.stderr.decode('utf8', errors='ignore').strip().splitlines()[-1:] if error and error.stderr else []
+        print(f"⚠️ WARNING: Stream stopped after {elapsed:.0f}s ({reason[0] if reason else 'ended'}), "
+              f"reconnecting in {delay}s ({remaining:.0f}s left)")
+        _stop.wait(min(delay, remaining))
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    
+    if gap_start is not None and segments:
+        add_gap(gap_start, min(time.monotonic(), deadline))
+    if _stop.is_set():
+        print(f"🛑 Recording stopped early, saving {captured:.0f}s captured so far")
+    if gaps:
+        print(f"⚠️ Recording has {len(gaps)} gap(s), {sum(g['seconds'] for g in gaps):.0f}s missing in total")
+    return segments, gaps
+
+def concat_segments(segments: list, target: Path):
+    """Join segments into one .m4a with stream copy (no re-encoding)."""
+    list_file = target.with_name(f"{target.name}.txt")
+    # concat demuxer quoting: ' inside a quoted path is written as '\''
+    quoted = (str(segment.resolve()).replace("'", "'\\''") for segment in segments)
+    list_file.write_text(''.join(f"file '{path}'\n" for path in quoted))
+    try:
+        (
+            ffmpeg
+            .input(str(list_file), format='concat', safe=0)
+            .output(str(target), c='copy', format='ipod', **{'bsf:a': 'aac_adtstoasc'})
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    finally:
+        list_file.unlink(missing_ok=True)
 
 # ======================================================================
-# 메인 실행 함수
+# 4. 후처리 (faststart, 검증, 메타데이터)
 # ======================================================================
 
-def main():
+def sidecar_path(recording: Path) -> Path:
+    """Metadata file written next to a recording: 20251222-0740-xxxx.m4a -> 20251222-0740-xxxx.json"""
+    return recording.with_suffix('.json')
+
+def probe_recording(path: Path) -> dict:
     """
-    녹음 워크플로우를 실행하는 메인 함수
+    Verify a recording with ffprobe.
+    
+    Returns:
+        Dict with 'duration' (seconds), 'bitrate' (bit/s), 'codec', 'sample_rate' and 'channels'
+    
+    Raises:
+        ValueError: No audio stream or no duration (e.g. a truncated file)
+        ffmpeg.Error: ffprobe could not read the file
     """
-    # Check for lock file (prevent concurrent executions)
-    if LOCK_FILE.exists():
-        print(f"ℹ️  Another recording is in progress (lock file exists)")
-        print(f"   Skipping this execution to prevent conflicts")
-        sys.exit(0)
+    info = ffmpeg.probe(str(path))
+    audio = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), None)
+    duration = float(info.get('format', {}).get('duration') or 0)
+    if audio is None or duration <= 0:
+        raise ValueError(f"no playable audio in {path.name}")
+    return {
+        'duration': round(duration, 3),
+        'bitrate': int(info['format'].get('bit_rate') or audio.get('bit_rate') or 0),
+        'codec': audio.get('codec_name'),
+        'sample_rate': int(audio.get('sample_rate') or 0),
+        'channels': audio.get('channels'),
+    }
+
+def remux_faststart(source: Path, target: Path):
+    """Copy the audio into a new file with the moov atom first (no re-encoding)."""
+    (
+        ffmpeg
+        .input(str(source))
+        .output(str(target), c='copy', movflags='+faststart', format='ipod')
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+
+def finalize_recording(raw_file: Path, output_file: Path, program_id: str, started, ended, extra: dict = None) -> Path:
+    """
+    녹음 후처리: faststart로 다시 쓰고, ffprobe로 검증하고, 메타데이터를 저장합니다.
+    
+    1. moov atom을 파일 앞으로 옮겨 (remux, 재인코딩 없음) 다운로드가 끝나기 전에 재생 가능
+    2. ffprobe로 오디오와 재생 시간 확인
+    3. <name>.json에 재생 시간, 비트레이트, 프로그램, 실제 시작/종료 시간 저장
+       (피드 서비스는 이 파일이 있으면 오디오를 분석하지 않음)
+    4. 완성된 파일을 최종 이름으로 원자적으로 교체
+    
+    remux나 검증이 실패하면 원본 녹음을 그대로 사용합니다 (녹음은 버리지 않음).
     
+    Args:
+        raw_file: ffmpeg이 녹음한 임시 파일
+        output_file: 최종 녹음 파일 경로
+        program_id: 프로그램 별칭 (수동 녹음은 None)
+        started: 실제 녹음 시작 시간 (datetime)
+        ended: 실제 녹음 종료 시간 (datetime)
+        extra: 메타데이터에 추가할 항목 (예: 세그먼트 수와 끊긴 구간)
+    """
+    remuxed = raw_file.with_name(f".{output_file.name}.faststart")
+    source = raw_file
+    info = None
     try:
-        # Create lock file
-        LOCK_FILE.touch()
-        print(f"🔒 Lock file created: {LOCK_FILE}")
+        remux_faststart(raw_file, remuxed)
+        info = probe_recording(remuxed)
+        source = remuxed
+        print(f"⚡ Remuxed for fast start and verified ({info['duration']:.0f}s, {info['bitrate'] // 1000} kbps)")
+    except (ffmpeg.Error, ValueError, OSError) as e:
+        detail = e.stderr.decode('utf8', errors='ignore')[-300:] if getattr(e, 'stderr', None) else e
+        print(f"⚠️ WARNING: Fast start remux failed, keeping the recording as is: {detail}")
+        try:
+            info = probe_recording(raw_file)
+        except (ffmpeg.Error, ValueError, OSError) as e:
+            print(f"⚠️ WARNING: ffprobe could not verify the recording: {e}")
+    
+    if info is not None:
+        metadata = dict(info,
+                        program_id=program_id,
+                        started=started.isoformat(timespec='seconds'),
+                        ended=ended.isoformat(timespec='seconds'),
+                        size=source.stat().st_size,
+                        faststart=source == remuxed,
+                        **(extra or {}))
+        sidecar = sidecar_path(output_file)
+        partial = sidecar.with_name(f".{sidecar.name}.part")
+        try:
+            partial.write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding='utf-8')
+            # Written before the recording appears, so the feed finds it on first sight
+            os.replace(partial, sidecar)
+        except OSError as e:
+            print(f"⚠️ WARNING: Failed to write metadata {sidecar}: {e}")
+    
+    os.replace(source, output_file)
+    for leftover in (raw_file, remuxed):
+        leftover.unlink(missing_ok=True)
+    return output_file
+
+# ======================================================================
+# 5. 보관 정책 (Retention)
+# ======================================================================
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_size(value: str) -> int:
+    """
+    Parse a byte size with an optional K/M/G/T suffix.
+    Example: '50G' -> 53687091200, '1024' -> 1024
+    """
+    value = value.strip().upper().removesuffix('B')
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+def parse_retention_config():
+    """
+    Parse retention policies from environment variables.
+    
+    Every PROGRAMn counts regardless of today's schedule, with optional:
+        PROGRAMn_KEEP=30        keep the newest 30 episodes
+        PROGRAMn_KEEP_DAYS=90   keep episodes recorded in the last 90 days
+    and a global byte quota for the whole archive:
+        RECORDINGS_QUOTA=50G
+    
+    Returns:
+        (policies, quota): {program_id: {'start', 'days', 'keep', 'keep_days'}} in
+        PROGRAMn order, and the quota in bytes (None if unlimited)
+    """
+    policies = {}
+    for i in range(1, 51):
+        program_str = os.getenv(f'PROGRAM{i}')
+        if not program_str:
+            break
         
-        # 1. 설정 및 유효성 검사
-        duration_sec, start_time, stream_url = parse_and_validate_args()
+        parts = [p.strip() for p in program_str.split('|')]
+        if len(parts) < 4 or '-' not in parts[0] or not parts[2]:
+            continue
         
-        # 2. 녹음 실행
-        output_file = execute_recording(duration_sec, stream_url, start_time)
+        policy = {'start': parts[0].split('-', 1)[0].strip().replace(':', ''), 'days': parts[1],
+                  'keep': None, 'keep_days': None}
+        for key, env in (('keep', f'PROGRAM{i}_KEEP'), ('keep_days', f'PROGRAM{i}_KEEP_DAYS')):
+            value = os.getenv(env, '').strip()
+            if not value:
+                continue
+            try:
+                policy[key] = int(value)
+                if policy[key] < 1:
+                    raise ValueError
+            except ValueError:
+                print(f"⚠️ WARNING: Ignoring invalid {env}: {value} (expected a positive integer)")
+                policy[key] = None
+        policies[parts[2]] = policy
+    
+    quota = None
+    if RECORDINGS_QUOTA.strip():
+        try:
+            quota = parse_size(RECORDINGS_QUOTA)
+        except ValueError:
+            print(f"⚠️ WARNING: Ignoring invalid RECORDINGS_QUOTA: {RECORDINGS_QUOTA} (expected e.g. 50G)")
+    
+    return policies, quota
+
+def list_recordings() -> list:
+    """
+    List recordings in RECORDINGS_DIR and its YYYY/MM shards, oldest first.
+    
+    Only files named YYYYMMDD-HHMM-*.m4a are listed, so nothing else in the
+    directory is ever deleted.
+    
+    Returns:
+        List of dicts with 'path', 'recorded' (datetime), 'size' and 'mtime'
+    """
+    directories = [RECORDINGS_DIR]
+    directories += sorted(RECORDINGS_DIR.glob('[0-9][0-9][0-9][0-9]/[0-9][0-9]'))
+    
+    recordings = []
+    for directory in directories:
+        for path in directory.glob('*.m4a'):
+            try:
+                recorded = datetime.datetime.strptime(path.name[:13], '%Y%m%d-%H%M')
+                st = path.stat()
+            except (ValueError, OSError):
+                continue
+            recordings.append({'path': path, 'recorded': recorded, 'size': st.st_size, 'mtime': st.st_mtime})
+    
+    recordings.sort(key=lambda r: (r['recorded'], r['path'].name))
+    return recordings
+
+def retention_table(policies):
+    """Week minute table of the policies' programs, see program_match.build_program_table()."""
+    return program_match.build_program_table(
+        (program_id, policy['start'], policy['days']) for program_id, policy in policies.items())
+
+def recording_program(recorded, policies, table=None):
+    """
+    Return the id of the program scheduled on a recording's weekday whose
+    start time is nearest it (within tolerance), or None.
+    
+    Same matching as the feed (program_match), so retention counts the
+    episodes each program's feed shows.
+    """
+    if table is None:
+        table = retention_table(policies)
+    return table[recorded.weekday() * program_match.MINUTES_PER_DAY + recorded.hour * 60 + recorded.minute]
+
+def select_expired(recordings, policies, quota, now=None) -> list:
+    """
+    Choose the recordings to delete, oldest first.
+    
+    Per-program KEEP/KEEP_DAYS policies are applied first. If the remaining
+    archive is still larger than the quota, the oldest recordings of any
+    program are added until it fits. Files modified in the last
+    RETENTION_MIN_AGE seconds may still be recording and are never chosen.
+    
+    Args:
+        recordings: Output of list_recordings() (oldest first)
+        policies: Program policies from parse_retention_config()
+        quota: Byte limit for the whole archive, or None
+        now: Current time as a datetime, for KEEP_DAYS (for tests)
+    
+    Returns:
+        List of (recording, program_id, reason) tuples, oldest first
+    """
+    now = now or datetime.datetime.now()
+    deletable = lambda r: time.time() - r['mtime'] >= RETENTION_MIN_AGE
+    
+    expired = {}
+    by_program = {}
+    table = retention_table(policies)
+    for recording in recordings:
+        program_id = recording_program(recording['recorded'], policies, table)
+        recording['program_id'] = program_id
+        if program_id:
+            by_program.setdefault(program_id, []).append(recording)
+    
+    for program_id, episodes in by_program.items():
+        policy = policies[program_id]
+        for index, recording in enumerate(reversed(episodes)):
+            if not deletable(recording):
+                continue
+            if policy['keep'] and index >= policy['keep']:
+                expired[recording['path']] = (recording, program_id, f"keep {policy['keep']}")
+            elif policy['keep_days'] and now - recording['recorded'] > datetime.timedelta(days=policy['keep_days']):
+                expired[recording['path']] = (recording, program_id, f"keep {policy['keep_days']} days")
+    
+    if quota is not None:
+        total = sum(r['size'] for r in recordings if r['path'] not in expired)
+        for recording in recordings:
+            if total <= quota:
+                break
+            if recording['path'] in expired or not deletable(recording):
+                continue
+            expired[recording['path']] = (recording, recording['program_id'], 'quota')
+            total -= recording['size']
+    
+    return sorted(expired.values(), key=lambda e: (e[0]['recorded'], e[0]['path'].name))
+
+def enforce_retention(dry_run: bool = False) -> list:
+    """
+    Delete recordings outside the retention policies and byte quota.
+    
+    The feed service watches RECORDINGS_DIR, so each deletion invalidates only
+    the feeds of that recording's program. Shard directories left empty are removed.
+    
+    Args:
+        dry_run: Only print what would be deleted
+    
+    Returns:
+        List of deleted (or, with dry_run, selected) paths
+    """
+    policies, quota = parse_retention_config()
+    if quota is None and not any(p['keep'] or p['keep_days'] for p in policies.values()):
+        print("ℹ️  No retention policies configured (PROGRAMn_KEEP, PROGRAMn_KEEP_DAYS, RECORDINGS_QUOTA)")
+        return []
+    
+    recordings = list_recordings()
+    expired = select_expired(recordings, policies, quota)
+    total = sum(r['size'] for r in recordings)
+    freed = sum(recording['size'] for recording, _, _ in expired)
+    
+    deleted = []
+    for recording, program_id, reason in expired:
+        path = recording['path']
+        print(f"🗑️  {'Would delete' if dry_run else 'Deleting'} {path.name} ({program_id or 'unmatched'}, {reason})")
+        if dry_run:
+            deleted.append(path)
+            continue
+        try:
+            path.unlink()
+            sidecar_path(path).unlink(missing_ok=True)
+            deleted.append(path)
+        except OSError as e:
+            print(f"⚠️ WARNING: Failed to delete {path}: {e}")
+            freed -= recording['size']
+            continue
+        # Remove YYYY/MM shards (and years) left empty
+        for directory in (path.parent, path.parent.parent):
+            if directory == RECORDINGS_DIR or RECORDINGS_DIR not in directory.parents:
+                break
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+    
+    print(f"🧹 Retention: {len(deleted)} of {len(recordings)} recordings "
+          f"{'selected' if dry_run else 'deleted'}, {freed / 1024 ** 2:.1f} MiB of {total / 1024 ** 2:.1f} MiB freed"
+          + (f" (quota {quota / 1024 ** 2:.1f} MiB)" if quota is not None else ""))
+    return deleted
+
+# ======================================================================
+# 6. 녹음 작업 (one-shot 및 daemon 공통)
+# ======================================================================
+
+def run_recordings(recordings) -> list:
+    """
+    Record programs in parallel, each under its own lock, then apply retention.
+    
+    Args:
+        recordings: List of (duration_sec, start_time, stream_url, program_id) tuples
+    
+    Returns:
+        List of programs whose recording failed, or None if nothing was started
+        (already being recorded or over MAX_CONCURRENT_RECORDINGS)
+    """
+    # 프로그램별 Lock (이미 녹음 중인 프로그램과 동시 녹음 한도 초과분은 건너뜀)
+    jobs = []
+    for duration_sec, start_time, stream_url, program_id in recordings:
+        name = program_id or 'manual recording'
+        if len(active_locks()) >= MAX_CONCURRENT_RECORDINGS:
+            print(f"⚠️ WARNING: Skipping {name}: {MAX_CONCURRENT_RECORDINGS} recordings already in progress "
+                  f"(MAX_CONCURRENT_RECORDINGS)")
+            continue
+        lock = acquire_lock(program_id, duration_sec)
+        if lock is None:
+            print(f"ℹ️  {name} is already being recorded (lock exists), skipping")
+            continue
+        print(f"🔒 Lock acquired: {lock.name}")
+        jobs.append((lock, duration_sec, start_time, stream_url, program_id))
+    
+    if not jobs:
+        return None
+    
+    # 녹음 실행 (후처리 포함), 여러 프로그램은 동시에
+    failed = []
+    
+    def record(lock, duration_sec, start_time, stream_url, program_id):
+        try:
+            output_file = execute_recording(duration_sec, stream_url, start_time, program_id)
+            print(f"\n✅ Recording completed successfully")
+            print(f"📁 Saved to: {output_file}")
+        except SystemExit:
+            # execute_recording() exits on ffmpeg errors; only this recording failed
+            failed.append(program_id or 'manual recording')
+        except Exception as e:
+            print(f"❌ ERROR: Recording {program_id or 'manual recording'} failed: {e}")
+            failed.append(program_id or 'manual recording')
+        finally:
+            release_lock(lock)
+    
+    threads = [threading.Thread(target=record, args=job, name=job[4] or 'manual') for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # 보관 정책 적용 (녹음이 끝난 뒤, 다음 녹음 전까지 디스크 확보)
+    try:
+        enforce_retention()
+    except Exception as e:
+        print(f"⚠️ WARNING: Retention failed: {e}")
+    
+    if failed:
+        print(f"❌ Failed recordings: {', '.join(failed)}")
+    return failed
+
+# ======================================================================
+# 7. Daemon 모드 (상주 스케줄러)
+# ======================================================================
+
+# 녹음 예정 시간을 이 간격(초) 이하로 나누어 대기 (시계 변경과 종료 신호 반영)
+DAEMON_MAX_SLEEP = 60
+
+def program_starts(programs, day: datetime.date):
+    """
+    List the scheduled starts of a day.
+    
+    Returns:
+        List of (start datetime, program_id, program_info, schedule) for the
+        programs whose days include that day
+    """
+    starts = []
+    for program_id, program_info in programs.items():
+        if not is_scheduled_on(program_info['days'], day.weekday()):
+            continue
+        for schedule in program_info['schedule']:
+            try:
+                start = datetime.datetime.combine(
+                    day, datetime.time(int(schedule['start'][:2]), int(schedule['start'][2:])))
+            except ValueError:
+                continue
+            starts.append((start, program_id, program_info, schedule))
+    return starts
+
+def next_start(programs, after: datetime.datetime):
+    """
+    Find the next scheduled start strictly after a given time.
+    
+    Returns:
+        (start datetime, [(program_id, program_info, schedule), ...]) for every
+        program starting then, or (None, []) if nothing is ever scheduled
+    """
+    for days_ahead in range(8):
+        day = after.date() + datetime.timedelta(days=days_ahead)
+        starts = [s for s in program_starts(programs, day) if s[0] > after]
+        if starts:
+            first = min(s[0] for s in starts)
+            return first, [s[1:] for s in starts if s[0] == first]
+    return None, []
+
+def in_progress(programs, now: datetime.datetime, window_min: int = 5) -> list:
+    """
+    Programs that started up to window_min minutes ago and are still on air.
+    
+    Used by the one-shot mode (run every minute by the timer) and by a
+    restarted daemon, so each records the rest of a show that has begun.
+    Minutes are compared as the timer does: a show is in the window until
+    the end of its start + window_min minute.
+    
+    Returns:
+        Recording tuples with the remaining duration, closest start first,
+        see run_recordings()
+    """
+    recordings = []
+    minute = now.replace(second=0, microsecond=0)
+    for day in (now.date() - datetime.timedelta(days=1), now.date()):
+        for start, program_id, program_info, schedule in program_starts(programs, day):
+            if not datetime.timedelta(0) <= minute - start <= datetime.timedelta(minutes=window_min):
+                continue
+            duration = calculate_duration_from_time(schedule['start'], schedule['end'])
+            remaining = int((start + datetime.timedelta(seconds=duration) - now).total_seconds())
+            if remaining > 0:
+                recordings.append((start, (remaining, schedule['start'], program_info['url'], program_id)))
+    recordings.sort(key=lambda r: r[0], reverse=True)
+    return [recording for _, recording in recordings]
+
+def start_recordings(recordings):
+    """Run recordings in the background so the scheduler keeps its next start."""
+    thread = threading.Thread(target=run_recordings, args=(recordings,), name='recordings')
+    thread.start()
+    return thread
+
+def run_daemon():
+    """
+    상주 모드: PROGRAMn을 한 번 읽고, 다음 시작 시간까지 대기했다가 정시에 녹음을 시작합니다.
+    
+    systemd 타이머가 매 분 컨테이너를 새로 띄우는 대신, 프로세스가 녹음 사이에도
+    계속 실행되어 시작 지연이 없습니다. 녹음은 one-shot 모드와 같은 프로그램별
+    Lock을 사용하므로 두 모드를 함께 실행해도 같은 프로그램을 두 번 녹음하지 않습니다.
+    """
+    print("🛰️  Daemon mode: scheduling programs in-process")
+    programs = parse_programs_config(today_only=False)
+    if not programs:
+        print(f"❌ ERROR: No PROGRAMS configured in environment variables")
+        sys.exit(1)
+    
+    handle_stop_signals()
+    
+    workers = []
+    now = datetime.datetime.now()
+    # Started within the last few minutes (e.g. daemon restarted during a show)
+    catch_up = in_progress(programs, now)
+    if catch_up:
+        print(f"⏩ Catching up on {len(catch_up)} program(s) already on air")
+        workers.append(start_recordings(catch_up))
+    
+    after = now
+    while not _stop.is_set():
+        start, due = next_start(programs, after)
+        if start is None:
+            print(f"⚠️ No program is scheduled on any day, exiting")
+            break
+        print(f"⏳ Next: {', '.join(p[0] for p in due)} at {start:%Y-%m-%d %H:%M}")
         
-        print(f"\n✅ Recording completed successfully")
-        print(f"📁 Saved to: {output_file}")
+        while not _stop.is_set():
+            remaining = (start - datetime.datetime.now()).total_seconds()
+            if remaining <= 0:
+                break
+            _stop.wait(min(remaining, DAEMON_MAX_SLEEP))
+        if _stop.is_set():
+            break
         
-    finally:
-        # Always remove lock file
-        if LOCK_FILE.exists():
-            LOCK_FILE.unlink()
-            print(f"🔓 Lock file removed: {LOCK_FILE}")
+        recordings = [
+            (calculate_duration_from_time(schedule['start'], schedule['end']), schedule['start'],
+             program_info['url'], program_id)
+            for program_id, program_info, schedule in due
+        ]
+        print(f"🎬 {start:%H:%M}: starting {', '.join(r[3] for r in recordings)}")
+        workers = [w for w in workers if w.is_alive()]
+        workers.append(start_recordings(recordings))
+        after = start
+    
+    # On a stop request recordings in progress are cut short, saved and unlocked
+    for worker in workers:
+        worker.join()
+
+# ======================================================================
+# 메인 실행 함수
+# ======================================================================
+
+def main():
+    """
+    녹음 워크플로우를 실행하는 메인 함수
+    
+    Usage:
+    - python record.py [duration_minutes]  녹음 (녹음 후 보관 정책 적용)
+    - python record.py --prune [--dry-run] 보관 정책만 적용
+    - python record.py --daemon            상주 모드 (프로그램 시작 시간마다 녹음)
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == '--prune':
+        enforce_retention(dry_run='--dry-run' in sys.argv[2:])
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--daemon':
+        run_daemon()
+        return
+    
+    # 1. 설정 및 유효성 검사
+    recordings = parse_and_validate_args()
+    
+    # 2-5. Lock, 녹음, 후처리, 보관 정책
+    handle_stop_signals()
+    failed = run_recordings(recordings)
+    if failed is None:
+        sys.exit(0)
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -3,15 +3,25 @@ Tests for feed.py program configuration parsing
 Uses Python's built-in unittest framework
 """
 
+import datetime
+import json
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from pathlib import Path
+from unittest.mock import patch, Mock
+from lxml import etree
+from wsgiref.util import setup_testing_defaults
 import sys
 
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from feed import parse_programs, extract_time_from_filename
+import feed
+from feed import parse_programs, extract_time_from_filename, match_program, EpisodeCatalog
 
 
 class TestParsePrograms(unittest.TestCase):
@@ -29,6 +39,7 @@ class TestParsePrograms(unittest.TestCase):
             self.assertEqual(programs['program1']['name'], 'Program Name #1')
             self.assertEqual(len(programs['program1']['schedule']), 1)
             self.assertEqual(programs['program1']['schedule'][0], '0740')
+            self.assertEqual(programs['program1']['days'], 'ALL')
     
     def test_multiple_programs(self):
         """Test parsing multiple programs"""
@@ -188,5 +199,1310 @@ class TestExtractTimeFromFilename(unittest.TestCase):
         self.assertIsNone(extract_time_from_filename("2025122 0740.m4a")) # Date too short
 
 
+class TestMatchProgram(unittest.TestCase):
+    """Test match_program function"""
+    
+    PROGRAMS = {
+        'morning': {'name': 'Morning', 'schedule': ['0740']},
+        'evening': {'name': 'Evening', 'schedule': ['2000']},
+    }
+    
+    def test_match_within_tolerance(self):
+        """Test files recorded a few minutes late still match"""
+        self.assertEqual(match_program("20251222-0742-5f3a2b1c.m4a", self.PROGRAMS), 'morning')
+        self.assertEqual(match_program("20251222-2000-5f3a2b1c.m4a", self.PROGRAMS), 'evening')
+    
+    def test_no_match(self):
+        """Test files outside every schedule"""
+        self.assertIsNone(match_program("20251222-1200-5f3a2b1c.m4a", self.PROGRAMS))
+        self.assertIsNone(match_program("invalid.m4a", self.PROGRAMS))
+    
+    def test_table_matches_nearest_start(self):
+        """Test the minute table agrees with the nearest matching start for every minute"""
+        programs = {
+            'early': {'name': 'Early', 'schedule': ['0003']},
+            'a': {'name': 'A', 'schedule': ['0740', '1230']},
+            'b': {'name': 'B', 'schedule': ['0745']},
+            'late': {'name': 'Late', 'schedule': ['2358']},
+        }
+        for minute in range(1440):
+            file_time = f"{minute // 60:02d}{minute % 60:02d}"
+            candidates = []
+            for order, (program_id, info) in enumerate(programs.items()):
+                for start in info['schedule']:
+                    diff = abs(minute - (int(start[:2]) * 60 + int(start[2:])))
+                    diff = min(diff, 1440 - diff)
+                    if diff <= 5:
+                        candidates.append((diff, order, program_id))
+            expected = min(candidates)[2] if candidates else None
+            self.assertEqual(match_program(f"20251222-{file_time}-5f3a2b1c.m4a", programs), expected, file_time)
+    
+    def test_overlapping_windows_nearest_start(self):
+        """Test programs a few minutes apart each keep their own recordings"""
+        programs = {
+            'a': {'name': 'A', 'schedule': ['0740']},
+            'b': {'name': 'B', 'schedule': ['0743']},
+        }
+        self.assertEqual(match_program("20251222-0740-5f3a2b1c.m4a", programs), 'a')
+        self.assertEqual(match_program("20251222-0741-5f3a2b1c.m4a", programs), 'a')
+        self.assertEqual(match_program("20251222-0743-5f3a2b1c.m4a", programs), 'b')
+        self.assertEqual(match_program("20251222-0746-5f3a2b1c.m4a", programs), 'b')
+        # Equally far from both: the program configured first
+        tie = {'b': {'name': 'B', 'schedule': ['0743']}, 'c': {'name': 'C', 'schedule': ['0745']}}
+        self.assertEqual(match_program("20251222-0744-5f3a2b1c.m4a", tie), 'b')
+        # Across midnight
+        self.assertEqual(match_program("20251223-0001-5f3a2b1c.m4a", {'late': {'name': 'L', 'schedule': ['2358']}}), 'late')
+    
+    def test_weekday_and_weekend_programs(self):
+        """Test programs at the same time on different days each keep their own recordings"""
+        programs = {
+            'weekday': {'name': 'Weekday', 'schedule': ['0740'], 'days': 'MON-FRI'},
+            'weekend': {'name': 'Weekend', 'schedule': ['0740'], 'days': 'SAT,SUN'},
+        }
+        # 2025-12-26 is a Friday
+        self.assertEqual(match_program("20251226-0740-5f3a2b1c.m4a", programs), 'weekday')
+        self.assertEqual(match_program("20251227-0741-5f3a2b1c.m4a", programs), 'weekend')
+        self.assertEqual(match_program("20251228-0740-5f3a2b1c.m4a", programs), 'weekend')
+        self.assertIsNone(match_program("20251228-0740-5f3a2b1c.m4a", {'weekday': programs['weekday']}))
+        self.assertIsNone(match_program("20251399-0740-5f3a2b1c.m4a", programs))
+        # A recording just after midnight belongs to the previous day's program
+        late = {'late': {'name': 'L', 'schedule': ['2358'], 'days': 'FRI'}}
+        self.assertEqual(match_program("20251227-0001-5f3a2b1c.m4a", late), 'late')
+        self.assertIsNone(match_program("20251228-0001-5f3a2b1c.m4a", late))
+    
+    def test_filename_minute(self):
+        """Test minute extraction for both filename formats"""
+        self.assertEqual(feed.filename_minute("20251222-0740-5f3a2b1c.m4a"), 460)
+        self.assertEqual(feed.filename_minute("20251222 2359 5f3a2b1c.m4a"), 1439)
+        self.assertIsNone(feed.filename_minute("2025122-0740.m4a"))
+        self.assertIsNone(feed.filename_minute("20251222_0740.m4a"))
+
+
+class TestEpisodeCatalog(unittest.TestCase):
+    """Test EpisodeCatalog incremental sync"""
+    
+    PROGRAMS = {'morning': {'name': 'Morning', 'schedule': ['0740']}}
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.recordings = self.tmp / 'recordings'
+        self.recordings.mkdir()
+        self.catalog = EpisodeCatalog(self.tmp / 'catalog.db', self.recordings)
+        patcher = patch('feed.PROGRAMS', self.PROGRAMS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+    
+    def _write(self, name, size=10):
+        path = self.recordings / name
+        path.write_bytes(b'x' * size)
+        return path
+    
+    @patch('feed.probe_duration', return_value=1200.0)
+    def test_only_changed_files_are_probed(self, mock_probe):
+        """Test that unchanged files are not probed again"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self._write("20251223-0740-bbbbbbbb.m4a")
+        self.assertEqual(self.catalog.sync(), (2, 0))
+        self.assertEqual(mock_probe.call_count, 2)
+        
+        self.assertEqual(self.catalog.sync(), (0, 0))
+        self.assertEqual(mock_probe.call_count, 2)
+        
+        self._write("20251223-0740-bbbbbbbb.m4a", size=20)
+        self.assertEqual(self.catalog.sync(), (1, 0))
+        self.assertEqual(mock_probe.call_count, 3)
+    
+    def test_sidecar_duration(self):
+        """Test the duration comes from the recording's sidecar instead of the audio"""
+        self._write("20251222-0740-aaaaaaaa.m4a", size=10)
+        (self.recordings / "20251222-0740-aaaaaaaa.json").write_text('{"duration": 1200.5, "size": 10}')
+        self._write("20251223-0740-bbbbbbbb.m4a", size=20)
+        # Sidecar of an earlier version of the file is ignored
+        (self.recordings / "20251223-0740-bbbbbbbb.json").write_text('{"duration": 900.0, "size": 15}')
+        with patch('tinytag.TinyTag.get') as mock_tinytag:
+            mock_tinytag.return_value.duration = 600.0
+            self.catalog.sync()
+        self.assertEqual(mock_tinytag.call_count, 1)
+        durations = {name: duration for name, _, _, duration in self.catalog.episodes()}
+        self.assertEqual(durations, {"20251222-0740-aaaaaaaa.m4a": 1200.5, "20251223-0740-bbbbbbbb.m4a": 600.0})
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_removed_files_are_dropped(self, mock_probe):
+        """Test that deleted recordings leave the catalog"""
+        path = self._write("20251222-0740-aaaaaaaa.m4a")
+        self.catalog.sync()
+        path.unlink()
+        self.assertEqual(self.catalog.sync(), (0, 1))
+        self.assertEqual(self.catalog.episodes(), [])
+    
+    @patch('feed.probe_duration', return_value=1200.0)
+    def test_episodes_by_program(self, mock_probe):
+        """Test episodes are listed newest first and filtered by program"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self._write("20251223-0740-bbbbbbbb.m4a")
+        self._write("20251223-1200-cccccccc.m4a")
+        self.catalog.sync()
+        
+        names = [row[0] for row in self.catalog.episodes('morning')]
+        self.assertEqual(names, ["20251223-0740-bbbbbbbb.m4a", "20251222-0740-aaaaaaaa.m4a"])
+        self.assertEqual(len(self.catalog.episodes()), 3)
+        self.assertEqual(self.catalog.episodes('morning')[0][3], 1200.0)
+        self.assertEqual(self.catalog.episodes('evening'), [])
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_snapshot_shared_until_change(self, mock_probe):
+        """Test feeds read one snapshot that is reloaded only after changes"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self.catalog.sync()
+        self.catalog.episodes('morning')
+        snapshot = self.catalog._snapshot
+        
+        self.catalog.sync()
+        self.catalog.episodes()
+        self.assertIs(self.catalog._snapshot, snapshot)
+        
+        self._write("20251223-0740-bbbbbbbb.m4a")
+        self.catalog.sync()
+        self.assertEqual(self.catalog.summary('morning')[0], 2)
+        self.assertIsNot(self.catalog._snapshot, snapshot)
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_hidden_and_other_files_ignored(self, mock_probe):
+        """Test only visible .m4a files are catalogued"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self._write(".20251223-0740-bbbbbbbb.m4a")
+        self._write("notes.txt")
+        self.assertEqual(self.catalog.sync(), (1, 0))
+
+
+class TestShardedLayout(unittest.TestCase):
+    """Test catalog sync and file lookup over YYYY/MM shard directories"""
+    
+    PROGRAMS = {'morning': {'name': 'Morning', 'schedule': ['0740']}}
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.recordings = self.tmp / 'recordings'
+        self.recordings.mkdir()
+        self.catalog = EpisodeCatalog(self.tmp / 'catalog.db', self.recordings)
+        patcher = patch('feed.PROGRAMS', self.PROGRAMS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+    
+    def _write(self, name, sharded=True):
+        directory = self.recordings / feed.shard_dir(name) if sharded else self.recordings
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / name
+        path.write_bytes(b'x' * 10)
+        # Settle the shard mtime so the catalog may skip it next time
+        os.utime(directory, ns=(10**18, 10**18))
+        return path
+    
+    def test_shard_dir(self):
+        """Test shard directory derived from the filename date"""
+        self.assertEqual(feed.shard_dir("20251222-0740-5f3a2b1c.m4a"), "2025/12")
+        self.assertIsNone(feed.shard_dir("notes.m4a"))
+    
+    def test_locate_recording(self):
+        """Test lookup prefers the flat layout and falls back to the shard"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self._write("20251223-0740-bbbbbbbb.m4a", sharded=False)
+        self.assertEqual(feed.locate_recording(self.recordings, "20251222-0740-aaaaaaaa.m4a"),
+                         "2025/12/20251222-0740-aaaaaaaa.m4a")
+        self.assertEqual(feed.locate_recording(self.recordings, "20251223-0740-bbbbbbbb.m4a"),
+                         "20251223-0740-bbbbbbbb.m4a")
+        self.assertIsNone(feed.locate_recording(self.recordings, "20251224-0740-cccccccc.m4a"))
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_sync_mixed_layouts(self, mock_probe):
+        """Test flat and sharded recordings are catalogued together"""
+        self._write("20251022-0740-aaaaaaaa.m4a")
+        self._write("20251122-0740-bbbbbbbb.m4a")
+        self._write("20251222-0740-cccccccc.m4a", sharded=False)
+        self.assertEqual(self.catalog.sync(), (3, 0))
+        names = [row[0] for row in self.catalog.episodes('morning')]
+        self.assertEqual(names, ["20251222-0740-cccccccc.m4a", "20251122-0740-bbbbbbbb.m4a",
+                                 "20251022-0740-aaaaaaaa.m4a"])
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_unchanged_old_shards_skipped(self, mock_probe):
+        """Test settled shards are not listed again, but their changes are seen"""
+        for month in ('09', '10', '11', '12'):
+            self._write(f"2025{month}22-0740-aaaaaaaa.m4a")
+        self.catalog.sync()
+        
+        with patch('feed.scan_recordings', wraps=feed.scan_recordings) as scan:
+            self.assertEqual(self.catalog.sync(), (0, 0))
+            listed = {Path(call.args[0]).relative_to(self.recordings).as_posix()
+                      for call in scan.call_args_list}
+        self.assertEqual(listed, {'.', '2025/11', '2025/12'})
+        self.assertEqual(self.catalog.summary('morning')[0], 4)
+        
+        # Deleting from an old shard changes its mtime
+        (self.recordings / '2025/09/20250922-0740-aaaaaaaa.m4a').unlink()
+        os.utime(self.recordings / '2025/09', ns=(2 * 10**18, 2 * 10**18))
+        self.assertEqual(self.catalog.sync(), (0, 1))
+        
+        # A vanished shard drops its recordings
+        shutil.rmtree(self.recordings / '2025/10')
+        self.assertEqual(self.catalog.sync(), (0, 1))
+        self.assertEqual(self.catalog.summary('morning')[0], 2)
+    
+    @patch('feed.probe_duration', return_value=None)
+    def test_migration_keeps_episodes(self, mock_probe):
+        """Test moving a recording into its shard updates the catalog without probing"""
+        path = self._write("20251222-0740-aaaaaaaa.m4a", sharded=False)
+        self.catalog.sync()
+        shard = self.recordings / '2025/12'
+        shard.mkdir(parents=True)
+        path.rename(shard / path.name)
+        
+        self.assertEqual(self.catalog.sync(), (0, 0))
+        self.assertEqual(mock_probe.call_count, 1)
+        row = self.catalog._connect().execute('SELECT dir FROM episodes').fetchone()
+        self.assertEqual(row[0], '2025/12')
+    
+    def test_serve_file_from_shard(self):
+        """Test flat feed URLs resolve to sharded recordings"""
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        with patch('feed.RECORDINGS_DIR', self.recordings), \
+             patch('feed.static_file', return_value='sent') as mock_static:
+            self.assertEqual(feed.serve_file('morning/20251222-0740-aaaaaaaa.m4a'), 'sent')
+        self.assertEqual(mock_static.call_args.args[0], '2025/12/20251222-0740-aaaaaaaa.m4a')
+
+    @patch('feed.probe_duration', return_value=None)
+    def test_changes_synced_by_another_worker(self, mock_probe):
+        """Test a second process sharing the database sees episodes it didn't sync"""
+        other = EpisodeCatalog(self.tmp / 'catalog.db', self.recordings)
+        self._write("20251222-0740-aaaaaaaa.m4a")
+        self.catalog.sync()
+        self.assertEqual(other.sync(), (0, 0))
+        self.assertEqual(other.summary('morning')[0], 1)
+        
+        self._write("20251223-0740-bbbbbbbb.m4a")
+        self.catalog.sync()
+        self.assertEqual(other.sync(), (0, 0))
+        self.assertEqual(other.summary('morning')[0], 2)
+
+class TestFeedAssembly(unittest.TestCase):
+    """Test feed assembly from cached <item> fragments"""
+    
+    BASE_URL = 'http://localhost:8013/radio/'
+    EPISODES = [
+        ('20251223-0740-bbbbbbbb.m4a', 2000, 1766443200.0, 1200.0),
+        ('20251222-0740-aaaaaaaa.m4a', 1000, 1766356800.0, None),
+    ]
+    
+    def setUp(self):
+        feed._item_cache.clear()
+        catalog = feed.EpisodeCatalog(':memory:', feed.RECORDINGS_DIR)
+        with catalog._connect() as conn:
+            conn.executemany('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                             'VALUES (?, ?, ?, ?, ?)', [row + ('program1',) for row in self.EPISODES])
+        patcher = patch('feed._catalog', catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_matches_podgen_output(self):
+        """Test that assembled feed is identical to podgen serialization"""
+        p = feed._build_channel('Program Name #1', 'program1', self.BASE_URL)
+        for row in self.EPISODES:
+            p.episodes.append(feed._build_episode(*row, 'Program Name #1', self.BASE_URL))
+        
+        # Channel dates follow the newest episode, so output is deterministic
+        newest = time.strftime('%a, %d %b %Y %H:%M:%S +0900', time.localtime(1766443200.0))
+        p.last_updated = p.publication_date = newest
+        
+        assembled, last_modified = feed._generate_podcast_feed_internal('Program Name #1', 'program1', ['0740'])
+        self.assertEqual(feed.substitute_base_url(assembled, self.BASE_URL), p.rss_str())
+        self.assertEqual(last_modified, 1766443200.0)
+    
+    def test_fragments_are_reused(self):
+        """Test that each episode is serialized only once"""
+        feed._generate_podcast_feed_internal('Program Name #1', 'program1', ['0740'])
+        with patch('feed.render_episode_item') as mock_render:
+            feed._generate_podcast_feed_internal('Program Name #1', 'program1', ['0740'])
+            mock_render.assert_not_called()
+
+
+class TestFeedPaging(unittest.TestCase):
+    """Test paged feeds with RFC 5005 archive links"""
+    
+    BASE_URL = 'http://localhost:8013/radio/'
+    FEED_URL = BASE_URL + 'program1/feed.rss'
+    
+    def setUp(self):
+        # Five episodes, newest (day 5) first in the catalog
+        catalog = feed.EpisodeCatalog(':memory:', feed.RECORDINGS_DIR)
+        with catalog._connect() as conn:
+            conn.executemany('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                             'VALUES (?, ?, ?, ?, ?)', [
+                (f'2025120{day}-0740-0000000{day}.m4a', 1000, 1764547200.0 + day * 86400, None, 'program1')
+                for day in range(1, 6)
+            ])
+        patcher = patch('feed._catalog', catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _page(self, page, limit=2, link_query=()):
+        rss_xml, last_modified = feed._generate_podcast_feed_internal(
+            'Program Name #1', 'program1', ['0740'], page, limit, link_query)
+        rss_xml = feed.substitute_base_url(rss_xml, self.BASE_URL)
+        channel = etree.fromstring(rss_xml.encode('utf-8')).find('channel')
+        guids = [guid.text for guid in channel.iter('guid')]
+        links = {
+            link.get('rel'): link.get('href')
+            for link in channel.findall('{http://www.w3.org/2005/Atom}link')
+        }
+        archive = channel.find('{http://purl.org/syndication/history/1.0}archive')
+        return guids, links, archive is not None, last_modified
+    
+    def test_subscription_page(self):
+        """Test that the subscription feed holds the newest episodes and links to the archive"""
+        guids, links, archive, last_modified = self._page(None)
+        
+        self.assertEqual(guids, ['20251205-0740-00000005.m4a', '20251204-0740-00000004.m4a'])
+        # Newest complete archive page: days 3-4 (day 5 is only in the subscription feed so far)
+        self.assertEqual(links, {'self': self.FEED_URL, 'prev-archive': self.FEED_URL + '?page=2'})
+        self.assertFalse(archive)
+        self.assertEqual(last_modified, 1764547200.0 + 5 * 86400)
+    
+    def test_archive_pages(self):
+        """Test archive pages count from the oldest episode and link to their neighbours"""
+        guids, links, archive, last_modified = self._page(2)
+        self.assertEqual(guids, ['20251204-0740-00000004.m4a', '20251203-0740-00000003.m4a'])
+        self.assertEqual(links, {
+            'self': self.FEED_URL + '?page=2',
+            'current': self.FEED_URL,
+            'prev-archive': self.FEED_URL + '?page=1',
+        })
+        self.assertTrue(archive)
+        # Last-Modified follows the page's own episodes
+        self.assertEqual(last_modified, 1764547200.0 + 4 * 86400)
+        
+        guids, links, archive, _ = self._page(1)
+        self.assertEqual(guids, ['20251202-0740-00000002.m4a', '20251201-0740-00000001.m4a'])
+        self.assertEqual(links['next-archive'], self.FEED_URL + '?page=2')
+        self.assertNotIn('prev-archive', links)
+    
+    def test_archive_pages_stable(self):
+        """Test that new recordings don't change existing archive pages"""
+        before = [feed._generate_podcast_feed_internal('Program Name #1', 'program1', ['0740'], page, 2)
+                  for page in (1, 2)]
+        with feed._catalog._connect() as conn:
+            conn.execute('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                         "VALUES ('20251206-0740-00000006.m4a', 1000, ?, NULL, 'program1')",
+                         (1764547200.0 + 6 * 86400,))
+        feed._catalog._snapshot = None
+        
+        self.assertEqual(feed._generate_podcast_feed_internal('Program Name #1', 'program1', ['0740'], 1, 2),
+                         before[0])
+        # Only the newest archive page gains a link to the page completed after it
+        guids, links, _, last_modified = self._page(2)
+        self.assertEqual(guids, ['20251204-0740-00000004.m4a', '20251203-0740-00000003.m4a'])
+        self.assertEqual((links['next-archive'], last_modified), (self.FEED_URL + '?page=3', before[1][1]))
+        
+        guids, links, _, _ = self._page(None)
+        self.assertEqual(guids, ['20251206-0740-00000006.m4a', '20251205-0740-00000005.m4a'])
+        self.assertEqual(links['prev-archive'], self.FEED_URL + '?page=3')
+    
+    def test_link_query_carried_over(self):
+        """Test that limit and secret are kept in archive links"""
+        _, links, _, _ = self._page(None, link_query=(('limit', 2), ('secret', 'a&b')))
+        self.assertEqual(links['prev-archive'], self.FEED_URL + '?page=2&limit=2&secret=a%26b')
+    
+    def test_no_paging(self):
+        """Test that limit 0 puts every episode in one feed without links"""
+        guids, links, _, _ = self._page(None, limit=0)
+        self.assertEqual(len(guids), 5)
+        self.assertEqual(list(links), ['self'])
+        with self.assertRaises(feed.HTTPError):
+            self._page(1, limit=0)
+    
+    def test_page_out_of_range(self):
+        """Test that incomplete and missing archive pages are not found"""
+        for page in (3, 0):
+            with self.assertRaises(feed.HTTPError) as ctx:
+                self._page(page)
+            self.assertEqual(ctx.exception.status_code, 404)
+    
+    def test_program_limit(self):
+        """Test PROGRAMn_LIMIT sets a program's page size"""
+        env = {'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1', 'PROGRAM1_LIMIT': '20'}
+        with patch.dict(os.environ, env, clear=True):
+            programs = feed.parse_programs('')
+        self.assertEqual(programs['program1']['limit'], 20)
+
+
+class TestBaseUrlSubstitution(unittest.TestCase):
+    """Test that one cached feed template serves every base URL"""
+    
+    def setUp(self):
+        feed._feed_cache.clear()
+        feed._rendered_cache.clear()
+        self.addCleanup(feed._feed_cache.clear)
+        self.addCleanup(feed._rendered_cache.clear)
+        template = ('<rss><channel><link>' + feed.FEED_BASE_PLACEHOLDER + 'program1/</link></channel></rss>', None)
+        for target, value in [
+            ('feed.refresh_catalog', lambda: None),
+            ('feed._generate_podcast_feed_internal', Mock(return_value=template)),
+        ]:
+            patcher = patch(target, value)
+            self.mock = patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _feed(self, base_url):
+        with patch('feed.get_base_url', return_value=base_url):
+            return feed.generate_podcast_feed_xml('Program Name #1', 'program1', ['0740'])
+    
+    def test_generated_once_for_all_hosts(self):
+        """Test that LAN, hostname and HTTPS requests share one generated feed"""
+        http = self._feed('http://192.168.0.10:8013/radio/')
+        named = self._feed('http://radio.local:8013/radio/')
+        https = self._feed('https://example.com/radio/')
+        
+        self.assertEqual(self.mock.call_count, 1)
+        self.assertIn(b'<link>http://192.168.0.10:8013/radio/program1/</link>', http['rss_xml'])
+        self.assertIn(b'<link>http://radio.local:8013/radio/program1/</link>', named['rss_xml'])
+        self.assertIn(b'<link>https://example.com/radio/program1/</link>', https['rss_xml'])
+        self.assertNotEqual(http['etag'], https['etag'])
+    
+    def test_scheme_does_not_leak(self):
+        """Test that an HTTPS request after an HTTP one gets HTTPS URLs"""
+        self._feed('http://example.com/radio/')
+        entry = self._feed('https://example.com/radio/')
+        self.assertNotIn(b'http://', entry['rss_xml'])
+    
+    def test_base_url_is_escaped(self):
+        """Test that a hostile Host header can't inject markup"""
+        entry = self._feed('http://evil"><x>&/radio/')
+        self.assertIn(b'http://evil&quot;&gt;&lt;x&gt;&amp;/radio/', entry['rss_xml'])
+
+
+class TestPrewarm(unittest.TestCase):
+    """Test background feed regeneration after new recordings"""
+    
+    PROGRAMS = {'program1': {'name': 'Program Name #1', 'schedule': ['0740'], 'limit': 2}}
+    KEY = ('program1', ('0740',), None, 2, ())
+    BASE_URL = 'http://localhost:8013/radio/'
+    
+    def setUp(self):
+        self.catalog = feed.EpisodeCatalog(':memory:', feed.RECORDINGS_DIR)
+        self._insert('20251201-0740-00000001.m4a')
+        for target, value in [
+            ('feed.PROGRAMS', self.PROGRAMS),
+            ('feed._catalog', self.catalog),
+            ('feed.refresh_catalog', lambda: None),
+            ('feed._prewarm_running', True),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cache in (feed._feed_cache, feed._rendered_cache, feed._warm_keys, feed._prewarm_programs):
+            cache.clear()
+            self.addCleanup(cache.clear)
+        self.addCleanup(feed._prewarm_event.clear)
+        
+        with patch('feed.get_base_url', return_value=self.BASE_URL):
+            self.old = feed.generate_podcast_feed_xml('Program Name #1', 'program1', ['0740'], None, 2)
+    
+    def _insert(self, name):
+        with self.catalog._connect() as conn:
+            conn.execute('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                         'VALUES (?, 1000, 1764547200.0, NULL, ?)', (name, 'program1'))
+        self.catalog._snapshot = None
+    
+    def test_stale_feed_kept_until_swap(self):
+        """Test that a change schedules regeneration instead of dropping the feed"""
+        feed.handle_fs_event(feed.RECORDINGS_DIR, '20251202-0740-00000002.m4a')
+        
+        self.assertIn(self.KEY, feed._feed_cache)
+        self.assertEqual(feed._prewarm_programs, {'program1', None})
+        self.assertTrue(feed._prewarm_event.is_set())
+    
+    def test_swap_renders_known_base_urls(self):
+        """Test that the regenerated feed is ready for every base URL already served"""
+        self._insert('20251202-0740-00000002.m4a')
+        self.assertEqual(feed.prewarm_feeds({'program1'}), 1)
+        
+        template = feed._feed_cache[self.KEY]
+        self.assertIn('20251202-0740-00000002.m4a', template['rss_xml'])
+        entry = feed._rendered_cache[(template['digest'], self.BASE_URL)]
+        self.assertIn(b'20251202-0740-00000002.m4a', entry['rss_xml'])
+        self.assertNotEqual(entry['etag'], self.old['etag'])
+    
+    def test_cached_feed_not_in_warm_keys_regenerated(self):
+        """Test that a cached feed forgotten by _warm_keys is refreshed too"""
+        feed._warm_keys.clear()
+        self._insert('20251202-0740-00000002.m4a')
+        self.assertEqual(feed.prewarm_feeds({'program1'}), 1)
+        self.assertIn('20251202-0740-00000002.m4a', feed._feed_cache[self.KEY]['rss_xml'])
+    
+    def test_removed_page_dropped(self):
+        """Test that archive pages that no longer exist are forgotten"""
+        key = ('program1', ('0740',), 2, 1, ())
+        feed._warm_keys[key] = True
+        feed._feed_cache[key] = feed._feed_cache[self.KEY]
+        
+        feed.prewarm_feeds({'program1'})
+        self.assertNotIn(key, feed._feed_cache)
+        self.assertNotIn(key, feed._warm_keys)
+    
+    def test_without_prewarmer(self):
+        """Test that feeds are dropped when no pre-warm thread is running"""
+        with patch('feed._prewarm_running', False):
+            feed.handle_fs_event(feed.RECORDINGS_DIR, '20251202-0740-00000002.m4a')
+        self.assertNotIn(self.KEY, feed._feed_cache)
+
+
+class TestHandleFsEvent(unittest.TestCase):
+    """Test targeted cache invalidation from filesystem events"""
+    
+    PROGRAMS = {
+        'morning': {'name': 'Morning', 'schedule': ['0740']},
+        'evening': {'name': 'Evening', 'schedule': ['2000']},
+    }
+    
+    def setUp(self):
+        patcher = patch('feed.PROGRAMS', self.PROGRAMS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        feed._feed_cache.clear()
+        feed._pending_changes.clear()
+        feed._logo_cache.clear()
+        for program_id in ('morning', 'evening', None):
+            feed._feed_cache[(program_id, None, 'http://host/radio/')] = 'rss'
+    
+    def tearDown(self):
+        feed._feed_cache.clear()
+        feed._pending_changes.clear()
+        feed._logo_cache.clear()
+    
+    def test_new_recording(self):
+        """Test that only the matching program and all-programs feeds are dropped"""
+        feed.handle_fs_event(feed.RECORDINGS_DIR, '20251222-0740-aaaaaaaa.m4a')
+        
+        self.assertEqual([key[0] for key in feed._feed_cache.keys()], ['evening'])
+        self.assertIn('20251222-0740-aaaaaaaa.m4a', feed._pending_changes)
+    
+    def test_non_audio_file_ignored(self):
+        """Test that marker files such as .last_recording don't invalidate"""
+        feed.handle_fs_event(feed.RECORDINGS_DIR, '.last_recording')
+        
+        self.assertEqual(len(feed._feed_cache), 3)
+        self.assertEqual(len(feed._pending_changes), 0)
+    
+    def test_logo_change(self):
+        """Test that a logo change only drops that program's feed"""
+        feed._logo_cache['morning'] = 'default.png'
+        feed.handle_fs_event(feed.LOGO_DIR, 'morning.png')
+        
+        self.assertEqual(sorted(str(key[0]) for key in feed._feed_cache.keys()), ['None', 'evening'])
+        self.assertNotIn('morning', feed._logo_cache)
+
+
+class TestConditionalGet(unittest.TestCase):
+    """Test ETag / Last-Modified handling on feed routes"""
+    
+    ENTRY = {
+        'rss_xml': b'<rss/>',
+        'rss_gzip': b'gzip-body',
+        'rss_br': None,
+        'etag': '"abc123"',
+        'last_modified': 1766443200.0,  # Mon, 22 Dec 2025 22:40:00 GMT
+    }
+    
+    def setUp(self):
+        patcher = patch('feed.generate_podcast_feed_xml', return_value=self.ENTRY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _get(self, headers):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = f'{feed.ROUTE_PREFIX}/feed.rss'
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        
+        result = {}
+        def start_response(status, headers, exc_info=None):
+            result['status'] = int(status.split()[0])
+            result['headers'] = dict(headers)
+        body = b''.join(feed.app(environ, start_response))
+        return result['status'], result['headers'], body
+    
+    def test_validators_sent(self):
+        """Test that full responses carry ETag and Last-Modified"""
+        status, headers, body = self._get({})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Etag'], '"abc123"')
+        self.assertEqual(headers['Last-Modified'], 'Mon, 22 Dec 2025 22:40:00 GMT')
+        self.assertEqual(body, b'<rss/>')
+    
+    def test_if_none_match(self):
+        """Test matching and non-matching entity tags"""
+        self.assertEqual(self._get({'If-None-Match': '"abc123"'})[:3:2], (304, b''))
+        self.assertEqual(self._get({'If-None-Match': '"old", W/"abc123"'})[0], 304)
+        self.assertEqual(self._get({'If-None-Match': '"old"'})[0], 200)
+    
+    def test_if_modified_since(self):
+        """Test date validator and precedence of If-None-Match"""
+        self.assertEqual(self._get({'If-Modified-Since': 'Mon, 22 Dec 2025 22:40:00 GMT'})[0], 304)
+        self.assertEqual(self._get({'If-Modified-Since': 'Mon, 22 Dec 2025 22:39:59 GMT'})[0], 200)
+        self.assertEqual(self._get({
+            'If-None-Match': '"old"',
+            'If-Modified-Since': 'Mon, 22 Dec 2025 22:40:00 GMT',
+        })[0], 200)
+
+    
+    def test_precompressed_body(self):
+        """Test that gzip clients get the stored compressed variant"""
+        status, headers, body = self._get({'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Etag'], '"abc123-gzip"')
+        self.assertEqual(body, b'gzip-body')
+    
+    def test_uncompressed_body(self):
+        """Test that clients without gzip support get plain XML"""
+        status, headers, body = self._get({})
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(body, b'<rss/>')
+    
+    def test_if_none_match_any_encoding(self):
+        """Test revalidation with the tag of a previously received encoding"""
+        self.assertEqual(self._get({'Accept-Encoding': 'gzip', 'If-None-Match': '"abc123"'})[0], 304)
+        self.assertEqual(self._get({'If-None-Match': '"abc123-gzip"'})[0], 304)
+
+
+class TestChooseEncoding(unittest.TestCase):
+    """Test Accept-Encoding negotiation"""
+    
+    @patch('feed.brotli', object())
+    def test_prefers_brotli(self):
+        """Test that brotli wins over gzip at equal quality"""
+        self.assertEqual(feed.choose_encoding('gzip, deflate, br'), 'br')
+    
+    @patch('feed.brotli', None)
+    def test_without_brotli_module(self):
+        """Test fallback to gzip when brotli isn't installed"""
+        self.assertEqual(feed.choose_encoding('gzip, deflate, br'), 'gzip')
+    
+    @patch('feed.brotli', object())
+    def test_quality_values(self):
+        """Test q-values, including explicit refusal"""
+        self.assertEqual(feed.choose_encoding('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertEqual(feed.choose_encoding('br;q=0, gzip;q=0'), 'identity')
+        self.assertEqual(feed.choose_encoding('*'), 'br')
+        self.assertEqual(feed.choose_encoding('identity'), 'identity')
+    
+    def test_no_header(self):
+        """Test that missing header means uncompressed"""
+        self.assertEqual(feed.choose_encoding(None), 'identity')
+        self.assertEqual(feed.choose_encoding(''), 'identity')
+
+
+
+class TestSizedCache(unittest.TestCase):
+    """Test byte-bounded feed caches"""
+    
+    def _entry(self, size):
+        return {'rss_xml': b'x' * size, 'last_modified': 0}
+    
+    def test_evicts_least_recently_used_by_size(self):
+        """Test that entries are evicted by bytes, oldest use first"""
+        size = feed.cache_value_size(self._entry(1000))
+        cache = feed.SizedLRUCache(maxsize=size * 3)
+        cache['a'] = self._entry(1000)
+        cache['b'] = self._entry(1000)
+        cache['c'] = self._entry(1000)
+        cache['a']
+        
+        # One large entry displaces the two least recently used
+        cache['big'] = self._entry(1800)
+        self.assertEqual(sorted(cache.keys()), ['a', 'big'])
+        self.assertEqual(cache.evictions, 2)
+        self.assertLessEqual(cache.currsize, cache.maxsize)
+    
+    def test_oversized_entry_not_cached(self):
+        """Test that an entry larger than the cache is skipped, not raised"""
+        cache = feed.SizedTTLCache(maxsize=1000, ttl=60)
+        cache['small'] = self._entry(10)
+        cache['huge'] = self._entry(5000)
+        self.assertNotIn('huge', cache)
+        self.assertIn('small', cache)
+        usage = cache.usage()
+        self.assertEqual(usage['rejected'], 1)
+        self.assertEqual(usage['evictions'], 0)
+        self.assertEqual(usage['entries'], 1)
+        self.assertEqual(usage['bytes'], feed.cache_value_size(self._entry(10)))
+    
+    def test_usage_in_health_check(self):
+        """Test that resident size is exposed on the health check"""
+        status = feed.index()
+        self.assertEqual(set(status['cache_memory']), {'items', 'templates', 'rendered'})
+        self.assertEqual(sum(usage['max_bytes'] for usage in status['cache_memory'].values()), feed.CACHE_MAX_BYTES)
+    
+    def test_item_cache_bounded_by_bytes(self):
+        """Test that episode items count against CACHE_MAX_BYTES and are reported"""
+        self.assertIsInstance(feed._item_cache, feed.SizedLRUCache)
+        self.assertEqual(feed._item_cache.maxsize, feed.ITEM_CACHE_BYTES)
+        
+        feed._item_cache.clear()
+        self.addCleanup(feed._item_cache.clear)
+        item = feed.get_episode_item('20251222-0740-5f3a2b1c.m4a', 1000, 1766356800.0, None, 'Morning',
+                                     feed.FEED_BASE_PLACEHOLDER)
+        usage = feed.cache_memory_usage()['items']
+        self.assertEqual((usage['entries'], usage['bytes']), (1, sys.getsizeof(item)))
+
+
+
+
+class TestFileCaching(unittest.TestCase):
+    """Test caching headers and validators for recordings and logos"""
+    
+    NAME = '20251222-0740-aaaaaaaa.m4a'
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        (self.tmp / 'logo').mkdir()
+        for target, value in [
+            ('feed.RECORDINGS_DIR', self.tmp),
+            ('feed.LOGO_DIR', self.tmp / 'logo'),
+            ('feed._logo_files', {}),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _request(self, path, headers=None):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = path
+        environ.update(headers or {})
+        result = {}
+        def start_response(status, response_headers, exc_info=None):
+            result['status'] = status
+            result['headers'] = {name.lower(): value for name, value in response_headers}
+        body = b''.join(feed.app(environ, start_response))
+        return result['status'], result['headers'], body
+    
+    def _write(self, path, body, age):
+        path.write_bytes(body)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    
+    def test_finished_recording_immutable(self):
+        """Test finished recordings are immutable with a size/mtime ETag"""
+        self._write(self.tmp / self.NAME, b'x' * 100, age=3600)
+        status, headers, body = self._request(f'/radio/{self.NAME}')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['cache-control'], 'public, max-age=31536000, immutable')
+        st = (self.tmp / self.NAME).stat()
+        self.assertEqual(headers['etag'], f'"{st.st_size:x}-{st.st_mtime_ns:x}"')
+        
+        status, headers, body = self._request(f'/radio/{self.NAME}', {'HTTP_IF_NONE_MATCH': headers['etag']})
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(body, b'')
+    
+    def test_in_progress_recording_revalidated(self):
+        """Test recordings still being written are not cached as immutable"""
+        self._write(self.tmp / self.NAME, b'x' * 100, age=5)
+        status, headers, _ = self._request(f'/radio/{self.NAME}')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        
+        # The recording grows, so the old ETag no longer matches
+        etag = headers['etag']
+        self._write(self.tmp / self.NAME, b'x' * 200, age=0)
+        status, headers, _ = self._request(f'/radio/{self.NAME}', {'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(status, '200 OK')
+        self.assertNotEqual(headers['etag'], etag)
+    
+    def test_range_request_keeps_headers(self):
+        """Test partial responses carry the same validators"""
+        self._write(self.tmp / self.NAME, b'x' * 100, age=3600)
+        status, headers, body = self._request(f'/radio/{self.NAME}', {'HTTP_RANGE': 'bytes=0-9'})
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(len(body), 10)
+        self.assertIn('immutable', headers['cache-control'])
+    
+    def test_logo_etag_and_memory(self):
+        """Test logos support ETag/304 and are read from disk only when replaced"""
+        logo = self.tmp / 'logo' / 'default.png'
+        self._write(logo, b'PNG1', age=3600)
+        status, headers, body = self._request('/radio/logo/default.png')
+        self.assertEqual((status, body, headers['content-type']), ('200 OK', b'PNG1', 'image/png'))
+        self.assertEqual(self._request('/radio/logo/default.png', {'HTTP_IF_NONE_MATCH': headers['etag']})[0],
+                         '304 Not Modified')
+        
+        with patch.object(Path, 'read_bytes', side_effect=AssertionError('read from disk')):
+            self.assertEqual(self._request('/radio/logo/default.png')[2], b'PNG1')
+        
+        self._write(logo, b'PNG22', age=0)
+        self.assertEqual(self._request('/radio/logo/default.png')[2], b'PNG22')
+    
+    def test_missing_files(self):
+        """Test missing files and directories are 404"""
+        (self.tmp / '2025').mkdir()
+        self.assertEqual(self._request('/radio/logo/missing.png')[0], '404 Not Found')
+        self.assertEqual(self._request('/radio/missing.m4a')[0], '404 Not Found')
+        self.assertEqual(self._request('/radio/2025')[0], '404 Not Found')
+
+
+class TestVariants(unittest.TestCase):
+    """Test ?variant= transcoding with the disk LRU cache"""
+    
+    NAME = '20251222-0740-aaaaaaaa.m4a'
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.transcodes = []
+        for target, value in [
+            ('feed.RECORDINGS_DIR', self.tmp),
+            ('feed.VARIANTS_DIR', self.tmp / 'variants'),
+            ('feed.VARIANT_MAX_BYTES', 1000),
+            ('feed.transcode', self._transcode),
+            ('feed._variant_jobs', {}),
+            ('feed._variant_stats', {}),
+            ('feed._variant_usage', None),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self._write(self.tmp / self.NAME, b'x' * 1000, age=3600)
+    
+    _request = TestFileCaching._request
+    _write = TestFileCaching._write
+    
+    def _transcode(self, source, target, variant):
+        self.transcodes.append(source.name)
+        time.sleep(0.05)
+        target.write_bytes(source.read_bytes()[:300])
+    
+    def test_variant_transcoded_once(self):
+        """Test the variant is transcoded on first use and then served from disk"""
+        status, headers, body = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, b'x' * 300)
+        self.assertEqual(headers['cache-control'], 'public, max-age=31536000, immutable')
+        self.assertTrue(headers['etag'].endswith('-low"'))
+        
+        status, _, body = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(body, b'x' * 300)
+        self.assertEqual(self.transcodes, [self.NAME])
+        self.assertEqual(feed._variant_stats, {('low', 'transcoded'): 1, ('low', 'hit'): 1})
+        
+        # Conditional requests don't need the variant file
+        status, _, _ = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low',
+                                                              'HTTP_IF_NONE_MATCH': headers['etag']})
+        self.assertEqual(status, '304 Not Modified')
+        
+        # The original is unchanged
+        status, _, body = self._request(f'/radio/{self.NAME}')
+        self.assertEqual(len(body), 1000)
+    
+    def test_concurrent_requests_share_job(self):
+        """Test simultaneous requests for one variant wait for a single transcode"""
+        bodies = []
+        threads = [threading.Thread(target=lambda: bodies.append(
+            self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})[2])) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(bodies, [b'x' * 300] * 5)
+        self.assertEqual(self.transcodes, [self.NAME])
+    
+    def test_lru_eviction(self):
+        """Test least recently used variants are evicted beyond VARIANT_MAX_BYTES"""
+        names = [f'2025122{i}-0740-aaaaaaaa.m4a' for i in range(1, 5)]
+        for name in names:
+            self._write(self.tmp / name, b'x' * 1000, age=3600)
+        for name in names[:3]:
+            self._request(f'/radio/{name}', {'QUERY_STRING': 'variant=low'})
+        # Use the first one again, so the second is the least recently used
+        first = next((self.tmp / 'variants').glob('20251221-*'))
+        os.utime(first, (time.time() + 10, first.stat().st_mtime))
+        self._request(f'/radio/{names[3]}', {'QUERY_STRING': 'variant=low'})
+        
+        cached = sorted(path.name[:8] for path in (self.tmp / 'variants').glob('*.m4a'))
+        self.assertEqual(cached, ['20251221', '20251223', '20251224'])
+        self.assertEqual(feed._variant_stats[('low', 'evicted')], 1)
+        self.assertEqual(feed._variant_usage, 900)
+    
+    def test_changed_original_new_variant(self):
+        """Test a replaced original is transcoded again"""
+        self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self._write(self.tmp / self.NAME, b'y' * 1000, age=1800)
+        _, _, body = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(body, b'y' * 300)
+        self.assertEqual(len(self.transcodes), 2)
+    
+    def test_unknown_variant_and_in_progress(self):
+        """Test unknown variants are rejected and recordings being written are served as is"""
+        status, _, _ = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=huge'})
+        self.assertEqual(status, '400 Bad Request')
+        
+        self._write(self.tmp / self.NAME, b'x' * 1000, age=5)
+        status, headers, body = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(len(body), 1000)
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        self.assertEqual(self.transcodes, [])
+    
+    def test_failed_transcode(self):
+        """Test a failed transcode answers 500 and is retried on the next request"""
+        with patch('feed.transcode', side_effect=RuntimeError('ffmpeg exploded')):
+            status, _, _ = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertEqual(feed._variant_stats[('low', 'failed')], 1)
+        
+        status, _, _ = self._request(f'/radio/{self.NAME}', {'QUERY_STRING': 'variant=low'})
+        self.assertEqual(status, '200 OK')
+
+
+class TestLiveRecordings(unittest.TestCase):
+    """Test live episodes of recordings in progress (HLS playlist and segments)"""
+    
+    STEM = '20251222-0740-aaaaaaaa'
+    PROGRAMS = {
+        'morning': {'name': 'Morning', 'schedule': ['0740'], 'limit': 100},
+        'evening': {'name': 'Evening', 'schedule': ['2000'], 'limit': 100},
+    }
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        for target, value in [
+            ('feed.RECORDINGS_DIR', self.tmp),
+            ('feed.PROGRAMS', self.PROGRAMS),
+            ('feed._live_markers', {}),
+            ('feed._catalog', feed.EpisodeCatalog(':memory:', self.tmp)),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.started = time.time() - 60
+        self.marker = self._write_marker(self.STEM, self.started)
+        # Two connections: the recorder reconnected after the first segment
+        (self.tmp / f'.{self.STEM}.01.csv').write_text(f'.{self.STEM}.01-0000.ts,0.000000,10.005000\n')
+        (self.tmp / f'.{self.STEM}.03.csv').write_text(
+            f'.{self.STEM}.03-0000.ts,0.000000,10.000000\n.{self.STEM}.03-0001.ts,10.000000,19.980000\n')
+        for name in ('01-0000', '03-0000', '03-0001', '03-0002'):
+            (self.tmp / f'.{self.STEM}.{name}.ts').write_bytes(b'ts' * 100)
+    
+    _request = TestFileCaching._request
+    
+    def _write_marker(self, stem, started, duration=1200):
+        path = self.tmp / f'.live-{stem}.json'
+        path.write_text(json.dumps({
+            'name': f'{stem}.m4a', 'program_id': 'morning', 'dir': '.',
+            'started': datetime.datetime.fromtimestamp(started).astimezone().isoformat(timespec='seconds'),
+            'ends': datetime.datetime.fromtimestamp(started + duration).astimezone().isoformat(timespec='seconds'),
+            'segment_seconds': 10,
+        }))
+        return path
+    
+    def test_live_episode_heads_feed(self):
+        """Test a recording in progress is listed first in its program's feed"""
+        feed.scan_live_markers()
+        rss_xml, last_modified = feed._generate_podcast_feed_internal('Morning', 'morning', ['0740'])
+        items = etree.fromstring(rss_xml.encode('utf-8')).findall('channel/item')
+        
+        self.assertEqual(len(items), 1)
+        self.assertTrue(items[0].findtext('title').endswith('(LIVE)'))
+        self.assertEqual(items[0].findtext('guid'), f'live-{self.STEM}.m4a')
+        enclosure = items[0].find('enclosure')
+        self.assertEqual(enclosure.get('url'), f'{feed.FEED_BASE_PLACEHOLDER}live/{self.STEM}.m3u8')
+        self.assertEqual(enclosure.get('type'), 'application/vnd.apple.mpegurl')
+        self.assertEqual(last_modified, int(self.started))
+        
+        # Not in other programs' feeds
+        rss_xml, _ = feed._generate_podcast_feed_internal('Evening', 'evening', ['2000'])
+        self.assertNotIn('live/', rss_xml)
+    
+    def test_playlist_lists_completed_segments(self):
+        """Test the playlist holds listed segments only, with a discontinuity at the reconnect"""
+        status, headers, body = self._request(f'/radio/live/{self.STEM}.m3u8')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['content-type'], 'application/vnd.apple.mpegurl')
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        self.assertEqual(body.decode().splitlines(), [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            '#EXT-X-PLAYLIST-TYPE:EVENT',
+            '#EXT-X-TARGETDURATION:11',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXTINF:10.005,',
+            f'{self.STEM}.01-0000.ts',
+            '#EXT-X-DISCONTINUITY',
+            '#EXTINF:10.000,',
+            f'{self.STEM}.03-0000.ts',
+            '#EXTINF:9.980,',
+            f'{self.STEM}.03-0001.ts',
+        ])
+    
+    def test_segment_partial_content(self):
+        """Test completed segments are served with Range support"""
+        status, headers, body = self._request(f'/radio/live/{self.STEM}.03-0001.ts', {'HTTP_RANGE': 'bytes=0-9'})
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(body, b'ts' * 5)
+        self.assertEqual(headers['content-type'], 'video/mp2t')
+        self.assertEqual(feed._file_stats.get(('live', 206)), [1, 10])
+        
+        # The segment still being written is not listed yet
+        status, _, _ = self._request(f'/radio/live/{self.STEM}.03-0002.ts')
+        self.assertEqual(status, '404 Not Found')
+    
+    def test_finished_or_abandoned_recording(self):
+        """Test playlists end with the marker, and markers of recorders that died expire"""
+        self.marker.unlink()
+        status, _, _ = self._request(f'/radio/live/{self.STEM}.m3u8')
+        self.assertEqual(status, '404 Not Found')
+        
+        self._write_marker(self.STEM, time.time() - 7200, duration=600)
+        self.assertIsNone(feed.read_live_marker(f'.live-{self.STEM}.json'))
+        feed.scan_live_markers()
+        self.assertEqual(feed.live_recordings(), [])
+    
+    def test_marker_events(self):
+        """Test marker changes refresh the live list and the program's feeds"""
+        feed._feed_cache.clear()
+        self.addCleanup(feed._feed_cache.clear)
+        for program_id in ('morning', 'evening', None):
+            feed._feed_cache[(program_id, None, 'http://host/radio/')] = 'rss'
+        
+        feed.handle_fs_event(self.tmp, f'.live-{self.STEM}.json')
+        self.assertEqual([marker['stem'] for marker in feed.live_recordings('morning')], [self.STEM])
+        self.assertEqual([key[0] for key in feed._feed_cache.keys()], ['evening'])
+        
+        self.marker.unlink()
+        feed.handle_fs_event(self.tmp, f'.live-{self.STEM}.json')
+        self.assertEqual(feed.live_recordings(), [])
+
+
+class TestSharedFeedCache(unittest.TestCase):
+    """Test the SQLite feed cache shared by workers and restarts"""
+    
+    PROGRAMS = {'program1': {'name': 'Program Name #1', 'schedule': ['0740'], 'limit': 100}}
+    BASE_URL = 'http://localhost:8013/radio/'
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.catalog = feed.EpisodeCatalog(':memory:', feed.RECORDINGS_DIR)
+        self._insert('20251201-0740-00000001.m4a')
+        for target, value in [
+            ('feed.PROGRAMS', self.PROGRAMS),
+            ('feed._catalog', self.catalog),
+            ('feed.refresh_catalog', lambda: None),
+            ('feed.get_base_url', lambda: self.BASE_URL),
+            ('feed._shared_cache', feed.SharedFeedCache(self.tmp / 'feeds.db')),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self._restart()
+        self.addCleanup(self._restart)
+    
+    def _insert(self, name):
+        with self.catalog._connect() as conn:
+            conn.execute('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                         'VALUES (?, 1000, 1764547200.0, NULL, ?)', (name, 'program1'))
+        self.catalog._snapshot = None
+    
+    def _restart(self):
+        """Drop everything held in process memory, as a new worker starts with."""
+        for cache in (feed._feed_cache, feed._rendered_cache, feed._item_cache):
+            cache.clear()
+        feed._shared_cache = feed.SharedFeedCache(self.tmp / 'feeds.db')
+    
+    def _feed(self):
+        return feed.generate_podcast_feed_xml('Program Name #1', 'program1', ['0740'])
+    
+    def test_generated_once_for_all_workers(self):
+        """Test a feed generated by one process is reused by the next"""
+        first = self._feed()
+        self._restart()
+        with patch('feed._generate_podcast_feed_internal') as generate:
+            second = self._feed()
+        generate.assert_not_called()
+        self.assertEqual(first['etag'], second['etag'])
+    
+    def test_stale_feed_not_reused(self):
+        """Test recordings added since the feed was stored cause regeneration"""
+        self._feed()
+        self._restart()
+        self._insert('20251202-0740-00000002.m4a')
+        self.assertIn(b'20251202-0740-00000002.m4a', self._feed()['rss_xml'])
+        
+        # The regenerated feed replaced the stored one
+        self._restart()
+        with patch('feed._generate_podcast_feed_internal') as generate:
+            self.assertIn(b'20251202-0740-00000002.m4a', self._feed()['rss_xml'])
+        generate.assert_not_called()
+    
+    def test_unusable_database(self):
+        """Test an unwritable location falls back to per-process caching"""
+        (self.tmp / 'file').write_text('')
+        shared = feed.SharedFeedCache(self.tmp / 'file' / 'feeds.db')
+        shared.put(('key',), 'fingerprint', {'rss_xml': '', 'digest': '', 'last_modified': None})
+        self.assertIsNone(shared.get(('key',), 'fingerprint'))
+
+class TestStartup(unittest.TestCase):
+    """Test warm-up and the readiness endpoint"""
+    
+    PROGRAMS = {'program1': {'name': 'Program Name #1', 'schedule': ['0740'], 'limit': 2}}
+    BASE_URL = 'http://localhost:8013/radio/'
+    
+    def setUp(self):
+        self.catalog = feed.EpisodeCatalog(':memory:', feed.RECORDINGS_DIR)
+        with self.catalog._connect() as conn:
+            conn.execute('INSERT INTO episodes (name, size, mtime, duration, program_id) '
+                         "VALUES ('20251201-0740-00000001.m4a', 1000, 1764547200.0, NULL, 'program1')")
+        for target, value in [
+            ('feed.PROGRAMS', self.PROGRAMS),
+            ('feed.SECRETS', []),
+            ('feed.FEED_LIMIT', 100),
+            ('feed._catalog', self.catalog),
+            ('feed.refresh_catalog', lambda: None),
+            ('feed._ready', threading.Event()),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cache in (feed._feed_cache, feed._rendered_cache, feed._warm_keys):
+            cache.clear()
+            self.addCleanup(cache.clear)
+    
+    def test_subscription_keys(self):
+        """Test keys match the subscription feeds requested by podcast apps"""
+        self.assertEqual(feed.subscription_keys(), [
+            (None, None, None, 100, ()),
+            ('program1', ('0740',), None, 2, ()),
+        ])
+        with patch('feed.SECRETS', ['s1', 's2']):
+            keys = feed.subscription_keys()
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(keys[0][4], (('secret', 's1'),))
+    
+    def test_warm_up_fills_cache(self):
+        """Test the first request after warm-up is a cache hit"""
+        self.assertFalse(feed._ready.is_set())
+        feed.warm_up()
+        self.assertTrue(feed._ready.is_set())
+        
+        with patch('feed._generate_podcast_feed_internal') as generate, \
+             patch('feed.get_base_url', return_value=self.BASE_URL):
+            entry = feed.generate_podcast_feed_xml('Program Name #1', 'program1', ['0740'], None, 2)
+            feed.generate_podcast_feed_xml(limit=100)
+        generate.assert_not_called()
+        self.assertIn(b'20251201-0740-00000001.m4a', entry['rss_xml'])
+    
+    def test_ready_after_failed_warm_up(self):
+        """Test that a failing warm-up doesn't keep the service unready"""
+        with patch('feed.prewarm_feeds', side_effect=RuntimeError('boom')):
+            feed.warm_up()
+        self.assertTrue(feed._ready.is_set())
+    
+    def test_readiness_endpoint(self):
+        """Test /ready answers 503 until ready while / stays live"""
+        def status(path):
+            environ = {}
+            setup_testing_defaults(environ)
+            environ['PATH_INFO'] = path
+            result = []
+            b''.join(feed.app(environ, lambda s, h, e=None: result.append(s)))
+            return result[0]
+        
+        self.assertEqual(status('/ready'), '503 Service Unavailable')
+        self.assertEqual(status('/'), '200 OK')
+        with patch('feed.WARMUP', False):
+            feed.start_warmup()
+        self.assertEqual(status('/ready'), '200 OK')
+
+class TestMetrics(unittest.TestCase):
+    """Test the Prometheus metrics export"""
+    
+    def setUp(self):
+        for name, value in (('_generation_histograms', {}), ('_file_stats', {})):
+            patcher = patch.object(feed, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        catalog = EpisodeCatalog(':memory:', self.tmp)
+        with catalog._connect() as conn:
+            conn.executemany(
+                'INSERT INTO episodes (name, size, mtime, duration, program_id) VALUES (?, ?, ?, ?, ?)', [
+                    ('20251222-0740-aaaaaaaa.m4a', 1000, 1.0, None, 'morning'),
+                    ('20251223-0740-bbbbbbbb.m4a', 3000, 2.0, None, 'morning'),
+                    ('20251223-1200-cccccccc.m4a', 500, 3.0, None, None),
+                ])
+        patcher = patch('feed._catalog', catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _request(self, path, headers=None):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = path
+        environ.update(headers or {})
+        result = {}
+        def start_response(status, response_headers, exc_info=None):
+            result['status'] = status
+            result['headers'] = dict(response_headers)
+        body = b''.join(feed.app(environ, start_response))
+        return result['status'], result['headers'], body
+    
+    def test_metrics_endpoint(self):
+        """Test generation latency and archive totals in the exposition format"""
+        feed.observe_generation('morning', 0.03)
+        feed.observe_generation('morning', 20.0)
+        
+        status, headers, body = self._request('/metrics')
+        self.assertEqual(status, '200 OK')
+        self.assertTrue(headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = body.decode().splitlines()
+        self.assertIn('radio_feed_generation_seconds_bucket{program="morning",le="0.025"} 0', lines)
+        self.assertIn('radio_feed_generation_seconds_bucket{program="morning",le="0.05"} 1', lines)
+        self.assertIn('radio_feed_generation_seconds_bucket{program="morning",le="+Inf"} 2', lines)
+        self.assertIn('radio_feed_generation_seconds_count{program="morning"} 2', lines)
+        self.assertIn('radio_archive_episodes{program="morning"} 2', lines)
+        self.assertIn('radio_archive_bytes{program="morning"} 4000', lines)
+        self.assertIn('radio_archive_bytes{program="all"} 4500', lines)
+        self.assertIn('# TYPE radio_feed_cache_bytes gauge', lines)
+        self.assertIn(f'radio_feed_cache_max_bytes{{cache="items"}} {feed.ITEM_CACHE_BYTES}', lines)
+    
+    def test_file_requests_counted(self):
+        """Test that serve_file counts requests and bytes actually sent"""
+        (self.tmp / '20251222-0740-aaaaaaaa.m4a').write_bytes(b'x' * 100)
+        with patch('feed.RECORDINGS_DIR', self.tmp):
+            self._request('/radio/20251222-0740-aaaaaaaa.m4a')
+            self._request('/radio/20251222-0740-aaaaaaaa.m4a', {'HTTP_RANGE': 'bytes=0-9'})
+            self._request('/radio/20251222-0740-aaaaaaaa.m4a', {'REQUEST_METHOD': 'HEAD'})
+            self._request('/radio/missing.m4a')
+        
+        self.assertEqual(feed._file_stats[('recording', 200)], [2, 100])
+        self.assertEqual(feed._file_stats[('recording', 206)], [1, 10])
+        self.assertEqual(feed._file_stats[('recording', 404)], [1, 0])
+        self.assertIn('radio_file_sent_bytes_total{kind="recording"} 110', feed.render_metrics().splitlines())
+    
+    def test_label_escaping(self):
+        """Test that label values are escaped"""
+        self.assertEqual(feed._metric_labels({'program': 'a"b\\c\nd'}), '{program="a\\"b\\\\c\\nd"}')
+        self.assertEqual(feed._metric_labels({}), '')
+
 if __name__ == '__main__':
     unittest.main()
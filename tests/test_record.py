@@ -3,7 +3,11 @@ Tests for record.py program configuration parsing
 Uses Python's built-in unittest framework
 """
 
+import datetime
 import os
+import shutil
+import tempfile
+import time
 import unittest
 from unittest.mock import patch
 import sys
@@ -11,7 +15,17 @@ import sys
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from record import parse_programs_config, calculate_duration_from_time, parse_and_validate_args, is_today_scheduled, WEEKDAYS
+from pathlib import Path
+from record import parse_programs_config, calculate_duration_from_time, parse_and_validate_args, is_today_scheduled, recording_directory, WEEKDAYS
+from record import parse_size, parse_retention_config, list_recordings, select_expired, enforce_retention
+from record import finalize_recording, sidecar_path
+from record import acquire_lock, release_lock, active_locks, main
+from record import next_start, in_progress, run_daemon
+import record
+import socket
+import subprocess
+import threading
+import json
 
 
 class TestIsTodayScheduled(unittest.TestCase):
@@ -189,47 +203,47 @@ class TestCalculateDurationFromTime(unittest.TestCase):
 class TestParseAndValidateArgs(unittest.TestCase):
     """Test parse_and_validate_args function"""
     
+    def at(self, hhmm):
+        return datetime.datetime(2025, 12, 26, int(hhmm[:2]), int(hhmm[2:]))
+    
     @patch('sys.argv', ['record.py', '30'])
     @patch.dict(os.environ, {'STREAM_URL': 'default_url'})
     def test_manual_duration(self):
         """Test manual duration from command line"""
-        duration, start_time, url = parse_and_validate_args()
+        [(duration, start_time, url, program_id)] = parse_and_validate_args()
         self.assertEqual(duration, 1800)  # 30 minutes * 60 seconds
         self.assertEqual(url, 'default_url')
+        self.assertIsNone(program_id)
     
     @patch('sys.argv', ['record.py'])
     @patch.dict(os.environ, {
         'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1|url1'
     }, clear=True)
-    @patch('time.strftime', return_value='0740')
-    @patch('record.is_today_scheduled', return_value=True)
-    def test_auto_duration_exact_match(self, mock_scheduled, mock_time):
+    def test_auto_duration_exact_match(self):
         """Test auto duration with exact time match"""
-        duration, start_time, url = parse_and_validate_args()
+        [(duration, start_time, url, program_id)] = parse_and_validate_args(now=self.at('0740'))
         self.assertEqual(duration, 1200)  # 20 minutes
         self.assertEqual(url, 'url1')
+        self.assertEqual(program_id, 'program1')
     
     @patch('sys.argv', ['record.py'])
     @patch.dict(os.environ, {
         'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1|url1'
     }, clear=True)
-    @patch('time.strftime', return_value='0742')
-    @patch('record.is_today_scheduled', return_value=True)
-    def test_auto_duration_within_tolerance(self, mock_scheduled, mock_time):
-        """Test auto duration within 5-minute tolerance"""
-        duration, start_time, url = parse_and_validate_args()
-        self.assertEqual(duration, 1200)  # 20 minutes
+    def test_auto_duration_within_tolerance(self):
+        """Test a show started a few minutes ago is recorded for the rest of it"""
+        [(duration, start_time, url, program_id)] = parse_and_validate_args(now=self.at('0742'))
+        self.assertEqual(duration, 1080)  # 18 minutes left
+        self.assertEqual(start_time, '0740')
     
     @patch('sys.argv', ['record.py'])
     @patch.dict(os.environ, {
         'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1|url1'
     }, clear=True)
-    @patch('time.strftime', return_value='0750')
-    @patch('record.is_today_scheduled', return_value=True)
-    def test_auto_duration_outside_tolerance(self, mock_scheduled, mock_time):
+    def test_auto_duration_outside_tolerance(self):
         """Test auto duration outside 5-minute tolerance"""
         with self.assertRaises(SystemExit):
-            parse_and_validate_args()
+            parse_and_validate_args(now=self.at('0750'))
     
     @patch('sys.argv', ['record.py'])
     @patch.dict(os.environ, {}, clear=True)
@@ -256,14 +270,747 @@ class TestParseAndValidateArgs(unittest.TestCase):
         'PROGRAM2': '07:40-08:00|ALL|program1|Program Name #1|url2',
         'PROGRAM3': '18:00-19:00|ALL|evening|Evening Show|url3'
     }, clear=True)
-    @patch('time.strftime', return_value='0740')
-    @patch('record.is_today_scheduled', return_value=True)
-    def test_multiple_programs_correct_match(self, mock_scheduled, mock_time):
+    def test_multiple_programs_correct_match(self):
         """Test matching correct program among multiple"""
-        duration, start_time, url = parse_and_validate_args()
+        [(duration, start_time, url, program_id)] = parse_and_validate_args(now=self.at('0740'))
         self.assertEqual(duration, 1200)  # Matches PROGRAM2 (20 minutes)
         self.assertEqual(url, 'url2')
+    
+    @patch('sys.argv', ['record.py'])
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|ALL|program1|Program Name #1|url1',
+        'PROGRAM2': '07:38-09:00|ALL|program2|Program Name #2|url2',
+        'PROGRAM3': '07:30-07:45|ALL|program3|Program Name #3|url3'
+    }, clear=True)
+    def test_overlapping_programs_all_matched(self):
+        """Test every program starting within the window is returned, closest start first"""
+        matches = parse_and_validate_args(now=self.at('0741'))
+        self.assertEqual([m[3] for m in matches], ['program1', 'program2'])
+        self.assertEqual([m[0] for m in matches], [1140, 4740])
+    
+    @patch('sys.argv', ['record.py'])
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-07:42|ALL|news|News|url1',
+        'PROGRAM2': '07:43-08:00|ALL|show|Show|url1'
+    }, clear=True)
+    def test_ended_program_not_recorded_again(self):
+        """Test a short show that already ended is not recorded again in the window"""
+        self.assertEqual(parse_and_validate_args(now=self.at('0743')), [(1020, '0743', 'url1', 'show')])
+    
+    @patch('sys.argv', ['record.py'])
+    @patch.dict(os.environ, {
+        'PROGRAM1': '23:58-00:10|FRI|late|Late Show|url1'
+    }, clear=True)
+    def test_show_past_midnight(self):
+        """Test a show started yesterday before midnight is still matched"""
+        now = datetime.datetime(2025, 12, 27, 0, 1)
+        self.assertEqual(parse_and_validate_args(now=now), [(540, '2358', 'url1', 'late')])
+
+
+
+class TestRecordingDirectory(unittest.TestCase):
+    """Test recording_directory function"""
+    
+    @patch('record.RECORDINGS_DIR', Path('/app/recordings'))
+    @patch('record.RECORDINGS_LAYOUT', 'flat')
+    def test_flat_layout(self):
+        """Test recordings are saved directly in RECORDINGS_DIR by default"""
+        self.assertEqual(recording_directory('20251222'), Path('/app/recordings'))
+    
+    @patch('record.RECORDINGS_DIR', Path('/app/recordings'))
+    @patch('record.RECORDINGS_LAYOUT', 'sharded')
+    def test_sharded_layout(self):
+        """Test recordings are saved in YYYY/MM subdirectories"""
+        self.assertEqual(recording_directory('20251222'), Path('/app/recordings/2025/12'))
+
+
+class TestRecordingLocks(unittest.TestCase):
+    """Test per-program locks and concurrent recordings"""
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        for target, value in [('record.LOCK_DIR', self.tmp / '.locks'), ('record.RECORDINGS_DIR', self.tmp)]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # main() installs stop handlers; keep the test runner's
+        patcher = patch('record.signal.signal')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _hold_lock(self, program_id):
+        """Lock a program from another process, like a recorder in another container"""
+        (self.tmp / '.locks').mkdir(exist_ok=True)
+        path = self.tmp / '.locks' / f'{program_id}.lock'
+        holder = subprocess.Popen(
+            [sys.executable, '-c',
+             'import fcntl, sys, time\n'
+             'f = open(sys.argv[1], "w")\n'
+             'fcntl.flock(f, fcntl.LOCK_EX)\n'
+             'print("locked", flush=True)\n'
+             'time.sleep(60)\n',
+             str(path)],
+            stdout=subprocess.PIPE, text=True)
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.kill)
+        self.assertEqual(holder.stdout.readline().strip(), 'locked')
+        self.addCleanup(holder.stdout.close)
+        return holder
+    
+    def _acquire(self, program_id):
+        lock = acquire_lock(program_id, 1200)
+        if lock is not None:
+            self.addCleanup(release_lock, lock)
+        return lock
+    
+    def test_lock_per_program(self):
+        """Test a program can't be locked twice while others can"""
+        lock = self._acquire('program1')
+        self.assertIsNotNone(lock)
+        self.assertIsNone(self._acquire('program1'))
+        self.assertIsNotNone(self._acquire('program2'))
+        self.assertEqual(len(active_locks()), 2)
+        
+        release_lock(lock)
+        self.assertFalse(lock.exists())
+        self.assertIsNotNone(self._acquire('program1'))
+    
+    def test_leftover_lock_file_is_taken_over(self):
+        """Test a lock file left by a killed recorder doesn't block the program"""
+        (self.tmp / '.locks').mkdir()
+        leftover = self.tmp / '.locks' / 'program1.lock'
+        leftover.write_text(json.dumps({'pid': 1, 'host': socket.gethostname()}))
+        self.assertEqual(active_locks(), [])
+        
+        self.assertIsNotNone(self._acquire('program1'))
+        self.assertEqual(json.loads(leftover.read_text())['pid'], os.getpid())
+    
+    def test_lock_held_until_holder_dies(self):
+        """Test another process's lock is respected until that process is gone"""
+        holder = self._hold_lock('program1')
+        self.assertIsNone(self._acquire('program1'))
+        self.assertEqual([path.name for path in active_locks()], ['program1.lock'])
+        
+        holder.kill()
+        holder.wait()
+        self.assertEqual(active_locks(), [])
+        self.assertIsNotNone(self._acquire('program1'))
+    
+    @patch('record.enforce_retention')
+    @patch('record.parse_and_validate_args')
+    def test_overlapping_programs_recorded_in_parallel(self, mock_args, mock_retention):
+        """Test matched programs are recorded at the same time, each under its own lock"""
+        mock_args.return_value = [(1200, '0740', 'url1', 'program1'), (4920, '0738', 'url2', 'program2')]
+        barrier = threading.Barrier(2, timeout=5)
+        recorded = []
+        
+        def fake_recording(sec, url, start_time, program_id):
+            # Both recordings must be running at once to pass the barrier
+            barrier.wait()
+            self.assertTrue((self.tmp / '.locks' / f'{program_id}.lock').exists())
+            recorded.append(program_id)
+            return self.tmp / f'{program_id}.m4a'
+        
+        with patch('record.execute_recording', side_effect=fake_recording):
+            main()
+        self.assertEqual(sorted(recorded), ['program1', 'program2'])
+        self.assertEqual(list((self.tmp / '.locks').iterdir()), [])
+        mock_retention.assert_called_once()
+    
+    @patch('record.MAX_CONCURRENT_RECORDINGS', 2)
+    @patch('record.enforce_retention')
+    @patch('record.parse_and_validate_args')
+    def test_concurrency_cap_and_failures(self, mock_args, mock_retention):
+        """Test programs beyond the cap are skipped and a failed recording fails the run"""
+        self._hold_lock('program9')
+        mock_args.return_value = [(1200, '0740', 'url1', 'program1'), (1200, '0740', 'url2', 'program2')]
+        
+        with patch('record.execute_recording', side_effect=SystemExit(1)) as mock_recording:
+            with self.assertRaises(SystemExit) as cm:
+                main()
+        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(mock_recording.call_count, 1)
+        self.assertFalse((self.tmp / '.locks' / 'program1.lock').exists())
+
+
+class TestDaemonScheduler(unittest.TestCase):
+    """Test the daemon mode's in-process scheduler"""
+    
+    PROGRAMS = {
+        'weekday': {'name': 'Weekday', 'schedule': [{'start': '0740', 'end': '0800'}], 'url': 'url1', 'days': 'MON-FRI'},
+        'weekend': {'name': 'Weekend', 'schedule': [{'start': '0740', 'end': '0900'}], 'url': 'url2', 'days': 'SAT,SUN'},
+        'late': {'name': 'Late', 'schedule': [{'start': '2358', 'end': '0010'}], 'url': 'url3', 'days': 'ALL'},
+        'also_weekday': {'name': 'Also', 'schedule': [{'start': '0740', 'end': '0750'}], 'url': 'url4', 'days': 'MON-FRI'},
+    }
+    # Friday
+    FRIDAY = datetime.datetime(2025, 12, 26, 7, 0)
+    
+    def test_next_start_same_day(self):
+        """Test programs starting at the same time are due together"""
+        start, due = next_start(self.PROGRAMS, self.FRIDAY)
+        self.assertEqual(start, datetime.datetime(2025, 12, 26, 7, 40))
+        self.assertEqual(sorted(p[0] for p in due), ['also_weekday', 'weekday'])
+    
+    def test_next_start_follows_days(self):
+        """Test the next start skips days a program is not scheduled on"""
+        start, due = next_start(self.PROGRAMS, datetime.datetime(2025, 12, 26, 23, 58))
+        # Saturday morning: only the weekend program
+        self.assertEqual(start, datetime.datetime(2025, 12, 27, 7, 40))
+        self.assertEqual([p[0] for p in due], ['weekend'])
+        
+        # Strictly after: the start just launched is not due again
+        start, due = next_start(self.PROGRAMS, datetime.datetime(2025, 12, 26, 7, 40))
+        self.assertEqual(start, datetime.datetime(2025, 12, 26, 23, 58))
+    
+    def test_next_start_nothing_scheduled(self):
+        """Test programs with no valid day are never due"""
+        programs = {'never': dict(self.PROGRAMS['weekday'], days='NODAY')}
+        self.assertEqual(next_start(programs, self.FRIDAY), (None, []))
+    
+    def test_in_progress_remaining_duration(self):
+        """Test a restarted daemon records the rest of shows started within 5 minutes"""
+        recordings = in_progress(self.PROGRAMS, datetime.datetime(2025, 12, 26, 7, 43, 30))
+        self.assertEqual(sorted(recordings), [
+            (390, '0740', 'url4', 'also_weekday'),
+            (990, '0740', 'url1', 'weekday'),
+        ])
+        # Past midnight for a show started the day before
+        self.assertEqual(in_progress(self.PROGRAMS, datetime.datetime(2025, 12, 27, 0, 1)),
+                         [(540, '2358', 'url3', 'late')])
+        self.assertEqual(in_progress(self.PROGRAMS, datetime.datetime(2025, 12, 26, 7, 50)), [])
+    
+    @patch('record.signal.signal')
+    @patch('record.in_progress', return_value=[])
+    @patch('record.start_recordings')
+    @patch('record.parse_programs_config')
+    def test_daemon_starts_due_programs(self, mock_config, mock_start, mock_in_progress, mock_signal):
+        """Test the daemon starts due programs with their full duration and stops on request"""
+        mock_config.return_value = self.PROGRAMS
+        due = [('weekday', self.PROGRAMS['weekday'], self.PROGRAMS['weekday']['schedule'][0])]
+        starts = [datetime.datetime.now() - datetime.timedelta(seconds=1), datetime.datetime.now() + datetime.timedelta(hours=1)]
+        
+        def fake_next_start(programs, after):
+            start = starts.pop(0)
+            if not starts:
+                # Stop while waiting for the second start
+                record._stop.set()
+            return start, due
+        
+        with patch('record._stop', threading.Event()), patch('record.next_start', side_effect=fake_next_start):
+            run_daemon()
+        mock_start.assert_called_once_with([(1200, '0740', 'url1', 'weekday')])
+        mock_config.assert_called_once_with(today_only=False)
+
+
+class TestFinalizeRecording(unittest.TestCase):
+    """Test post-recording processing (finalize_recording)"""
+    
+    PROBE = {
+        'format': {'duration': '1200.021', 'bit_rate': '128000'},
+        'streams': [{'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '48000', 'channels': 2}],
+    }
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.output = self.tmp / '20251222-0740-aaaaaaaa.m4a'
+        self.raw = self.tmp / f'.{self.output.name}.part'
+        self.raw.write_bytes(b'raw audio')
+        self.started = datetime.datetime(2025, 12, 22, 7, 40, 2, tzinfo=datetime.timezone(datetime.timedelta(hours=9)))
+        self.ended = self.started + datetime.timedelta(minutes=20)
+    
+    def _remux(self, source, target):
+        target.write_bytes(b'faststart audio')
+    
+    @patch('record.ffmpeg.probe')
+    def test_remux_and_sidecar(self, mock_probe):
+        """Test the remuxed file replaces the recording, with its metadata written alongside"""
+        mock_probe.return_value = self.PROBE
+        with patch('record.remux_faststart', side_effect=self._remux):
+            finalize_recording(self.raw, self.output, 'program1', self.started, self.ended)
+        
+        self.assertEqual(self.output.read_bytes(), b'faststart audio')
+        metadata = json.loads(sidecar_path(self.output).read_text())
+        self.assertEqual(metadata, {
+            'duration': 1200.021, 'bitrate': 128000, 'codec': 'aac', 'sample_rate': 48000, 'channels': 2,
+            'program_id': 'program1', 'started': '2025-12-22T07:40:02+09:00', 'ended': '2025-12-22T08:00:02+09:00',
+            'size': len(b'faststart audio'), 'faststart': True,
+        })
+        # Temporary files are gone, nothing else is left behind
+        self.assertEqual(sorted(p.name for p in self.tmp.iterdir()),
+                         ['20251222-0740-aaaaaaaa.json', '20251222-0740-aaaaaaaa.m4a'])
+    
+    @patch('record.ffmpeg.probe')
+    def test_failed_remux_keeps_recording(self, mock_probe):
+        """Test a failed remux keeps the original recording and still describes it"""
+        mock_probe.return_value = self.PROBE
+        with patch('record.remux_faststart', side_effect=OSError('disk full')):
+            finalize_recording(self.raw, self.output, 'program1', self.started, self.ended)
+        
+        self.assertEqual(self.output.read_bytes(), b'raw audio')
+        metadata = json.loads(sidecar_path(self.output).read_text())
+        self.assertFalse(metadata['faststart'])
+        self.assertEqual(metadata['size'], len(b'raw audio'))
+    
+    @patch('record.ffmpeg.probe')
+    def test_unverified_recording_without_sidecar(self, mock_probe):
+        """Test a recording ffprobe finds no audio in is kept without metadata"""
+        mock_probe.return_value = {'format': {}, 'streams': []}
+        with patch('record.remux_faststart', side_effect=self._remux):
+            finalize_recording(self.raw, self.output, None, self.started, self.ended)
+        
+        self.assertEqual(self.output.read_bytes(), b'raw audio')
+        self.assertFalse(sidecar_path(self.output).exists())
+        self.assertFalse(self.raw.exists())
+
+
+class TestSegmentedRecording(unittest.TestCase):
+    """Test segmented recording with reconnects (record_segments, execute_recording)"""
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.prefix = self.tmp / '.20251222-0740-aaaaaaaa'
+        # Fake clock: capture runs and backoff waits advance it instead of waiting
+        self.clock = 1000.0
+        self.stop = threading.Event()
+        self.stop.wait = self._sleep
+        for patcher in (patch('record.time.monotonic', lambda: self.clock), patch('record._stop', self.stop)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleeps = []
+    
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.clock += seconds
+    
+    def _capture(self, runs, backlog=0):
+        """
+        Return a capture_segments stand-in; each run is (media seconds, segment count, fails[, stops]).
+        
+        The stream's first backlog seconds arrive at once, so a run takes that
+        much less wall-clock time than the media it writes.
+        """
+        runs = iter(runs)
+        def capture(url, seconds, pattern, segment_list):
+            run_seconds, count, fails, *stops = next(runs)
+            run_seconds = min(run_seconds, seconds)
+            # Segment list as written by ffmpeg: name,start,end in media seconds
+            lines = []
+            for i in range(count):
+                Path(pattern % i).write_bytes(b'ts')
+                lines.append(f"{Path(pattern % i).name},{run_seconds * i / count:.6f},{run_seconds * (i + 1) / count:.6f}\n")
+            Path(segment_list).write_text(''.join(lines))
+            self.clock += max(0, run_seconds - backlog)
+            if stops:
+                # SIGTERM arrived: request_stop() ended this run
+                self.stop.set()
+            if fails:
+                raise record.ffmpeg.Error('ffmpeg', b'', b'Connection reset by peer')
+        return capture
+    
+    def test_uninterrupted_recording(self):
+        """Test a stream that never fails is captured in one run without gaps"""
+        with patch('record.capture_segments', side_effect=self._capture([(1200, 4, False)])):
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual([p.name for p in segments], [f'.20251222-0740-aaaaaaaa.01-{i:04d}.ts' for i in range(4)])
+        self.assertEqual(gaps, [])
+        self.assertEqual(self.sleeps, [])
+    
+    def test_backlog_not_mistaken_for_drop(self):
+        """Test a capture that reached its media time ends the recording before the wall clock does"""
+        with patch('record.capture_segments', side_effect=self._capture([(1200, 4, False)], backlog=30)) as mock_capture:
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual(mock_capture.call_count, 1)
+        self.assertEqual(len(segments), 4)
+        self.assertEqual((gaps, self.sleeps), ([], []))
+        self.assertEqual(self.clock - 1000, 1170)
+    
+    def test_reconnect_after_backlog(self):
+        """Test a dropped stream still reconnects and gap offsets follow the media captured"""
+        runs = [(300, 1, True), (1200, 3, False)]
+        with patch('record.capture_segments', side_effect=self._capture(runs, backlog=30)) as mock_capture:
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual([c.args[1] for c in mock_capture.call_args_list], [1200, 928])
+        self.assertEqual(len(gaps), 1)
+        self.assertEqual((gaps[0]['offset'], gaps[0]['seconds']), (300, 2))
+    
+    def test_reconnect_with_backoff(self):
+        """Test a dropped stream is reconnected with growing delays and the gap is recorded"""
+        runs = [(300, 1, True), (0, 0, True), (0, 0, True), (1200, 3, False)]
+        with patch('record.capture_segments', side_effect=self._capture(runs)) as mock_capture:
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual(self.sleeps, [2, 4, 8])
+        # Each reconnect only asks for the time left
+        self.assertEqual([c.args[1] for c in mock_capture.call_args_list], [1200, 898, 894, 886])
+        # Segments of both successful runs, in order, without the empty ones
+        self.assertEqual([p.name[-10:] for p in segments], ['01-0000.ts', '04-0000.ts', '04-0001.ts', '04-0002.ts'])
+        self.assertEqual(len(gaps), 1)
+        self.assertEqual((gaps[0]['offset'], gaps[0]['seconds']), (300, 14))
+    
+    def test_stream_never_returns(self):
+        """Test a stream lost for good ends the recording with a trailing gap"""
+        runs = [(600, 2, True)] + [(0, 0, True)] * 100
+        with patch('record.capture_segments', side_effect=self._capture(runs)):
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(len(gaps), 1)
+        self.assertEqual((gaps[0]['offset'], gaps[0]['seconds']), (600, 600))
+        self.assertLessEqual(max(self.sleeps), record.RECONNECT_MAX_DELAY)
+        self.assertLess(self.clock - 1000, 1201)
+    
+    def test_stop_request_ends_recording_early(self):
+        """Test a stop request keeps the audio captured so far without reconnecting"""
+        runs = [(300, 1, True), (200, 2, True, True)]
+        with patch('record.capture_segments', side_effect=self._capture(runs)) as mock_capture:
+            segments, gaps = record.record_segments('http://stream', 1200, self.prefix)
+        
+        self.assertEqual(mock_capture.call_count, 2)
+        self.assertEqual([p.name[-10:] for p in segments], ['01-0000.ts', '02-0000.ts', '02-0001.ts'])
+        self.assertEqual(self.sleeps, [2])
+        self.assertEqual(len(gaps), 1)
+        
+        # Nothing is started once stopping
+        with patch('record.capture_segments') as mock_capture:
+            self.assertEqual(record.record_segments('http://stream', 1200, self.prefix), ([], []))
+        mock_capture.assert_not_called()
+    
+    def test_stop_request_ends_running_capture(self):
+        """Test request_stop() ends a running ffmpeg and a capture starting after it"""
+        def run_async(command, **kwargs):
+            # Stands in for ffmpeg recording a stream that never ends
+            return subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        errors = []
+        def capture():
+            try:
+                record.capture_segments('http://stream', 3600, f'{self.prefix}-%04d.ts', f'{self.prefix}.csv')
+            except record.ffmpeg.Error as e:
+                errors.append(e)
+        
+        with patch.object(record, 'STREAM_SHARING', False), \
+             patch.object(record.ffmpeg.nodes.OutputStream, 'run_async', run_async):
+            thread = threading.Thread(target=capture)
+            thread.start()
+            for _ in range(100):
+                if record._captures:
+                    break
+                time.sleep(0.05)
+            record.request_stop(15, None)
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+            
+            started = time.time()
+            capture()
+            self.assertLess(time.time() - started, 10)
+        
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(record._captures, set())
+    
+    def test_segments_stitched_and_removed(self):
+        """Test segments are concatenated, gaps go to the metadata and segments are removed"""
+        gaps = [{'start': 'a', 'end': 'b', 'seconds': 4.0, 'offset': 300.0}]
+        markers = []
+        
+        def record_segments(url, sec, prefix):
+            segment = Path(f'{prefix}.01-0000.ts')
+            segment.write_bytes(b'ts')
+            Path(f'{prefix}.01.csv').write_text(f'{segment.name},0.0,10.0\n')
+            # The recording is announced as live while it is captured
+            markers.extend(json.loads(p.read_text()) for p in self.tmp.glob('.live-*.json'))
+            return [segment], gaps
+        
+        with patch.object(record, 'RECORDINGS_DIR', self.tmp), \
+             patch('record.recording_directory', return_value=self.tmp), \
+             patch('record.record_segments', side_effect=record_segments), \
+             patch('record.concat_segments') as mock_concat, \
+             patch('record.finalize_recording') as mock_finalize:
+            output = record.execute_recording(1200, 'http://stream', None, 'program1')
+        
+        mock_concat.assert_called_once_with([self.tmp / f'.{output.stem}.01-0000.ts'], self.tmp / f'.{output.name}.part')
+        self.assertEqual(mock_finalize.call_args.kwargs['extra'], {'segments': 1, 'gaps': gaps})
+        # Segments, their lists and the live marker are gone
+        self.assertEqual(sorted(p.name for p in self.tmp.iterdir()), [])
+        
+        self.assertEqual(len(markers), 1)
+        self.assertEqual((markers[0]['name'], markers[0]['program_id'], markers[0]['dir']),
+                         (output.name, 'program1', '.'))
+    
+    def test_failed_concat_keeps_segments(self):
+        """Test captured segments are kept when stitching fails"""
+        segment = self.tmp / '.20251222-0740-aaaaaaaa.01-0000.ts'
+        segment.write_bytes(b'ts')
+        error = record.ffmpeg.Error('ffmpeg', b'', b'Invalid data')
+        with patch.object(record, 'RECORDINGS_DIR', self.tmp), \
+             patch('record.recording_directory', return_value=self.tmp), \
+             patch('record.record_segments', return_value=([segment], [])), \
+             patch('record.concat_segments', side_effect=error), \
+             patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                record.execute_recording(1200, 'http://stream', None, 'program1')
+        
+        self.assertTrue(segment.exists())
+
 
+class TestStreamRelay(unittest.TestCase):
+    """Test the shared upstream connection (StreamRelay, join_relay)"""
+    
+    URL = 'http://stream/live.m3u8'
+    
+    def setUp(self):
+        self.upstreams = []
+        patcher = patch('record.StreamRelay.open_upstream', lambda relay: self._open_upstream(relay))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(record._relays.clear)
+        self.script = None
+    
+    def _open_upstream(self, relay):
+        # Fake ffmpeg: MPEG-TS-like packets starting with the 0x47 sync byte, written in odd-sized pieces
+        process = subprocess.Popen([sys.executable, '-c', self.script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.upstreams.append(process)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        return process
+    
+    def _packets(self, count, delay=0.0, wait=0.2):
+        self.script = (
+            "import sys, time\n"
+            f"time.sleep({wait})\n"
+            f"data = b''.join(b'G' + bytes([i % 256]) * 187 for i in range({count}))\n"
+            "for i in range(0, len(data), 100):\n"
+            "    sys.stdout.buffer.write(data[i:i + 100]); sys.stdout.buffer.flush()\n"
+            f"    time.sleep({delay})\n"
+        )
+    
+    def _subscriber(self):
+        """Pipe standing in for a recording's ffmpeg stdin; returns (pipe, thread, received bytes)."""
+        read_fd, write_fd = os.pipe()
+        received = bytearray()
+        def read():
+            with os.fdopen(read_fd, 'rb') as f:
+                for chunk in iter(lambda: f.read(4096), b''):
+                    received.extend(chunk)
+        thread = threading.Thread(target=read)
+        thread.start()
+        return os.fdopen(write_fd, 'wb'), thread, received
+    
+    def test_recordings_share_one_connection(self):
+        """Test recordings of the same URL get identical data from one upstream"""
+        self._packets(500)
+        subscribers = [self._subscriber() for _ in range(2)]
+        for pipe, _, _ in subscribers:
+            record.join_relay(self.URL, pipe)
+        for _, thread, _ in subscribers:
+            thread.join(timeout=10)
+        
+        self.assertEqual(len(self.upstreams), 1)
+        first, second = (received for _, _, received in subscribers)
+        self.assertEqual(len(first), 500 * 188)
+        self.assertEqual(first, second)
+        # The upstream ended, so did the relay
+        self.assertEqual(record._relays, {})
+    
+    def test_late_subscriber_starts_at_packet_boundary(self):
+        """Test a recording joining mid-stream receives whole packets"""
+        self._packets(500, delay=0.001, wait=0)
+        first = self._subscriber()
+        record.join_relay(self.URL, first[0])
+        time.sleep(0.2)
+        second = self._subscriber()
+        record.join_relay(self.URL, second[0])
+        for _, thread, _ in (first, second):
+            thread.join(timeout=10)
+        
+        late = bytes(second[2])
+        self.assertGreater(len(late), 0)
+        self.assertLess(len(late), len(first[2]))
+        self.assertEqual(len(late) % 188, 0)
+        self.assertEqual(late[::188], b'G' * (len(late) // 188))
+        self.assertTrue(bytes(first[2]).endswith(late))
+    
+    def test_last_recording_stops_upstream(self):
+        """Test the upstream is closed when no recording needs it, and reopened for the next"""
+        self._packets(10 ** 6, delay=0.001, wait=0)
+        pipe, thread, _ = self._subscriber()
+        relay = record.join_relay(self.URL, pipe)
+        time.sleep(0.1)
+        relay.leave(pipe)
+        thread.join(timeout=10)
+        
+        self.assertFalse(thread.is_alive())
+        self.upstreams[0].wait(timeout=10)
+        self.assertEqual(record._relays, {})
+        
+        pipe, thread, _ = self._subscriber()
+        self.assertIsNot(record.join_relay(self.URL, pipe), relay)
+        self.assertEqual(len(self.upstreams), 2)
+        record._relays[self.URL].leave(pipe)
+        thread.join(timeout=10)
+    
+    def test_capture_reads_from_relay(self):
+        """Test a shared capture feeds ffmpeg from the relay instead of opening the URL"""
+        self._packets(50)
+        commands = []
+        
+        def run_async(command, **kwargs):
+            commands.append(command.get_args())
+            # Stands in for ffmpeg: reads its input until the relay closes it
+            return subprocess.Popen([sys.executable, '-c', 'import sys; sys.stdin.buffer.read()'],
+                                    stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        with patch.object(record, 'STREAM_SHARING', True), \
+             patch.object(record.ffmpeg.nodes.OutputStream, 'run_async', run_async):
+            record.capture_segments(self.URL, 60, '/tmp/seg-%04d.ts', '/tmp/seg.csv')
+        
+        self.assertEqual(commands[0][:6], ['-f', 'mpegts', '-t', '60', '-i', 'pipe:'])
+        self.assertNotIn(self.URL, commands[0])
+        self.assertEqual(len(self.upstreams), 1)
+        self.assertEqual(record._relays, {})
+
+
+class TestRetention(unittest.TestCase):
+    """Test retention policies and quota (enforce_retention)"""
+    
+    NOW = datetime.datetime(2025, 12, 31, 12, 0)
+    
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        patcher = patch('record.RECORDINGS_DIR', self.tmp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _record(self, date_str, start, size=100, directory=None, age=86400):
+        directory = directory or self.tmp
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{date_str}-{start}-{date_str[-2:]}{start}.m4a"
+        path.write_bytes(b'\0' * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+    
+    def _expired(self, quota=None):
+        policies, _ = parse_retention_config()
+        return [e[0]['path'].name for e in select_expired(list_recordings(), policies, quota, now=self.NOW)]
+    
+    def test_parse_size(self):
+        """Test quota sizes with and without units"""
+        self.assertEqual(parse_size('1024'), 1024)
+        self.assertEqual(parse_size('500M'), 500 * 1024 ** 2)
+        self.assertEqual(parse_size('50G'), 50 * 1024 ** 3)
+        self.assertEqual(parse_size('1.5gb'), int(1.5 * 1024 ** 3))
+    
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|MON-FRI|morning|Morning Show',
+        'PROGRAM1_KEEP': '2',
+        'PROGRAM2': '20:00-20:20|SAT|evening|Evening Show',
+        'PROGRAM2_KEEP_DAYS': 'soon',
+    }, clear=True)
+    @patch('record.RECORDINGS_QUOTA', '')
+    def test_parse_retention_config(self):
+        """Test policies are read for every program, not just today's"""
+        policies, quota = parse_retention_config()
+        self.assertEqual(policies['morning'], {'start': '0740', 'days': 'MON-FRI', 'keep': 2, 'keep_days': None})
+        self.assertEqual(policies['evening'], {'start': '2000', 'days': 'SAT', 'keep': None, 'keep_days': None})
+        self.assertIsNone(quota)
+    
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show',
+        'PROGRAM1_KEEP': '2',
+        'PROGRAM2': '20:00-20:20|ALL|evening|Evening Show',
+    }, clear=True)
+    def test_keep_episodes(self):
+        """Test only the newest N episodes of a program are kept"""
+        for day in ('20251227', '20251228', '20251229', '20251230'):
+            self._record(day, '0740')
+            self._record(day, '2000')
+        self.assertEqual(self._expired(), ['20251227-0740-270740.m4a', '20251228-0740-280740.m4a'])
+    
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|ALL|a|Program A',
+        'PROGRAM1_KEEP': '2',
+        'PROGRAM2': '07:43-08:00|ALL|b|Program B',
+    }, clear=True)
+    def test_overlapping_programs(self):
+        """Test recordings go to the program with the nearest start, not the first within tolerance"""
+        for day in ('20251228', '20251229', '20251230'):
+            self._record(day, '0740')
+            self._record(day, '0743')
+        # Only a's oldest episode; b has no policy
+        self.assertEqual(self._expired(), ['20251228-0740-280740.m4a'])
+    
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|MON-FRI|weekday|Weekday Show',
+        'PROGRAM1_KEEP': '1',
+        'PROGRAM2': '07:40-09:00|SAT,SUN|weekend|Weekend Show',
+        'PROGRAM2_KEEP': '2',
+    }, clear=True)
+    def test_weekday_and_weekend_programs(self):
+        """Test programs at the same time on different days each apply their own policy"""
+        # Friday to Tuesday
+        for day in ('20251226', '20251227', '20251228', '20251229', '20251230'):
+            self._record(day, '0740')
+        self.assertEqual(self._expired(), ['20251226-0740-260740.m4a', '20251229-0740-290740.m4a'])
+    
+    @patch.dict(os.environ, {
+        'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show',
+        'PROGRAM1_KEEP_DAYS': '3',
+    }, clear=True)
+    def test_keep_days(self):
+        """Test episodes older than N days are expired, including sharded ones"""
+        self._record('20251128', '0741', directory=self.tmp / '2025' / '11')
+        self._record('20251229', '0740')
+        self._record('20251230', '0740')
+        self.assertEqual(self._expired(), ['20251128-0741-280741.m4a'])
+    
+    @patch.dict(os.environ, {'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show'}, clear=True)
+    def test_quota_oldest_first(self):
+        """Test the oldest recordings of any program go first until the quota fits"""
+        self._record('20251228', '0740', size=100)
+        self._record('20251229', '1200', size=100)
+        self._record('20251230', '0740', size=100)
+        self.assertEqual(self._expired(quota=150), ['20251228-0740-280740.m4a', '20251229-1200-291200.m4a'])
+        self.assertEqual(self._expired(quota=300), [])
+    
+    @patch.dict(os.environ, {'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show', 'PROGRAM1_KEEP': '1'}, clear=True)
+    def test_recent_files_kept(self):
+        """Test files still being written are never deleted"""
+        self._record('20251230', '0740')
+        self._record('20251231', '0740', age=10)
+        self.assertEqual(self._expired(quota=0), ['20251230-0740-300740.m4a'])
+    
+    @patch.dict(os.environ, {'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show', 'PROGRAM1_KEEP': '1'}, clear=True)
+    def test_enforce_deletes_and_removes_empty_shards(self):
+        """Test files are deleted, empty shards removed and other files left alone"""
+        old = self._record('20251130', '0740', directory=self.tmp / '2025' / '11')
+        new = self._record('20251230', '0740')
+        (self.tmp / 'notes.m4a').write_bytes(b'x')
+        
+        self.assertEqual(enforce_retention(dry_run=True), [old])
+        self.assertTrue(old.exists())
+        
+        sidecar_path(old).write_text('{}')
+        self.assertEqual(enforce_retention(), [old])
+        self.assertFalse(old.exists())
+        self.assertFalse(sidecar_path(old).exists())
+        self.assertTrue(new.exists())
+        self.assertTrue((self.tmp / 'notes.m4a').exists())
+        self.assertFalse((self.tmp / '2025').exists())
+    
+    @patch.dict(os.environ, {'PROGRAM1': '07:40-08:00|ALL|morning|Morning Show'}, clear=True)
+    @patch('record.RECORDINGS_QUOTA', '')
+    def test_no_policies(self):
+        """Test nothing is deleted without policies"""
+        self._record('20200101', '0740')
+        self.assertEqual(enforce_retention(), [])
 
 if __name__ == '__main__':
     unittest.main()